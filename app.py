@@ -1,57 +1,81 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-import yaml
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 import os
-import json
 import threading
 import time
-from stock_check import check_stock, load_stock_history, load_webhook_logs, send_discord_webhook
-import subprocess
-import signal
+from stock_check import (check_stock, load_stock_history, load_webhook_logs, queue_discord_webhook, lookup_product,
+                         product_metadata, configure_services)
+import debug_capture
+import events
+import metrics
+from snapshot import load_snapshot, update_product, product_entry, snapshot_age
+from check_result import CheckResult
+from timeseries import get_timeseries_store, DEFAULT_POINTS
+from config_service import CONFIG_FILE, load_config, save_config, on_save, config_key
+from checker_service import CheckerRunner, CheckerUnavailable, send_command, read_state, state_is_fresh
 
 app = Flask(__name__)
 app.secret_key = 'cex-stock-checker-secret-key'
 
-CONFIG_FILE = 'config/checker.yaml'
-STOCK_HISTORY_FILE = 'stock_history.json'
-WEBHOOK_LOGS_FILE = 'webhook_logs.json'
+# Set by run.py when a supervised checker service runs next to the Gunicorn workers.
+# Without it (e.g. `python app.py`) the checker runs as a thread in this process.
+USE_CHECKER_SERVICE = os.environ.get('CHECKER_SERVICE') == '1'
+local_checker = CheckerRunner()
 
-# Global variables to control the stock checker thread
-stock_checker_thread = None
-stock_checker_running = False
-next_check_time = None
+_applied_config_key = object()
+_applied_config_lock = threading.Lock()
 
-def load_config():
-    """Load configuration from YAML file"""
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r') as f:
-            return yaml.safe_load(f)
-    return {
-        'items': [],
-        'request_delay': 1800,
-        'discord_enabled': True,
-        'notification_mode': 'all_checks',
-        'store_ids': [],
-        'discord': {
-            'webhook_url': ''
-        }
-    }
+def apply_config():
+    """Configure this worker's HTTP session, debug capture and metadata cache like the checker's,
+    whenever the config file changed (saved by any worker, or edited by hand)"""
+    global _applied_config_key
+    key = config_key()
+    with _applied_config_lock:
+        if key == _applied_config_key:
+            return
+        configure_services(load_config())
+        _applied_config_key = key
 
-def save_config(config):
-    """Save configuration to YAML file"""
-    os.makedirs('config', exist_ok=True)
-    with open(CONFIG_FILE, 'w') as f:
-        yaml.dump(config, f, default_flow_style=False)
+apply_config()
+
+@app.before_request
+def refresh_config():
+    apply_config()
+
+def checker_status():
+    """Status of the checker, as seen by any worker"""
+    if USE_CHECKER_SERVICE:
+        state = read_state()
+        if not state_is_fresh(state):
+            return {'running': False, 'next_check_time': None, 'service_alive': False}
+        return dict(state, service_alive=True)
+    return local_checker.status()
+
+def control_checker(command):
+    """Send 'start' or 'stop' to the checker service (or the in-process checker); returns True if it acted"""
+    if USE_CHECKER_SERVICE:
+        return send_command(command).get('ok', False)
+    return local_checker.start() if command == 'start' else local_checker.stop()
+
+@on_save
+def notify_checker():
+    """Have the running checker pick up a saved config before its next cycle"""
+    apply_config()
+    if USE_CHECKER_SERVICE:
+        try:
+            send_command('reload')
+        except CheckerUnavailable as e:
+            print(f"[FLASK] Checker service not notified of config change: {e}")
+    else:
+        local_checker.reload()
 
 def get_product_info(product_id):
-    """Get product information using the existing stock check function"""
+    """Get live product information using the existing stock check function"""
     try:
         in_stock, product_info, stock_history = check_stock(product_id)
-        return {
-            'id': product_id,
-            'name': product_info.get('boxName', 'Unknown Product'),
-            'in_stock': in_stock,
-            'stock_history': stock_history
-        }
+        entry = product_entry(CheckResult.from_product_info(dict(product_info, boxId=product_id), in_stock,
+                                                            time.strftime('%Y-%m-%d %H:%M:%S'), stock_history))
+        update_product(entry)
+        return entry
     except Exception as e:
         return {
             'id': product_id,
@@ -60,30 +84,57 @@ def get_product_info(product_id):
             'error': str(e)
         }
 
+def get_snapshot_product_info(product_id, snapshot, fetch_metadata=False):
+    """Get product information from the last published status snapshot.
+    
+    Products the checker has not reached yet get their name and price from
+    the metadata cache (fetched on a miss if fetch_metadata is set).
+    """
+    info = snapshot.get('products', {}).get(product_id)
+    if info:
+        return info
+    if fetch_metadata:
+        metadata, _ = lookup_product(product_id)
+    else:
+        metadata = product_metadata.get(product_id)
+    return {
+        'id': product_id,
+        'name': metadata.get('boxName', 'Not checked yet') if metadata else 'Not checked yet',
+        'in_stock': False,
+        'price': metadata.get('sellPrice') if metadata else None,
+        'pending': True
+    }
+
 @app.route('/')
 def index():
     """Main dashboard page"""
     config = load_config()
     items = config.get('items', [])
     
-    # Get product information for each item
-    product_info = []
-    for item_id in items:
-        info = get_product_info(item_id)
-        product_info.append(info)
+    # Serve the last published snapshot; only hit CEX when a refresh is explicitly requested
+    if request.args.get('refresh'):
+        for item_id in items:
+            get_product_info(item_id)
+    snapshot = load_snapshot()
+    
+    product_info = [get_snapshot_product_info(item_id, snapshot) for item_id in items]
+    
+    status = checker_status()
     
     return render_template('index.html', 
                          products=product_info,
                          config=config,
-                         checker_running=stock_checker_running,
-                         next_check_time=next_check_time)
+                         checker_running=status['running'],
+                         next_check_time=status['next_check_time'],
+                         next_check_at=status.get('next_check_at'),
+                         snapshot_age=snapshot_age(snapshot))
 
 @app.route('/settings')
 def settings():
     """Settings page"""
     config = load_config()
-    webhook_logs = load_webhook_logs()
-    return render_template('settings.html', config=config, webhook_logs=webhook_logs[:20])  # Show last 20 logs
+    webhook_logs = load_webhook_logs(20)  # Show last 20 logs
+    return render_template('settings.html', config=config, webhook_logs=webhook_logs)
 
 @app.route('/add_item', methods=['POST'])
 def add_item():
@@ -97,13 +148,22 @@ def add_item():
     config = load_config()
     items = config.get('items', [])
     
-    if product_id not in items:
-        items.append(product_id)
-        config['items'] = items
-        save_config(config)
-        flash(f'Added product {product_id} to monitoring list', 'success')
-    else:
+    if product_id in items:
         flash(f'Product {product_id} is already being monitored', 'warning')
+        return redirect(url_for('index'))
+    
+    metadata, api_failed = lookup_product(product_id, need_prices=False)
+    if metadata is None and not api_failed:
+        flash(f'Product {product_id} was not found on CeX', 'error')
+        return redirect(url_for('index'))
+    
+    items.append(product_id)
+    config['items'] = items
+    save_config(config)
+    if metadata:
+        flash(f'Added {metadata.get("boxName", product_id)} ({product_id}) to monitoring list', 'success')
+    else:
+        flash(f'Added product {product_id} to monitoring list (could not verify it with CeX right now)', 'warning')
     
     return redirect(url_for('index'))
 
@@ -150,52 +210,98 @@ def update_settings():
 
 @app.route('/api/product_info/<product_id>')
 def api_product_info(product_id):
-    """API endpoint to get product information"""
-    info = get_product_info(product_id)
-    return jsonify(info)
+    """API endpoint to get product information (pass ?refresh=1 for a live check)"""
+    if request.args.get('refresh'):
+        info = get_product_info(product_id)
+    snapshot = load_snapshot()
+    if not request.args.get('refresh'):
+        info = get_snapshot_product_info(product_id, snapshot, fetch_metadata=True)
+    return jsonify(dict(info, snapshot_age=snapshot_age(snapshot)))
+
+@app.route('/api/store_availability')
+def api_store_availability():
+    """API endpoint to get the items x stores availability matrix from the last cycle"""
+    snapshot = load_snapshot()
+    return jsonify(dict(snapshot.get('store_matrix') or {'stores': {}, 'items': {}},
+                        snapshot_age=snapshot_age(snapshot)))
 
 @app.route('/api/stock_history')
 def api_stock_history():
-    """API endpoint to get stock history"""
-    history = load_stock_history()
+    """API endpoint to get stock history (optionally for one ?product_id=)"""
+    history = load_stock_history(request.args.get('product_id'))
     return jsonify(history)
 
+@app.route('/api/price_history/<product_id>')
+def api_price_history(product_id):
+    """API endpoint to get a product's price and availability history.
+    
+    ?from= and ?to= limit the range (epoch seconds), ?store= picks a store's
+    series instead of the online one, and ?points= caps how many points come
+    back (longer ranges are downsampled into that many time buckets).
+    """
+    start = request.args.get('from', type=float)
+    end = request.args.get('to', type=float)
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+    store_id = request.args.get('store') or None
+    series = get_timeseries_store()
+    history = series.query(product_id, store_id, start, end, points)
+    return jsonify(dict(history, product_id=product_id, store_id=store_id, stores=series.stores(product_id),
+                        **{'from': start, 'to': end}))
+
+@app.route('/api/metadata_cache')
+def api_metadata_cache():
+    """API endpoint to get this worker's product metadata cache statistics"""
+    return jsonify(product_metadata.stats())
+
 @app.route('/api/webhook_logs')
 def api_webhook_logs():
     """API endpoint to get webhook logs"""
-    logs = load_webhook_logs()
-    return jsonify(logs[:50])  # Return last 50 logs
+    logs = load_webhook_logs(50)  # Return last 50 logs
+    return jsonify(logs)
+
+@app.route('/api/debug_capture/<product_id>', methods=['POST'])
+def api_debug_capture(product_id):
+    """API endpoint to capture the next N raw responses for a product"""
+    count = request.values.get('count', 1, type=int)
+    pending = debug_capture.request_capture(product_id, count)
+    return jsonify({'product_id': product_id, 'pending_captures': pending})
 
 @app.route('/api/next_check_time')
 def api_next_check_time():
     """API endpoint to get next check time"""
-    global next_check_time
-    return jsonify({'next_check_time': next_check_time})
+    return jsonify({'next_check_time': checker_status()['next_check_time']})
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events stream of checker state, cycle progress, status changes and webhook logs"""
+    status = checker_status()
+    initial = [('checker', {'running': status['running'],
+                            'next_check_at': status.get('next_check_at'),
+                            'next_check_time': status['next_check_time']})]
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(stream_with_context(events.stream(initial, last_event_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics summed over every worker and the checker process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/checker_status')
 def api_checker_status():
     """API endpoint to get detailed checker status"""
-    global stock_checker_thread, stock_checker_running, next_check_time
-    
-    thread_alive = stock_checker_thread.is_alive() if stock_checker_thread else False
-    thread_name = stock_checker_thread.name if stock_checker_thread else None
-    
-    return jsonify({
-        'running': stock_checker_running,
-        'thread_alive': thread_alive,
-        'thread_name': thread_name,
-        'next_check_time': next_check_time,
-        'active_threads': threading.active_count()
-    })
+    return jsonify(dict(checker_status(),
+                        mode='service' if USE_CHECKER_SERVICE else 'thread',
+                        active_threads=threading.active_count()))
 
 @app.route('/start_checker')
 def start_checker():
     """Start the stock checker in background"""
-    global stock_checker_thread, stock_checker_running
-    
-    print(f"[FLASK] Start checker requested. Current status: running={stock_checker_running}")
+    running = checker_status()['running']
+    print(f"[FLASK] Start checker requested. Current status: running={running}")
     
-    if stock_checker_running:
+    if running:
         flash('Stock checker is already running', 'warning')
         return redirect(url_for('index'))
     
@@ -209,18 +315,21 @@ def start_checker():
         flash('Please add at least one product to monitor before starting', 'error')
         return redirect(url_for('index'))
     
-    # Clean up any existing thread
-    if stock_checker_thread and stock_checker_thread.is_alive():
-        print(f"[FLASK] Waiting for existing thread to finish...")
-        stock_checker_running = False
-        stock_checker_thread.join(timeout=5)
+    try:
+        started = control_checker('start')
+    except CheckerUnavailable as e:
+        print(f"[FLASK] Checker service unavailable: {e}")
+        flash('Checker service is not available, try again shortly', 'error')
+        return redirect(url_for('index'))
     
-    # Start new thread
-    stock_checker_running = True
-    stock_checker_thread = threading.Thread(target=run_stock_checker, daemon=True, name="StockChecker")
-    stock_checker_thread.start()
+    if not started:
+        if checker_status().get('stopping'):
+            flash('Stock checker is still finishing its last check, try again shortly', 'warning')
+        else:
+            flash('Stock checker is already running', 'warning')
+        return redirect(url_for('index'))
     
-    print(f"[FLASK] Stock checker thread started: {stock_checker_thread.name}")
+    print(f"[FLASK] Stock checker started")
     flash('Stock checker started', 'success')
     
     # Send start notification
@@ -228,130 +337,34 @@ def start_checker():
     delay = config.get('request_delay', 1800)
     startup_message = f"Checking {items_count} item(s) every {delay} seconds via Web UI"
     try:
-        send_discord_webhook(config, "start", custom_message=startup_message)
-        print(f"[FLASK] Start notification sent")
+        queue_discord_webhook(config, "start", custom_message=startup_message)
+        print(f"[FLASK] Start notification queued")
     except Exception as e:
-        print(f"[FLASK] Failed to send start notification: {e}")
+        print(f"[FLASK] Failed to queue start notification: {e}")
     
     return redirect(url_for('index'))
 
 @app.route('/stop_checker')
 def stop_checker():
     """Stop the stock checker"""
-    global stock_checker_running
+    try:
+        stopped = control_checker('stop')
+    except CheckerUnavailable as e:
+        print(f"[FLASK] Checker service unavailable: {e}")
+        flash('Checker service is not available, try again shortly', 'error')
+        return redirect(url_for('index'))
     
-    if stock_checker_running:
-        stock_checker_running = False
+    if stopped:
         flash('Stock checker stopped', 'success')
         
         # Send stop notification
         config = load_config()
-        send_discord_webhook(config, "stop", custom_message="Stock checker stopped via Web UI")
+        queue_discord_webhook(config, "stop", custom_message="Stock checker stopped via Web UI")
     else:
         flash('Stock checker is not running', 'warning')
     
     return redirect(url_for('index'))
 
-def run_stock_checker():
-    """Run the stock checker in a separate thread"""
-    global stock_checker_running, next_check_time
-    
-    print("[THREAD] Stock checker thread starting...")
-    
-    try:
-        # Import functions needed for stock checking
-        from stock_check import should_send_notification, send_discord_webhook
-        print("[THREAD] Successfully imported stock_check functions")
-        
-        config = load_config()
-        items = config.get('items', [])
-        delay = config.get('request_delay', 1800)
-        
-        print(f"[THREAD] Loaded config: {len(items)} items, {delay}s delay")
-        
-        if not items:
-            print("[THREAD] No items to check, stopping thread")
-            stock_checker_running = False
-            return
-        
-        check_count = 0
-        print(f"[THREAD] Starting stock checking loop...")
-        
-        while stock_checker_running:
-            try:
-                check_count += 1
-                current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-                print(f"\n[THREAD] Starting web UI check #{check_count} at {current_time}")
-                
-                # Initialize check summary
-                check_summary = []
-                in_stock_count = 0
-                
-                # Check each item
-                for item_id in items:
-                    if not stock_checker_running:
-                        break
-                    
-                    try:
-                        print(f"[THREAD] Checking item: {item_id}")
-                        in_stock, product_info, stock_history = check_stock(item_id)
-                        status = "IN STOCK" if in_stock else "OUT OF STOCK"
-                        print(f"[THREAD] Product {item_id}: {status}")
-                        
-                        if in_stock:
-                            in_stock_count += 1
-                        
-                        check_summary.append((product_info, status, current_time, stock_history))
-                        time.sleep(2)  # Small delay between checks
-                    except Exception as e:
-                        print(f"[THREAD] Error checking {item_id}: {e}")
-                        import traceback
-                        traceback.print_exc()
-                
-                # Calculate next check time
-                next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + delay))
-                
-                # Send Discord notification based on configuration
-                in_stock_items = [item for item in check_summary if item[1] == "IN STOCK"]
-                summary_message = f"Check #{check_count} completed at {current_time}\nNext check: {next_check_time}"
-                
-                print(f"[THREAD] Sending notification for {len(check_summary)} items")
-                
-                if should_send_notification(config, "check_result", in_stock_items):
-                    send_discord_webhook(config, "check_result", product_summaries=check_summary, custom_message=summary_message)
-                    print(f"[THREAD] Discord notification sent")
-                else:
-                    print(f"[THREAD] Notification skipped based on configuration")
-                
-                print(f"[THREAD] Check completed at {current_time}")
-                print(f"[THREAD] Next check in {delay} seconds ({next_check_time})")
-                
-                # Wait for next check with status updates
-                for i in range(delay):
-                    if not stock_checker_running:
-                        print(f"[THREAD] Stop signal received during sleep")
-                        break
-                    if i % 60 == 0:  # Log every minute
-                        remaining = delay - i
-                        print(f"[THREAD] Next check in {remaining} seconds...")
-                    time.sleep(1)
-                    
-            except Exception as inner_e:
-                print(f"[THREAD] Error in check loop: {inner_e}")
-                import traceback
-                traceback.print_exc()
-                # Continue the loop after error
-                time.sleep(30)  # Wait 30 seconds before retrying
-        
-    except Exception as e:
-        print(f"[THREAD] Fatal stock checker error: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print(f"[THREAD] Stock checker thread ending...")
-        stock_checker_running = False
-        next_check_time = None
-
 if __name__ == '__main__':
     # Ensure config directory exists
     os.makedirs('config', exist_ok=True)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for check(), the web UI checker loop and the Flask dashboard
+
+Everything runs against the local stub server (stub_cex.py), which stands in
+for uk.webuy.com, the wss2.cex.uk.webuy.io API and the Discord webhook:
+
+    python3 benchmark.py
+    python3 benchmark.py --sizes 10 100 --targets check --latency 0.05 --error-rate 0.01 --output bench.json
+    python3 benchmark.py --html
+
+--html runs only the product page parsing micro-benchmark (no stub needed):
+CPU time per page for the marker extractor against the full BeautifulSoup parse.
+
+Each (target, size) pair runs in its own process and working directory, so
+history, snapshots and peak memory never leak between runs. Results are
+written as JSON for comparing runs; a summary table goes to stderr.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TARGETS = ('check', 'runner', 'dashboard')
+DEFAULT_SIZES = (10, 100, 1000)
+DEFAULT_CYCLES = 2
+DASHBOARD_REQUESTS = 50
+WORKER_TIMEOUT = 1800
+HTML_FIXTURE = os.path.join(REPO_DIR, 'fixtures', 'cex', 'product-detail.html')
+HTML_REPEAT = 50
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def stub_stats(base_url):
+    with urlopen(f"{base_url}/__stats", timeout=5) as response:
+        return json.load(response)
+
+
+def start_stub(port, latency, error_rate, seed):
+    """Start stub_cex.py in its own process so its CPU time is not counted against the checker"""
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'stub_cex.py'), '--port', str(port),
+                                '--latency', str(latency), '--error-rate', str(error_rate), '--seed', str(seed)],
+                               stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            stub_stats(base_url)
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Stub server did not start")
+
+
+def write_config(size, args, base_url):
+    from stub_cex import synthetic_product_ids
+    config = {
+        'items': synthetic_product_ids(size),
+        'request_delay': 0,
+        # The default fixed schedule, every item due together; no interval, so cycles run back to back
+        'schedule': {'adaptive': False},
+        'concurrency': args.concurrency,
+        'check_mode': args.check_mode,
+        'rate_limit': {'requests_per_second': 0},
+        'http': {'pool_maxsize': max(10, args.concurrency)},
+        'discord_enabled': True,
+        'notification_mode': 'all_checks',
+        'discord': {'webhook_url': f"{base_url}/webhooks/benchmark"},
+        'store_ids': [],
+        'store_availability': {'enabled': args.store_availability},
+    }
+    os.makedirs('config', exist_ok=True)
+    with open(os.path.join('config', 'checker.yaml'), 'w') as f:
+        yaml.dump(config, f, default_flow_style=False)
+    return config
+
+
+class CycleTimer:
+    """Wraps run_check_cycle to record how long each cycle took and how many items it covered"""
+
+    def __init__(self, run_check_cycle):
+        self.run_check_cycle = run_check_cycle
+        self.durations = []
+        self.checks = 0
+
+    def __call__(self, items, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.run_check_cycle(items, *args, **kwargs)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+            self.checks += len(items)
+
+
+def _request_delta(before, after):
+    delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    errors = delta.pop('errors', 0)
+    webhooks = delta.get('webhook', 0)
+    return sum(delta.values()), errors, webhooks
+
+
+def run_worker(target, size, args, base_url):
+    """Run one benchmark in this process and return its result dict"""
+    os.chdir(tempfile.mkdtemp(prefix=f"cex-bench-{target}-{size}-"))
+    config = write_config(size, args, base_url)
+    sys.path.insert(0, REPO_DIR)
+
+    # Keep the per-item logging (it is part of the real cost) but off the terminal
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+
+    import stock_check
+    import checker_service
+    timer = CycleTimer(stock_check.run_check_cycle)
+    stock_check.run_check_cycle = timer  # Both check loops run their cycles through stock_check.CheckLoop
+
+    result = {'target': target, 'items': size}
+    before = stub_stats(base_url)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    if target == 'check':
+        stock_check.check(max_cycles=args.cycles)
+        stock_check.notifications.flush(60)
+    elif target == 'runner':
+        runner = checker_service.CheckerRunner(max_cycles=args.cycles)
+        runner.start()
+        runner._thread.join()
+        stock_check.notifications.flush(60)
+    else:
+        # Populate the snapshot with one cycle first; only the page views are measured
+        from check_engine import CheckEngine
+        import http_client
+        http_client.configure(config)
+        check_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        stock_check.publish_snapshot(stock_check.run_check_cycle(config['items'], config,
+                                                                 CheckEngine.from_config(config), check_time))
+        import app
+        client = app.app.test_client()
+        before = stub_stats(base_url)
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        for _ in range(DASHBOARD_REQUESTS):
+            client.get('/')
+        for item_id in config['items'][:DASHBOARD_REQUESTS]:
+            client.get(f'/api/product_info/{item_id}')
+        result['page_requests'] = DASHBOARD_REQUESTS + min(size, DASHBOARD_REQUESTS)
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    requests_made, errors, webhooks = _request_delta(before, stub_stats(base_url))
+    sys.stdout.close()
+    sys.stdout = real_stdout
+
+    result.update({
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'upstream_requests': requests_made,
+        'upstream_requests_per_second': round(requests_made / wall, 2) if wall else None,
+        'injected_errors': errors,
+        'webhook_posts': webhooks,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+    if target == 'dashboard':
+        result['page_requests_per_second'] = round(result['page_requests'] / wall, 2)
+        result['cpu_ms_per_page'] = round(cpu * 1000 / result['page_requests'], 3)
+    else:
+        checked_time = sum(timer.durations)
+        result.update({
+            'cycles': len(timer.durations),
+            'cycle_seconds': [round(d, 4) for d in timer.durations],
+            'checks': timer.checks,
+            'checks_per_second': round(timer.checks / checked_time, 2) if checked_time else None,
+            'cpu_ms_per_check': round(cpu * 1000 / timer.checks, 3) if timer.checks else None,
+        })
+    return result
+
+
+def run_all(args):
+    port = args.port or free_port()
+    stub, base_url = start_stub(port, args.latency, args.error_rate, args.seed)
+    env = dict(os.environ, CEX_WEB_URL=base_url, CEX_API_URL=base_url)
+    env.pop('CHECKER_SERVICE', None)
+    results = []
+    try:
+        for target in args.targets:
+            for size in args.sizes:
+                print(f"Running {target} with {size} item(s)...", file=sys.stderr)
+                with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+                    result_file = f.name
+                command = [sys.executable, os.path.abspath(__file__), '--worker', target, str(size),
+                           '--result-file', result_file, '--base-url', base_url,
+                           '--cycles', str(args.cycles), '--concurrency', str(args.concurrency),
+                           '--check-mode', args.check_mode]
+                if args.store_availability:
+                    command.append('--store-availability')
+                completed = subprocess.run(command, env=env, timeout=WORKER_TIMEOUT)
+                if completed.returncode != 0:
+                    results.append({'target': target, 'items': size, 'error': f"exit code {completed.returncode}"})
+                    continue
+                with open(result_file) as f:
+                    results.append(json.load(f))
+                os.remove(result_file)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+            'cycles': args.cycles,
+            'concurrency': args.concurrency,
+            'check_mode': args.check_mode,
+            'store_availability': args.store_availability,
+        },
+        'results': results,
+    }
+
+
+def full_size_page(html, in_stock=False):
+    """Pad the recorded product page to roughly the size and shape of a live one:
+    a long navigation menu, the product markup, a footer and the inline app state."""
+    if in_stock:
+        html = html.replace('<div data-testid="out-of-stock-message" class="out-of-stock">Out of stock online</div>',
+                            '<div data-testid="quantity-selector"><select><option>1</option></select></div>'
+                            '<button data-testid="add-to-basket-button" type="button">Add to basket</button>')
+    nav = "".join(f'<li class="menu-item"><a href="/category/{n}" class="menu-link"><span>Category {n}</span>'
+                  f'<img src="/icons/{n}.svg" alt=""></a></li>' for n in range(600))
+    footer = "".join(f'<div class="footer-col"><h4>Links {n}</h4><ul>' +
+                     "".join(f'<li><a href="/page/{n}/{m}">Page {m}</a></li>' for m in range(20)) +
+                     '</ul></div>' for n in range(10))
+    state = json.dumps({'products': [{'boxId': f"SAMPLE{n:06d}", 'boxName': f"Related product {n}",
+                                      'sellPrice': n % 300} for n in range(1500)]})
+    html = html.replace('<div id="__nuxt">', f'<div id="__nuxt"><header><nav><ul>{nav}</ul></nav></header>', 1)
+    return html.replace('</body>', f'<footer>{footer}</footer><script>window.__NUXT__={state}</script></body>', 1)
+
+
+def run_html_benchmark(repeat=HTML_REPEAT):
+    """CPU milliseconds per page for extract_page_markers() and the BeautifulSoup parse it replaced"""
+    from html_extract import extract_page_markers, parse_with_soup
+    with open(HTML_FIXTURE, 'r', encoding='utf-8') as f:
+        fixture = f.read()
+    pages = {
+        'fixture': fixture,
+        'full-size out of stock': full_size_page(fixture),
+        'full-size in stock': full_size_page(fixture, in_stock=True),
+    }
+    results = []
+    for name, html in pages.items():
+        assert extract_page_markers(html) == parse_with_soup(html), f"Parsers disagree on {name}"
+        result = {'page': name, 'bytes': len(html.encode('utf-8'))}
+        for parser_name, parse in (('soup', parse_with_soup), ('extract', extract_page_markers)):
+            cpu_start = time.process_time()
+            for _ in range(repeat):
+                parse(html)
+            result[f'{parser_name}_cpu_ms_per_page'] = round((time.process_time() - cpu_start) * 1000 / repeat, 3)
+        result['speedup'] = round(result['soup_cpu_ms_per_page'] / result['extract_cpu_ms_per_page'], 2) \
+            if result['extract_cpu_ms_per_page'] else None
+        results.append(result)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def print_html_summary(report):
+    print(f"{'page':<24} {'KB':>6} {'soup ms':>8} {'extract ms':>11} {'speedup':>8}", file=sys.stderr)
+    for result in report['results']:
+        print(f"{result['page']:<24} {result['bytes'] / 1024:>6.1f} {result['soup_cpu_ms_per_page']:>8.2f} "
+              f"{result['extract_cpu_ms_per_page']:>11.2f} {result['speedup'] or 0:>7.1f}x", file=sys.stderr)
+
+
+def print_summary(report):
+    print(f"{'target':<10} {'items':>6} {'wall s':>8} {'checks/s':>9} {'req/s':>8} {'cpu ms':>8} {'rss MB':>7}",
+          file=sys.stderr)
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['target']:<10} {result['items']:>6} failed: {result['error']}", file=sys.stderr)
+            continue
+        rate = result.get('checks_per_second') or result.get('page_requests_per_second')
+        cpu = result.get('cpu_ms_per_check') or result.get('cpu_ms_per_page')
+        print(f"{result['target']:<10} {result['items']:>6} {result['wall_seconds']:>8.2f} {rate or 0:>9.1f} "
+              f"{result['upstream_requests_per_second'] or 0:>8.1f} {cpu or 0:>8.2f} "
+              f"{result['max_rss_kb'] / 1024:>7.1f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stock checker against a local stub server")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--cycles', type=int, default=DEFAULT_CYCLES)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--check-mode', choices=('api', 'full'), default='api')
+    parser.add_argument('--store-availability', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the stub adds to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub responses that are 503s")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--html', action='store_true', help="Only run the product page parsing micro-benchmark")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    # Internal: run a single benchmark in this process
+    parser.add_argument('--worker', nargs=2, metavar=('TARGET', 'SIZE'), help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_result = run_worker(args.worker[0], int(args.worker[1]), args, args.base_url)
+        with open(args.result_file, 'w') as f:
+            json.dump(worker_result, f)
+        sys.exit(0)
+
+    if args.html:
+        report = run_html_benchmark()
+        print_html_summary(report)
+    else:
+        report = run_all(args)
+        print_summary(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
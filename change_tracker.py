@@ -0,0 +1,120 @@
+"""
+Conditional requests and content-hash change detection for repeated fetches
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+import http_client
+from history_store import get_history_store
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class FetchResult:
+    """Outcome of a tracked fetch; parsed is None when the request failed"""
+
+    __slots__ = ('parsed', 'unchanged', 'status_code', 'response')
+
+    def __init__(self, parsed, unchanged, status_code, response):
+        self.parsed = parsed
+        self.unchanged = unchanged
+        self.status_code = status_code
+        self.response = response
+
+
+class ChangeTracker:
+    """Remember ETag, Last-Modified and a content hash per URL, along with the parsed result.
+
+    Later fetches send If-None-Match / If-Modified-Since. A 304, or a body
+    whose hash matches the last one, returns the stored parsed result
+    without parsing again and is flagged as unchanged.
+
+    The state lives in the history store's fetch_state table, so it is
+    written in the same batched transaction as the cycle's history
+    updates; only the most recently used URLs are also kept in memory.
+    Callers should parse into just the fields they read, since that is
+    what gets stored.
+    """
+
+    def __init__(self, store=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._store = store
+        self._lock = threading.Lock()
+        self._state = OrderedDict()
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_history_store()
+        return self._store
+
+    def _get_state(self, url):
+        with self._lock:
+            state = self._state.get(url)
+            if state is not None:
+                self._state.move_to_end(url)
+                return state
+        state = self.store.get_fetch_state(url)
+        if state is not None:
+            self._remember(url, state)
+        return state
+
+    def _remember(self, url, state):
+        with self._lock:
+            self._state[url] = state
+            self._state.move_to_end(url)
+            while len(self._state) > self.max_entries:
+                self._state.popitem(last=False)
+
+    def _save_state(self, url, state):
+        self._remember(url, state)
+        self.store.save_fetch_state(url, state)
+
+    def fetch(self, url, parse, conditional=True, **kwargs):
+        """GET url conditionally and return a FetchResult, calling parse(response) only on new content.
+
+        With conditional=False no validators are sent, so the server always
+        returns the full body (for callers that need it, such as debug
+        capture); a matching content hash still skips the parse.
+        """
+        state = self._get_state(url)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if conditional and state and state['parsed'] is not None:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+
+        response = http_client.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and state:
+            return FetchResult(state['parsed'], True, 304, response)
+        if not response.ok:
+            return FetchResult(None, False, response.status_code, response)
+
+        content_hash = hashlib.sha1(response.content).hexdigest()
+        if state and state['parsed'] is not None and state['content_hash'] == content_hash:
+            return FetchResult(state['parsed'], True, response.status_code, response)
+
+        parsed = parse(response)
+        self._save_state(url, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash,
+            'parsed': parsed,
+        })
+        return FetchResult(parsed, False, response.status_code, response)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_change_tracker():
+    """Return the process-wide change tracker"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = ChangeTracker()
+        return _tracker
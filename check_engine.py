@@ -0,0 +1,51 @@
+"""
+Bounded worker pool that runs stock checks concurrently
+
+Requests are paced per host by the shared rate limiter (rate_limit.py),
+which every outbound request goes through, so the pool only bounds how
+many checks run at once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 4
+
+
+class CheckEngine:
+    """Run check jobs on a bounded thread pool"""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY):
+        self.concurrency = max(1, int(concurrency))
+
+    @classmethod
+    def from_config(cls, config):
+        """Build an engine from the 'concurrency' config key"""
+        return cls(concurrency=config.get('concurrency', DEFAULT_CONCURRENCY))
+
+    def run(self, task, jobs, should_continue=None, on_done=None):
+        """Run task(*job) for every job and return the outcomes in job order.
+
+        Each outcome is either the task's return value or the exception it
+        raised. Jobs that were skipped because should_continue() turned False
+        are reported as None. on_done(index, outcome), if given, is called
+        from the worker as each job finishes.
+        """
+        jobs = list(jobs)
+        outcomes = [None] * len(jobs)
+
+        def worker(index, job):
+            if should_continue and not should_continue():
+                return
+            try:
+                outcomes[index] = task(*job)
+            except Exception as e:
+                outcomes[index] = e
+            if on_done:
+                on_done(index, outcomes[index])
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(jobs) or 1),
+                                thread_name_prefix="CheckWorker") as pool:
+            for index, job in enumerate(jobs):
+                pool.submit(worker, index, job)
+
+        return outcomes
@@ -0,0 +1,73 @@
+"""
+Compact per-check result records passed from the check cycle to notifications, transitions and the snapshot
+"""
+
+from enum import Enum
+
+
+class StockStatus(Enum):
+    IN_STOCK = "IN STOCK"
+    OUT_OF_STOCK = "OUT OF STOCK"
+
+    def __str__(self):
+        return self.value
+
+
+class CheckResult:
+    """The fields of one check that anything downstream uses.
+
+    Built from the API's product record as soon as a check finishes, so a
+    cycle keeps a handful of fields per item instead of the whole record.
+    stock_history is None for products the API does not know.
+    """
+
+    __slots__ = ('product_id', 'name', 'status', 'checked_at', 'stock_history',
+                 'sell_price', 'cash_price', 'exchange_price', 'stores', 'store_id', 'quantity')
+
+    def __init__(self, product_id, name, status, checked_at, stock_history=None,
+                 sell_price=None, cash_price=None, exchange_price=None, stores=None, store_id=None, quantity=None):
+        self.product_id = product_id
+        self.name = name
+        self.status = status
+        self.checked_at = checked_at
+        self.stock_history = stock_history
+        self.sell_price = sell_price
+        self.cash_price = cash_price
+        self.exchange_price = exchange_price
+        self.stores = stores  # [{'storeId', 'storeName', 'quantity'}] of stores holding it, in store mode
+        self.store_id = store_id  # The store this check was for (store_ids without store availability)
+        self.quantity = quantity  # Online quantity on hand
+
+    @classmethod
+    def from_product_info(cls, product_info, in_stock, checked_at, stock_history, store_id=None):
+        """Keep only what we use from a product detail record (or the page-marker fallback)"""
+        return cls(
+            product_id=product_info.get('boxId'),
+            name=product_info.get('boxName', 'Unknown Product'),
+            status=StockStatus.IN_STOCK if in_stock else StockStatus.OUT_OF_STOCK,
+            checked_at=checked_at,
+            stock_history=stock_history,
+            sell_price=product_info.get('sellPrice'),
+            cash_price=product_info.get('cashPrice'),
+            exchange_price=product_info.get('exchangePrice'),
+            stores=product_info.get('storeAvailability'),
+            store_id=store_id,
+            quantity=product_info.get('ecomQuantityOnHand'),
+        )
+
+    def to_dict(self):
+        """Plain JSON-able form, for handing results to another process"""
+        record = {field: getattr(self, field) for field in self.__slots__}
+        record['status'] = self.status.value
+        return record
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(**dict(record, status=StockStatus(record['status'])))
+
+    @property
+    def in_stock(self):
+        return self.status is StockStatus.IN_STOCK
+
+    def __repr__(self):
+        return f"CheckResult({self.product_id!r}, {self.status.value!r})"
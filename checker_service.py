@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Single background checker process, controlled by the web workers over a local socket
+
+run.py starts one of these next to Gunicorn and restarts it if it dies.
+Web workers send it 'start', 'stop', 'status' and 'reload' commands, and
+read its state from CHECKER_STATE_FILE, so any worker reports the same
+status and only one check loop ever runs.
+"""
+
+import json
+import math
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client, AuthenticationError
+import events
+from config_service import load_config, config_key
+from notifier import EXIT_FLUSH_TIMEOUT
+from stock_check import CheckLoop, configure_services, notifications
+
+CHECKER_SOCKET = os.getenv('CHECKER_SOCKET', "checker.sock")
+CHECKER_STATE_FILE = os.getenv('CHECKER_STATE_FILE', "checker_state.json")
+CHECKER_AUTHKEY = os.getenv('CHECKER_AUTHKEY', "cex-stock-checker").encode('utf-8')
+
+HEARTBEAT_INTERVAL = 15  # Seconds between state file refreshes
+STALE_AFTER = 60         # State older than this means the service is gone
+COMMAND_TIMEOUT = 5
+STOP_WAIT = 2            # Seconds start() waits for a stopping loop to finish, within COMMAND_TIMEOUT
+
+
+class CheckerUnavailable(Exception):
+    """No checker service answered on the socket"""
+
+
+def write_state(state, path=CHECKER_STATE_FILE):
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, path)
+
+
+def read_state(path=CHECKER_STATE_FILE):
+    """Return the last state written by the checker service, or {} if there is none"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def state_is_fresh(state):
+    return bool(state) and time.time() - state.get('updated_at', 0) < STALE_AFTER
+
+
+class CheckerRunner:
+    """Owns the background check loop; at most one loop runs per runner"""
+
+    def __init__(self, state_file=None, max_cycles=None):
+        self.state_file = state_file
+        self.max_cycles = max_cycles  # Stop after this many cycles (benchmarks); None runs forever
+        self.running = False
+        self.next_check_time = None
+        self.next_check_at = None
+        self.check_count = 0
+        self.started_at = None
+        self.loop = None
+        self._thread = None
+        self._stop = threading.Event()  # Each run gets its own, so an old loop never sees a new run's start
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._wake = threading.Event()  # Cuts the wait between cycles short (stop or config reload)
+
+    def start(self):
+        """Start the loop; returns False if it is running, or still finishing a cycle after a stop"""
+        with self._lock:
+            if self.running:
+                return False
+            if self._thread and self._thread.is_alive():
+                print(f"[THREAD] Waiting for existing thread to finish...")
+                self._thread.join(timeout=STOP_WAIT)
+                if self._thread.is_alive():
+                    print(f"[THREAD] Previous loop is still stopping, not starting another")
+                    return False
+            self.running = True
+            self.check_count = 0
+            self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True, name="StockChecker")
+            self._thread.start()
+        self.publish_state()
+        events.publish_checker_state(True, None)
+        return True
+
+    def stop(self):
+        """Ask the loop to stop; returns False if it was not running"""
+        with self._lock:
+            if not self.running:
+                return False
+            self.running = False
+            self._stop.set()
+        self._wake.set()
+        self.publish_state()
+        events.publish_checker_state(False, None)
+        return True
+
+    def reload(self):
+        """Re-read the config before the next cycle instead of after the current wait"""
+        self._wake.set()
+        return self.running
+
+    def status(self):
+        thread = self._thread
+        loop = self.loop
+        return {
+            'running': self.running,
+            'stopping': not self.running and bool(thread and thread.is_alive()),
+            'thread_alive': thread.is_alive() if thread else False,
+            'thread_name': thread.name if thread else None,
+            'next_check_time': self.next_check_time,
+            'next_check_at': self.next_check_at,
+            'check_count': self.check_count,
+            'started_at': self.started_at,
+            'pid': os.getpid(),
+            'shard': loop.shard.status() if loop and loop.shard else None,
+        }
+
+    def publish_state(self):
+        """Write the current status to the shared state file (service mode only)"""
+        if not self.state_file:
+            return
+        with self._state_lock:
+            write_state(dict(self.status(), updated_at=time.time()), self.state_file)
+
+    def _run(self, stop):
+        print("[THREAD] Stock checker thread starting...")
+        loop = None
+
+        try:
+            loaded_key = config_key()
+            config = load_config()
+            configure_services(config)
+
+            if not config.get('items', []):
+                print("[THREAD] No items to check, stopping thread")
+                return
+
+            loop = self.loop = CheckLoop(config, should_continue=lambda: not stop.is_set(), label="[THREAD] ")
+            self.check_count = loop.check_count
+            self._log_config(loop)
+
+            print(f"[THREAD] Starting stock checking loop...")
+
+            while not stop.is_set():
+                try:
+                    # Pick up items and settings saved since the last cycle
+                    self._wake.clear()
+                    if config_key() != loaded_key:
+                        loaded_key = config_key()
+                        config = load_config()
+                        configure_services(config)
+                        loop.reconfigure(config)
+                        self._log_config(loop)
+
+                    ran = loop.run_once()
+                    self.check_count = loop.check_count
+                    if ran and self.max_cycles and loop.cycles >= self.max_cycles:
+                        break
+
+                    wait = math.ceil(loop.seconds_until_next())
+                    self.next_check_at = time.time() + wait
+                    self.next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.next_check_at))
+                    self.publish_state()
+                    events.publish_checker_state(self.running, self.next_check_at)
+                    print(f"[THREAD] Next check in {wait} seconds ({self.next_check_time})")
+
+                    # Wait for next check with status updates
+                    for i in range(wait):
+                        if stop.is_set():
+                            print(f"[THREAD] Stop signal received during sleep")
+                            break
+                        if self._wake.is_set():
+                            print(f"[THREAD] Config changed, reloading before the next check")
+                            break
+                        if i % 60 == 0:  # Log every minute
+                            remaining = wait - i
+                            print(f"[THREAD] Next check in {remaining} seconds...")
+                        self._wake.wait(1)
+
+                except Exception as inner_e:
+                    print(f"[THREAD] Error in check loop: {inner_e}")
+                    traceback.print_exc()
+                    # Continue the loop after error
+                    stop.wait(30)  # Wait 30 seconds before retrying
+
+        except Exception as e:
+            print(f"[THREAD] Fatal stock checker error: {e}")
+            traceback.print_exc()
+        finally:
+            print(f"[THREAD] Stock checker thread ending...")
+            if loop:
+                loop.close()
+            with self._lock:
+                # A newer run may already own the shared state; only the current run clears it
+                current = self._stop is stop
+                if current:
+                    self.loop = None
+                    self.running = False
+                    self.next_check_time = None
+                    self.next_check_at = None
+            if current:
+                self.publish_state()
+                events.publish_checker_state(False, None)
+
+    def _log_config(self, loop):
+        print(f"[THREAD] Loaded config: {len(loop.items)} items, "
+              f"{loop.config.get('request_delay', 1800)}s delay, concurrency {loop.engine.concurrency}")
+
+
+def send_command(command, address=CHECKER_SOCKET, timeout=COMMAND_TIMEOUT):
+    """Send a command to the checker service and return its reply"""
+    if not os.path.exists(address):
+        raise CheckerUnavailable(f"no checker service socket at {address}")
+    try:
+        conn = Client(address, family='AF_UNIX', authkey=CHECKER_AUTHKEY)
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise CheckerUnavailable(str(e))
+    with conn:
+        conn.send({'command': command})
+        if not conn.poll(timeout):
+            raise CheckerUnavailable(f"checker service did not answer '{command}' within {timeout}s")
+        return conn.recv()
+
+
+def _handle_connection(conn, runner):
+    try:
+        message = conn.recv()
+        command = message.get('command') if isinstance(message, dict) else None
+        if command == 'start':
+            reply = {'ok': runner.start()}
+        elif command == 'stop':
+            reply = {'ok': runner.stop()}
+        elif command == 'reload':
+            reply = {'ok': runner.reload()}
+        elif command == 'status':
+            reply = {'ok': True}
+        else:
+            reply = {'ok': False, 'error': f"unknown command: {command}"}
+        reply.update(runner.status())
+        conn.send(reply)
+    except (EOFError, OSError) as e:
+        print(f"[SERVICE] Dropped connection: {e}")
+    finally:
+        conn.close()
+
+
+def _heartbeat(runner):
+    while True:
+        runner.publish_state()
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def serve(address=CHECKER_SOCKET):
+    """Run the checker service until terminated; returns an exit code"""
+    try:
+        send_command('status', address)
+        print(f"[SERVICE] A checker service is already listening on {address}")
+        return 1
+    except CheckerUnavailable:
+        pass
+    if os.path.exists(address):
+        os.remove(address)  # Left behind by a service that crashed
+
+    # Resume the loop if the previous service died while it was running
+    resume = read_state().get('running', False)
+
+    runner = CheckerRunner(state_file=CHECKER_STATE_FILE)
+    listener = Listener(address, family='AF_UNIX', authkey=CHECKER_AUTHKEY)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"[SERVICE] Checker service {os.getpid()} listening on {address}")
+
+    threading.Thread(target=_heartbeat, args=(runner,), daemon=True, name="CheckerHeartbeat").start()
+    if resume:
+        print("[SERVICE] Resuming checker that was running before the restart")
+        runner.start()
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                print(f"[SERVICE] Rejected connection: {e}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, runner), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        was_running = runner.running
+        runner.stop()
+        listener.close()
+        notifications.flush(EXIT_FLUSH_TIMEOUT)
+        # Keep the 'running' flag so a supervised restart picks the loop up again
+        write_state(dict(runner.status(), running=was_running, updated_at=0))
+        print("[SERVICE] Checker service stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(serve())
@@ -0,0 +1,135 @@
+"""
+Crash-resumable check cycles: the cycle number, schedule and finished items saved as the cycle runs
+
+The checkpoint is a JSON Lines file. Its first line holds the cycle number
+and the scheduler state when the cycle started; every item whose checks
+all completed appends a line with its results, and a line marks when the
+cycle's results reached the time series. A finished cycle replaces the
+file with a single line marked finished. After a restart the loop
+restores the schedule (due times are wall-clock, so items that were not
+due yet stay that way), re-schedules the finished items from when they
+were actually checked, and carries their results into the resumed cycle.
+"""
+
+import json
+import os
+import threading
+import time
+from check_result import CheckResult
+
+CHECKPOINT_FILE = os.getenv('CHECKPOINT_FILE', "cycle_checkpoint.jsonl")
+
+
+class CycleProgress:
+    """What the last run left behind"""
+
+    __slots__ = ('check_count', 'schedule', 'finished', 'items', 'unrecorded')
+
+    def __init__(self, check_count, schedule, finished, items, unrecorded=()):
+        self.check_count = check_count
+        self.schedule = schedule
+        self.finished = finished
+        self.items = items  # [(checked_at epoch, item_id, [CheckResult])] of an unfinished cycle
+        self.unrecorded = set(unrecorded)  # Item IDs whose results never reached the time series
+
+
+class CycleCheckpoint:
+    """Progress file for one check loop"""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self._file = None
+        self._resuming = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_node(cls, node_id=None):
+        """Sharded nodes share a working directory, so each keeps its own file"""
+        return cls(f"{CHECKPOINT_FILE}.{node_id}" if node_id else CHECKPOINT_FILE)
+
+    def load(self):
+        """Return the saved CycleProgress, or None if there is no readable checkpoint"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Warning: Could not read checkpoint {self.path}: {e}")
+            return None
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # Blank, or the last line was cut off by the crash
+        if not entries or 'cycle' not in entries[0]:
+            return None
+        header = entries[0]
+        items = []
+        unrecorded = set()
+        for entry in entries[1:]:
+            if 'item' in entry:
+                items.append((entry['t'], entry['item'],
+                              [CheckResult.from_dict(record) for record in entry['results']]))
+                unrecorded.add(entry['item'])
+            elif 'series' in entry:
+                unrecorded.clear()
+        finished = bool(header.get('finished'))
+        self._resuming = not finished
+        return CycleProgress(header['cycle'], header.get('schedule') or {}, finished, items, unrecorded)
+
+    def _replace(self, header):
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+        os.replace(tmp_file, self.path)
+
+    def begin(self, check_count, scheduler):
+        """Start recording a cycle; a resumed cycle keeps appending to the unfinished one"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()  # Left open by a cycle that failed
+            try:
+                if not self._resuming:
+                    self._replace({'cycle': check_count, 'started_at': time.time(), 'schedule': scheduler.state()})
+                self._resuming = False
+                self._file = open(self.path, 'a', encoding='utf-8')
+            except OSError as e:
+                print(f"Warning: Could not write checkpoint {self.path}: {e}")
+                self._file = None
+
+    def record(self, item_id, results):
+        """Save the results of an item whose checks all completed"""
+        line = json.dumps({'t': time.time(), 'item': item_id, 'results': [result.to_dict() for result in results]})
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                # Flushed to the OS on every item, so it survives the process dying
+                self._file.write(line + '\n')
+                self._file.flush()
+            except OSError as e:
+                print(f"Warning: Could not write checkpoint {self.path}: {e}")
+
+    def series_recorded(self):
+        """Note that every item saved so far is in the time series, so a resume does not write it twice"""
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(json.dumps({'series': time.time()}) + '\n')
+                self._file.flush()
+            except OSError as e:
+                print(f"Warning: Could not write checkpoint {self.path}: {e}")
+
+    def finish(self, check_count, scheduler):
+        """Mark the cycle done, keeping the cycle number and schedule for the next start"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                self._replace({'cycle': check_count, 'finished': True, 'schedule': scheduler.state()})
+            except OSError as e:
+                print(f"Warning: Could not write checkpoint {self.path}: {e}")
@@ -0,0 +1,107 @@
+"""
+Loading and saving of config/checker.yaml, shared by the web app and the checker service
+
+The parsed config is cached and only re-read when the file's inode, mtime
+or size changes, so page views don't re-parse YAML. Saves replace the file
+atomically and then tell the registered listeners (the running checker),
+which pick the new items up on their next cycle.
+"""
+
+import copy
+import os
+import threading
+import yaml
+from check_engine import DEFAULT_CONCURRENCY
+
+CONFIG_FILE = 'config/checker.yaml'
+
+_lock = threading.Lock()
+_cached_key = None
+_cached_config = None
+_save_listeners = []
+
+
+def default_config():
+    return {
+        'items': [],
+        'request_delay': 1800,
+        'concurrency': DEFAULT_CONCURRENCY,
+        'check_mode': 'api',
+        'discord_enabled': True,
+        'notification_mode': 'all_checks',
+        'store_ids': [],
+        'discord': {
+            'webhook_url': ''
+        }
+    }
+
+
+def _stat_key(stat):
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def config_key():
+    """Identity of the config file on disk (changes whenever it is rewritten), or None if it does not exist"""
+    try:
+        return _stat_key(os.stat(CONFIG_FILE))
+    except FileNotFoundError:
+        return None
+
+
+def load_config():
+    """Load configuration from YAML file.
+
+    The file is only parsed when it changed since the last call; every
+    caller gets its own copy and may modify it freely.
+    """
+    global _cached_key, _cached_config
+    key = config_key()
+    if key is None:
+        return default_config()
+    with _lock:
+        if key != _cached_key:
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    # Key the cache on the file actually read, in case it was replaced after the stat
+                    key = _stat_key(os.fstat(f.fileno()))
+                    _cached_config = yaml.safe_load(f)
+                    _cached_key = key
+            except FileNotFoundError:
+                return default_config()
+        return copy.deepcopy(_cached_config)
+
+
+def save_config(config):
+    """Save configuration to YAML file, atomically, and notify the listeners"""
+    global _cached_key, _cached_config
+    directory = os.path.dirname(CONFIG_FILE) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{CONFIG_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _lock:
+        try:
+            with open(tmp_file, 'w') as f:
+                yaml.dump(config, f, default_flow_style=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, CONFIG_FILE)
+        except OSError as e:
+            # A config file bind-mounted on its own cannot be replaced; rewrite it in place
+            print(f"Warning: Could not replace {CONFIG_FILE} atomically ({e}), writing it in place")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            with open(CONFIG_FILE, 'w') as f:
+                yaml.dump(config, f, default_flow_style=False)
+        _cached_config = copy.deepcopy(config)
+        _cached_key = config_key()
+
+    for listener in list(_save_listeners):
+        try:
+            listener()
+        except Exception as e:
+            print(f"Warning: Config listener failed: {e}")
+
+
+def on_save(listener):
+    """Call listener() after every save_config() in this process"""
+    _save_listeners.append(listener)
+    return listener
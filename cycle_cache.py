@@ -0,0 +1,54 @@
+"""
+Per-cycle memoization of store-independent fetches
+"""
+
+import threading
+from collections import Counter
+
+
+class _Entry:
+    def __init__(self):
+        self.ready = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CycleCache:
+    """Fetch each key at most once per check cycle, even when several workers ask at the same time"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stats = Counter()
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() only for the first caller"""
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                entry.value = fetch()
+            except Exception as e:
+                entry.error = e
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+
+        if entry.error is not None:
+            raise entry.error
+        return entry.value
+
+    def count(self, name, amount=1):
+        """Add to one of the cycle's counters"""
+        with self._lock:
+            self.stats[name] += amount
@@ -0,0 +1,130 @@
+"""
+Opt-in capture of raw CEX responses as compressed, size- and age-bounded debug artifacts
+"""
+
+import gzip
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+DEFAULT_DIRECTORY = "debug"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 3
+DEFAULT_SAMPLE_RATE = 0.0
+TRIGGERS_FILE = "capture_requests.json"
+
+_settings = {
+    'enabled': False,
+    'directory': DEFAULT_DIRECTORY,
+    'max_bytes': DEFAULT_MAX_BYTES,
+    'max_age_days': DEFAULT_MAX_AGE_DAYS,
+    'sample_rate': DEFAULT_SAMPLE_RATE,
+}
+_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def configure(config):
+    """Apply the 'debug_capture' config section"""
+    capture_config = (config or {}).get('debug_capture', {}) or {}
+    with _lock:
+        _settings.update({
+            'enabled': bool(capture_config.get('enabled', False)),
+            'directory': capture_config.get('directory', DEFAULT_DIRECTORY),
+            'max_bytes': int(capture_config.get('max_bytes', DEFAULT_MAX_BYTES)),
+            'max_age_days': float(capture_config.get('max_age_days', DEFAULT_MAX_AGE_DAYS)),
+            'sample_rate': float(capture_config.get('sample_rate', DEFAULT_SAMPLE_RATE)),
+        })
+
+
+def _triggers_path():
+    return os.path.join(_settings['directory'], TRIGGERS_FILE)
+
+
+def _load_triggers():
+    try:
+        with open(_triggers_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_triggers(triggers):
+    os.makedirs(_settings['directory'], exist_ok=True)
+    tmp_file = f"{_triggers_path()}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(triggers, f)
+    os.replace(tmp_file, _triggers_path())
+
+
+def request_capture(product_id, count=1):
+    """Capture the next count responses for a product, even if sampling is off"""
+    with _lock:
+        triggers = _load_triggers()
+        triggers[product_id] = triggers.get(product_id, 0) + max(1, int(count))
+        _save_triggers(triggers)
+        return triggers[product_id]
+
+
+def should_capture(product_id):
+    """Decide whether this check of product_id should keep its raw responses"""
+    with _lock:
+        if os.path.exists(_triggers_path()):
+            triggers = _load_triggers()
+            remaining = triggers.get(product_id, 0)
+            if remaining > 0:
+                if remaining > 1:
+                    triggers[product_id] = remaining - 1
+                else:
+                    del triggers[product_id]
+                _save_triggers(triggers)
+                return True
+        return _settings['enabled'] and random.random() < _settings['sample_rate']
+
+
+def _prune(directory):
+    """Drop artifacts older than max_age_days, then the oldest ones until under max_bytes"""
+    cutoff = time.time() - _settings['max_age_days'] * 86400
+    artifacts = []
+    for name in os.listdir(directory):
+        if not name.endswith('.gz'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime < cutoff:
+            os.remove(path)
+        else:
+            artifacts.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in artifacts)
+    for _, size, path in sorted(artifacts):
+        if total <= _settings['max_bytes']:
+            break
+        os.remove(path)
+        total -= size
+
+
+def save_artifact(product_id, kind, content, extension):
+    """Write a gzip-compressed artifact for product_id and keep the directory within its bounds"""
+    directory = _settings['directory']
+    filename = f"{product_id}_{kind}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}-{next(_sequence)}.{extension}.gz"
+    path = os.path.join(directory, filename)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        with gzip.open(path, 'wb') as f:
+            f.write(content)
+        with _lock:
+            _prune(directory)
+        print(f"Debug artifact saved to {path}")
+        return path
+    except OSError as e:
+        print(f"Warning: Could not save debug artifact: {e}")
+        return None
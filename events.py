@@ -0,0 +1,69 @@
+"""
+Dashboard event feed: checker processes append events, web workers stream them as Server-Sent Events
+"""
+
+import json
+import time
+from jsonl_log import AppendLog
+
+EVENTS_FILE = "events.jsonl"
+POLL_INTERVAL = 1.0        # Seconds between checks of the events file per stream
+KEEPALIVE_INTERVAL = 15.0  # Comment lines keep proxies from closing idle streams
+STREAM_DURATION = 300.0    # Streams end after this; EventSource reconnects with Last-Event-ID
+REPLAY_LIMIT = 200         # Most events replayed to a reconnecting client
+
+event_log = AppendLog(EVENTS_FILE, max_segment_bytes=128 * 1024, max_segments=2)
+
+
+def publish(event_type, data):
+    """Append one event for every open dashboard to receive"""
+    try:
+        event_log.append({'id': time.time_ns(), 'type': event_type, 'data': data})
+    except OSError as e:
+        print(f"Warning: Could not publish {event_type} event: {e}")
+
+
+def publish_checker_state(running, next_check_at):
+    """Announce the countdown anchor; dashboards count down from next_check_at locally"""
+    publish('checker', {
+        'running': running,
+        'next_check_at': next_check_at,
+        'next_check_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_check_at)) if next_check_at else None,
+    })
+
+
+def format_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream(initial_events=(), last_event_id=None):
+    """Yield SSE messages: initial_events, anything missed since last_event_id, then new events as they land"""
+    position = event_log.end_position()
+    for event_type, data in initial_events:
+        yield format_event(event_type, data)
+
+    if last_event_id is not None:
+        missed = [event for event in event_log.tail(REPLAY_LIMIT) if event.get('id', 0) > last_event_id]
+        for event in reversed(missed):
+            yield format_event(event['type'], event['data'], event['id'])
+            last_event_id = event['id']
+
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < STREAM_DURATION:
+        time.sleep(POLL_INTERVAL)
+        new_events, position = event_log.read_since(position)
+        for event in new_events:
+            if last_event_id is not None and event.get('id', 0) <= last_event_id:
+                continue  # Already sent in the replay
+            yield format_event(event['type'], event['data'], event['id'])
+        now = time.monotonic()
+        if new_events:
+            last_sent = now
+        elif now - last_sent >= KEEPALIVE_INTERVAL:
+            yield ": keepalive\n\n"
+            last_sent = now
@@ -0,0 +1,302 @@
+"""
+SQLite-backed stock history with per-product and per-store rows
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+STOCK_HISTORY_DB = os.getenv('STOCK_HISTORY_DB', "stock_history.db")
+LEGACY_HISTORY_FILE = "stock_history.json"
+LEGACY_PRODUCT_HISTORY_GLOB = "stock_history_*.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_history (
+    product_id TEXT NOT NULL,
+    store_id TEXT NOT NULL DEFAULT '',
+    last_in_stock TEXT,
+    last_check TEXT,
+    times_in_stock INTEGER NOT NULL DEFAULT 0,
+    first_seen TEXT,
+    PRIMARY KEY (product_id, store_id)
+);
+CREATE INDEX IF NOT EXISTS idx_stock_history_store ON stock_history (store_id);
+CREATE TABLE IF NOT EXISTS notified_status (
+    product_id TEXT PRIMARY KEY,
+    in_stock INTEGER NOT NULL,
+    price REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fetch_state (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    parsed TEXT,
+    updated_at REAL
+);
+"""
+
+UPSERT = """
+INSERT INTO stock_history (product_id, store_id, last_in_stock, last_check, times_in_stock, first_seen)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (product_id, store_id) DO UPDATE SET
+    last_in_stock = excluded.last_in_stock,
+    last_check = excluded.last_check,
+    times_in_stock = excluded.times_in_stock,
+    first_seen = excluded.first_seen
+"""
+
+FETCH_STATE_UPSERT = """
+INSERT OR REPLACE INTO fetch_state (url, etag, last_modified, content_hash, parsed, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+FIELDS = ('last_in_stock', 'last_check', 'times_in_stock', 'first_seen')
+# Every legacy record was created with these, so anything without them is not stock history
+LEGACY_REQUIRED_FIELDS = {'last_check', 'times_in_stock'}
+FETCH_STATE_FIELDS = ('etag', 'last_modified', 'content_hash', 'parsed')
+
+
+def _row_to_record(row):
+    return dict(zip(FIELDS, row))
+
+
+class HistoryStore:
+    """Stock history rows keyed by (product_id, store_id), written in batched transactions"""
+
+    def __init__(self, path=STOCK_HISTORY_DB):
+        self.path = path
+        self._lock = threading.RLock()
+        self._pending = None
+        self._pending_fetch_state = None
+        self._batch_depth = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, product_id, store_id=None):
+        """Return the history record for a product (at a store), or None"""
+        key = (product_id, store_id or '')
+        with self._lock:
+            if self._pending is not None and key in self._pending:
+                return dict(self._pending[key])
+            with metrics.HISTORY_IO_SECONDS.time(operation='get'):
+                row = self._conn.execute(
+                    "SELECT last_in_stock, last_check, times_in_stock, first_seen FROM stock_history "
+                    "WHERE product_id = ? AND store_id = ?", key).fetchone()
+        return _row_to_record(row) if row else None
+
+    def _write(self, records, fetch_states=None):
+        rows = [(product_id, store_id) + tuple(record.get(field) for field in FIELDS)
+                for (product_id, store_id), record in records.items()]
+        now = time.time()
+        fetch_rows = [(url, state['etag'], state['last_modified'], state['content_hash'],
+                       json.dumps(state['parsed']), now)
+                      for url, state in (fetch_states or {}).items()]
+        with metrics.HISTORY_IO_SECONDS.time(operation='write'):
+            with self._conn:
+                if rows:
+                    self._conn.executemany(UPSERT, rows)
+                if fetch_rows:
+                    self._conn.executemany(FETCH_STATE_UPSERT, fetch_rows)
+
+    @contextmanager
+    def batch(self):
+        """Collect every update made inside the block and commit them in one transaction"""
+        with self._lock:
+            if self._batch_depth == 0:
+                self._pending = {}
+                self._pending_fetch_state = {}
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    pending, self._pending = self._pending, None
+                    fetch_states, self._pending_fetch_state = self._pending_fetch_state, None
+                    if pending or fetch_states:
+                        self._write(pending, fetch_states)
+
+    def record_check(self, product_id, in_stock, store_id=None, has_reviews=False, check_time=None):
+        """Apply one check result to the product's history and return the updated record"""
+        current_time = check_time or time.strftime('%Y-%m-%d %H:%M:%S')
+        key = (product_id, store_id or '')
+        with self._lock:
+            record = self.get(product_id, store_id) or {
+                'last_in_stock': None,
+                'last_check': None,
+                'times_in_stock': 0,
+                'first_seen': current_time
+            }
+
+            if in_stock:
+                record['last_in_stock'] = current_time
+                record['times_in_stock'] += 1
+
+            # If product has reviews but no last_in_stock date, set it to "Previously in stock"
+            if has_reviews and not record['last_in_stock']:
+                record['last_in_stock'] = "Previously in stock"
+                record['times_in_stock'] = max(1, record['times_in_stock'])
+
+            record['last_check'] = current_time
+
+            if self._pending is not None:
+                self._pending[key] = record
+            else:
+                self._write({key: record})
+        return dict(record)
+
+    def import_records(self, history, store_id=None):
+        """Upsert a {product_id: record} mapping in one transaction"""
+        with self._lock:
+            self._write({(product_id, store_id or ''): record for product_id, record in history.items()})
+
+    def get_fetch_state(self, url):
+        """Return the saved validators and parsed result of the last fetch of url, or None"""
+        with self._lock:
+            if self._pending_fetch_state is not None and url in self._pending_fetch_state:
+                return dict(self._pending_fetch_state[url])
+            with metrics.HISTORY_IO_SECONDS.time(operation='get'):
+                row = self._conn.execute(
+                    "SELECT etag, last_modified, content_hash, parsed FROM fetch_state WHERE url = ?",
+                    (url,)).fetchone()
+        if not row:
+            return None
+        state = dict(zip(FETCH_STATE_FIELDS, row))
+        state['parsed'] = json.loads(row[3]) if row[3] else None
+        return state
+
+    def save_fetch_state(self, url, state):
+        """Save a fetch's validators and parsed result, as part of the current batch if there is one"""
+        with self._lock:
+            if self._pending_fetch_state is not None:
+                self._pending_fetch_state[url] = dict(state)
+            else:
+                self._write({}, {url: state})
+
+    def notified_status(self, product_ids):
+        """Return {product_id: {'in_stock', 'price'}} as of the checker's last cycle for each product.
+
+        This is the baseline stock transitions are diffed against. Only the
+        check loop writes it (record_notified), so live refreshes from the
+        dashboard cannot absorb a transition before it is notified.
+        """
+        product_ids = list(product_ids)
+        status = {}
+        with self._lock:
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT product_id, in_stock, price FROM notified_status "
+                    f"WHERE product_id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                for product_id, in_stock, price in rows:
+                    status[product_id] = {'in_stock': bool(in_stock), 'price': price}
+        return status
+
+    def record_notified(self, results):
+        """Make {product_id: CheckResult} the new transition baseline"""
+        now = time.time()
+        rows = [(product_id, 1 if result.in_stock else 0, result.sell_price, now)
+                for product_id, result in results.items()]
+        with self._lock, metrics.HISTORY_IO_SECONDS.time(operation='write'):
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO notified_status (product_id, in_stock, price, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (product_id) DO UPDATE SET in_stock = excluded.in_stock, "
+                    "price = excluded.price, updated_at = excluded.updated_at", rows)
+
+    def load_all(self, product_id=None):
+        """Return {product_id: record} with per-store records nested under 'stores'"""
+        query = ("SELECT product_id, store_id, last_in_stock, last_check, times_in_stock, first_seen "
+                 "FROM stock_history")
+        params = ()
+        if product_id:
+            query += " WHERE product_id = ?"
+            params = (product_id,)
+        with self._lock, metrics.HISTORY_IO_SECONDS.time(operation='load_all'):
+            rows = self._conn.execute(query, params).fetchall()
+
+        history = {}
+        for row in rows:
+            record = _row_to_record(row[2:])
+            entry = history.setdefault(row[0], {})
+            if row[1]:
+                entry.setdefault('stores', {})[row[1]] = record
+            else:
+                entry.update(record)
+        return history
+
+    def migrate_json_files(self, directory='.'):
+        """Import the legacy stock_history.json and stock_history_{id}.json files, renaming each one imported"""
+        migrated = {}
+        legacy_file = os.path.join(directory, LEGACY_HISTORY_FILE)
+        legacy_files = sorted(glob.glob(os.path.join(directory, LEGACY_PRODUCT_HISTORY_GLOB)))
+        if os.path.exists(legacy_file):
+            legacy_files.insert(0, legacy_file)
+
+        imported = []
+        for path in legacy_files:
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if path == legacy_file:
+                    entries = list(data.items())
+                else:
+                    product_id = os.path.basename(path)[len("stock_history_"):-len(".json")]
+                    entries = [(product_id, data)]
+                if not all(isinstance(record, dict) and LEGACY_REQUIRED_FIELDS <= record.keys()
+                           for _, record in entries):
+                    raise ValueError("not a stock history record")
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"Warning: Could not migrate {path}, leaving it in place: {e}")
+                continue
+
+            for product_id, record in entries:
+                merged = migrated.setdefault(product_id, {field: None for field in FIELDS})
+                times_in_stock = max(merged['times_in_stock'] or 0, record.get('times_in_stock') or 0)
+                for field in FIELDS:
+                    if record.get(field) is not None:
+                        merged[field] = record[field]
+                merged['times_in_stock'] = times_in_stock
+            imported.append(path)
+
+        if migrated:
+            for product_id, record in migrated.items():
+                existing = self.get(product_id)
+                if existing:
+                    record['times_in_stock'] = max(record['times_in_stock'], existing['times_in_stock'])
+            self.import_records(migrated)
+            print(f"Migrated stock history for {len(migrated)} product(s) into {self.path}")
+
+        # Only files whose records are now in the database; anything else stays for another look
+        for path in imported:
+            try:
+                os.replace(path, f"{path}.migrated")
+            except OSError as e:
+                print(f"Warning: Could not rename {path}: {e}")
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Return the process-wide history store, migrating legacy JSON history on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+            _store.migrate_json_files()
+        return _store
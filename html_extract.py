@@ -0,0 +1,131 @@
+"""
+Extract the stock markers from a CEX product page without building a document tree
+
+The product page is only needed for five data-testid markers and the title,
+so a streaming HTMLParser collects those as the page is tokenized instead of
+BeautifulSoup building (and then searching) the whole tree. Unclosed and
+stray end tags are resolved the way BeautifulSoup's html.parser builder
+does, so the results match parse_with_soup(), the reference implementation.
+"""
+
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+# (tag, data-testid) -> key in the returned markers
+MARKERS = {
+    ('button', 'add-to-basket-button'): 'buy_button',
+    ('div', 'out-of-stock-message'): 'out_of_stock_message',
+    ('div', 'price'): 'price',
+    ('div', 'quantity-selector'): 'quantity_selector',
+}
+
+# Tags BeautifulSoup closes immediately, so they never contain anything
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+))
+
+
+class PageMarkerParser(HTMLParser):
+    """Collects the page markers while tracking only the open-tag stack"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found = dict.fromkeys(MARKERS.values(), False)
+        self.has_reviews = False
+        self.title_parts = None  # None until the first <title> opens
+        self._open_tags = []
+        self._reviews_seen = False
+        self._reviews_at = None  # Stack index of the first reviews section while it is open
+        self._title_at = None    # Stack index of the first <title> while it is open
+        self._title_run = []     # Title text since the last tag; BeautifulSoup joins it into one string
+
+    def handle_starttag(self, tag, attrs):
+        self._end_title_run()
+        testid = None
+        for name, value in attrs:
+            if name == 'data-testid':
+                testid = value  # The last duplicate wins, as in BeautifulSoup
+        if testid is not None:
+            key = MARKERS.get((tag, testid))
+            if key is not None:
+                self.found[key] = True
+            elif tag == 'div':
+                if testid == 'reviews' and not self._reviews_seen:
+                    # Only the first reviews section counts, as with soup.find()
+                    self._reviews_seen = True
+                    self._reviews_at = len(self._open_tags)
+                elif testid == 'review' and self._reviews_at is not None:
+                    self.has_reviews = True
+        if tag == 'title' and self.title_parts is None:
+            self.title_parts = []
+            self._title_at = len(self._open_tags)
+        if tag not in VOID_ELEMENTS:
+            self._open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        self._end_title_run()
+        # Close the most recent open tag with this name and everything inside it; ignore strays
+        open_tags = self._open_tags
+        for index in range(len(open_tags) - 1, -1, -1):
+            if open_tags[index] == tag:
+                del open_tags[index:]
+                if self._reviews_at is not None and index <= self._reviews_at:
+                    self._reviews_at = None
+                if self._title_at is not None and index <= self._title_at:
+                    self._title_at = None
+                return
+
+    def handle_data(self, data):
+        if self._title_at is not None:
+            self._title_run.append(data)
+
+    def handle_comment(self, data):
+        self._end_title_run()
+
+    def close(self):
+        super().close()
+        self._end_title_run()
+
+    def _end_title_run(self):
+        if self._title_run:
+            text = "".join(self._title_run).strip()
+            self._title_run = []
+            if text:
+                self.title_parts.append(text)
+
+
+def extract_page_markers(html):
+    """Return the page markers and title of a product page"""
+    parser = PageMarkerParser()
+    parser.feed(html)
+    parser.close()
+    markers = dict(parser.found)
+    markers['has_reviews'] = parser.has_reviews
+    markers['title'] = "".join(parser.title_parts) if parser.title_parts is not None else None
+    return markers
+
+
+def parse_with_soup(html):
+    """Reference implementation: the full BeautifulSoup parse extract_page_markers() must match"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Check for key elements
+    buy_button = soup.find('button', {'data-testid': 'add-to-basket-button'})
+    out_of_stock_msg = soup.find('div', {'data-testid': 'out-of-stock-message'})
+    price_indicator = soup.find('div', {'data-testid': 'price'})
+    quantity_selector = soup.find('div', {'data-testid': 'quantity-selector'})
+
+    # Check for reviews to determine if product has been in stock before
+    reviews_section = soup.find('div', {'data-testid': 'reviews'})
+    has_reviews = bool(reviews_section and reviews_section.find_all('div', {'data-testid': 'review'}))
+
+    return {
+        'buy_button': bool(buy_button),
+        'out_of_stock_message': bool(out_of_stock_msg),
+        'price': bool(price_indicator),
+        'quantity_selector': bool(quantity_selector),
+        'has_reviews': has_reviews,
+        'title': soup.title.get_text(strip=True) if soup.title else None,
+    }
@@ -0,0 +1,129 @@
+"""
+Process-wide pooled HTTP transport shared by all outbound calls
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+import rate_limit
+import metrics
+
+DEFAULT_POOL_CONNECTIONS = 4   # Number of hosts to keep pools for
+DEFAULT_POOL_MAXSIZE = 10      # Keep-alive connections per host
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Connection': 'keep-alive',
+}
+
+_session = None
+_settings = None
+_lock = threading.Lock()
+
+
+def _settings_from_config(config):
+    http_config = (config or {}).get('http', {}) or {}
+    pool_maxsize = int(http_config.get('pool_maxsize', DEFAULT_POOL_MAXSIZE))
+    # Never allow fewer pooled connections than parallel checks
+    pool_maxsize = max(pool_maxsize, int((config or {}).get('concurrency', 1)))
+    return {
+        'pool_connections': int(http_config.get('pool_connections', DEFAULT_POOL_CONNECTIONS)),
+        'pool_maxsize': pool_maxsize,
+        'timeout': (float(http_config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+                    float(http_config.get('read_timeout', DEFAULT_READ_TIMEOUT))),
+    }
+
+
+def _build_session(settings):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=settings['pool_connections'],
+                          pool_maxsize=settings['pool_maxsize'])
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def configure(config):
+    """Apply the 'http' and 'rate_limit' config sections, rebuilding the pools only if the settings changed"""
+    global _session, _settings
+    rate_limit.configure(config)
+    settings = _settings_from_config(config)
+    with _lock:
+        if settings == _settings and _session is not None:
+            return
+        old_session = _session
+        _session = _build_session(settings)
+        _settings = settings
+    if old_session is not None:
+        old_session.close()
+
+
+def get_session():
+    """Return the shared session, creating it with default settings on first use"""
+    global _session, _settings
+    with _lock:
+        if _session is None:
+            _settings = _settings_from_config({})
+            _session = _build_session(_settings)
+        return _session
+
+
+def _observe(host, endpoint, start, status):
+    metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, host=host, endpoint=endpoint)
+    metrics.HTTP_REQUESTS.inc(host=host, endpoint=endpoint, status=status)
+
+
+def request(method, url, retries=None, **kwargs):
+    """Send a request through the shared session with the default timeout applied.
+
+    Every request first takes a token from its host's bucket. 429/503
+    responses are retried after the server's Retry-After (or exponential
+    backoff with jitter), and connection errors are retried for GETs.
+    retries overrides the limiter's max_retries (0 leaves retrying to the caller).
+    """
+    session = get_session()
+    kwargs.setdefault('timeout', _settings['timeout'])
+    parsed_url = urlparse(url)
+    host = parsed_url.netloc
+    endpoint = metrics.endpoint_of(parsed_url.path)
+    limiter = rate_limit.get_limiter()
+    max_retries = limiter.max_retries if retries is None else retries
+
+    attempt = 0
+    while True:
+        limiter.acquire(host)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _observe(host, endpoint, start, 'error')
+            if method != 'GET' or attempt >= max_retries:
+                raise
+            delay = limiter.backoff(host, attempt)
+            print(f"Request to {host} failed ({e}), retrying in {delay:.1f}s")
+            attempt += 1
+            continue
+        _observe(host, endpoint, start, response.status_code)
+
+        if response.status_code in rate_limit.RETRY_STATUSES and attempt < max_retries:
+            retry_after = rate_limit.parse_retry_after(response.headers.get('Retry-After'))
+            delay = limiter.backoff(host, attempt, retry_after)
+            print(f"{host} returned {response.status_code}, backing off for {delay:.1f}s")
+            attempt += 1
+            continue
+        return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -0,0 +1,143 @@
+"""
+Append-only JSON Lines log with segment rotation and a reverse tail reader
+"""
+
+import json
+import os
+import threading
+
+READ_BLOCK_SIZE = 8192
+
+
+def _read_lines_reversed(path):
+    """Yield the lines of a file from the last one to the first, reading blocks from the end"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            read_size = min(READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if remainder:
+            yield remainder
+
+
+def _read_entries(f, offset):
+    """Return the complete entries after offset in an open file and the offset just past the last one"""
+    f.seek(offset)
+    data = f.read()
+    # Leave a line that is still being written for the next read
+    end = data.rfind(b'\n') + 1
+    entries = []
+    for line in data[:end].split(b'\n'):
+        if line:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries, offset + end
+
+
+class AppendLog:
+    """JSON Lines log where writes append one line and reads only touch the newest entries"""
+
+    def __init__(self, path, max_segment_bytes=256 * 1024, max_segments=4):
+        self.path = path
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+
+    def segment_paths(self):
+        """Segment files from newest to oldest"""
+        return [self.path] + [f"{self.path}.{n}" for n in range(1, self.max_segments)]
+
+    def _rotate(self):
+        paths = self.segment_paths()
+        if os.path.exists(paths[-1]):
+            os.remove(paths[-1])
+        for newer, older in zip(reversed(paths[:-1]), reversed(paths[1:])):
+            if os.path.exists(newer):
+                os.replace(newer, older)
+
+    def append(self, entry):
+        """Append one entry, rotating to a new segment once the current one is full"""
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                size = 0
+            if size and size + len(line) > self.max_segment_bytes:
+                self._rotate()
+            with open(self.path, 'ab') as f:
+                f.write(line)
+
+    def tail(self, count):
+        """Return up to count entries, newest first"""
+        entries = []
+        for path in self.segment_paths():
+            for line in _read_lines_reversed(path):
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # Skip a partially written line
+                if len(entries) >= count:
+                    return entries
+        return entries
+
+    def end_position(self):
+        """Position just past the newest entry, to pass to read_since()"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return (None, 0)
+        return (stat.st_ino, stat.st_size)
+
+    def read_since(self, position):
+        """Return the entries appended after position (oldest first) and the new position.
+
+        Positions are (inode, offset) pairs so a reader that falls behind a
+        rotation finishes the rotated segment before starting the new one.
+        """
+        inode, offset = position
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return [], (None, 0)
+
+        with f:
+            stat = os.fstat(f.fileno())
+            entries = []
+            if stat.st_ino != inode:
+                if inode is not None:
+                    entries = self._read_rotated(inode, offset)
+                offset = 0
+            elif stat.st_size < offset:
+                offset = 0  # Truncated or replaced in place
+            new_entries, offset = _read_entries(f, offset)
+        return entries + new_entries, (stat.st_ino, offset)
+
+    def _read_rotated(self, inode, offset):
+        for path in self.segment_paths()[1:]:
+            try:
+                with open(path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_ino == inode:
+                        return _read_entries(f, offset)[0]
+            except FileNotFoundError:
+                continue
+        return []
+
+    def exists(self):
+        return any(os.path.exists(path) for path in self.segment_paths())
@@ -1,17 +1,30 @@
-import requests
+import os
+import http_client
 import yaml
 
-CEX_API_STORES_LOOKUP_URL = "https://wss2.cex.uk.webuy.io/v3/stores"
+CEX_API_URL = os.getenv('CEX_API_URL', "https://wss2.cex.uk.webuy.io")
+CEX_API_STORES_LOOKUP_URL = f"{CEX_API_URL}/v3/stores"
+STORES_YAML = "config/stores.yaml"
 
 
 # Make a get request to CEX to obtain all stores
 def get_stores():
-    return requests.get(CEX_API_STORES_LOOKUP_URL).json()["response"]["data"]["stores"]
+    return http_client.get(CEX_API_STORES_LOOKUP_URL).json()["response"]["data"]["stores"]
 
 
-stores = {}
-for store in get_stores():
-    stores[store.get("storeId")] = store.get("storeName")
+def load_store_names(path=STORES_YAML):
+    """Return the {store_id: store_name} map written by this script, or {} if it hasn't been run"""
+    try:
+        with open(path, 'r') as f:
+            return yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        return {}
 
-with open('config/stores.yaml', 'w') as f:
-    data = yaml.dump(stores, f)
+
+if __name__ == "__main__":
+    stores = {}
+    for store in get_stores():
+        stores[store.get("storeId")] = store.get("storeName")
+
+    with open(STORES_YAML, 'w') as f:
+        data = yaml.dump(stores, f)
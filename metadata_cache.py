@@ -0,0 +1,133 @@
+"""
+Bounded LRU cache of product metadata with separate TTLs for static and price fields
+"""
+
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+# Names, IDs and images practically never change; prices move now and then
+STATIC_FIELDS = ('boxId', 'boxName', 'categoryName', 'categoryFriendlyName', 'superCatName', 'imageUrls')
+PRICE_FIELDS = ('sellPrice', 'cashPrice', 'exchangePrice')
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_STATIC_TTL = 24 * 3600
+DEFAULT_PRICE_TTL = 3600
+
+
+class _Entry:
+    __slots__ = ('static', 'prices', 'fetched_at')
+
+    def __init__(self, static, prices, fetched_at):
+        self.static = static
+        self.prices = prices
+        self.fetched_at = fetched_at
+
+
+class MetadataCache:
+    """Product metadata keyed by product ID, least recently used evicted first.
+
+    Never holds stock status: callers that need to know whether something
+    is in stock must still check it live.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, static_ttl=DEFAULT_STATIC_TTL, price_ttl=DEFAULT_PRICE_TTL):
+        self.max_entries = max_entries
+        self.static_ttl = static_ttl
+        self.price_ttl = price_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        """Apply the optional 'metadata_cache' config section"""
+        cache_config = (config or {}).get('metadata_cache', {}) or {}
+        with self._lock:
+            self.max_entries = max(1, int(cache_config.get('max_entries', DEFAULT_MAX_ENTRIES)))
+            self.static_ttl = float(cache_config.get('static_ttl', DEFAULT_STATIC_TTL))
+            self.price_ttl = float(cache_config.get('price_ttl', DEFAULT_PRICE_TTL))
+            self._evict()
+
+    def put(self, product_info, now=None):
+        """Store the metadata fields of a product detail record"""
+        product_id = product_info.get('boxId')
+        if not product_id:
+            return
+        now = time.monotonic() if now is None else now
+        static = {field: product_info[field] for field in STATIC_FIELDS if field in product_info}
+        prices = {field: product_info[field] for field in PRICE_FIELDS if field in product_info}
+        with self._lock:
+            self._entries[product_id] = _Entry(static, prices, now)
+            self._entries.move_to_end(product_id)
+            self._evict()
+
+    def get(self, product_id, need_prices=True, now=None):
+        """Return the cached metadata, or None if it is missing or expired.
+
+        Without need_prices only the static fields are returned, and the
+        entry stays usable for the (longer) static TTL.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                result = 'miss'
+            elif now - entry.fetched_at > (min(self.static_ttl, self.price_ttl) if need_prices else self.static_ttl):
+                result = 'expired'
+            else:
+                result = 'hit'
+                self._entries.move_to_end(product_id)
+                metadata = dict(entry.static, **entry.prices) if need_prices else dict(entry.static)
+            if result == 'hit':
+                self.hits += 1
+            elif result == 'expired':
+                self.expired += 1
+            else:
+                self.misses += 1
+        metrics.METADATA_CACHE.inc(result=result)
+        return metadata if result == 'hit' else None
+
+    def get_or_fetch(self, product_id, fetch, need_prices=True):
+        """Return cached metadata, calling fetch() for the product detail record on a miss.
+
+        fetch() returns the record or None (unknown product, not cached).
+        """
+        metadata = self.get(product_id, need_prices)
+        if metadata is not None:
+            return metadata
+        product_info = fetch()
+        if not product_info:
+            return None
+        product_info = dict(product_info, boxId=product_info.get('boxId') or product_id)
+        self.put(product_info)
+        fields = STATIC_FIELDS + PRICE_FIELDS if need_prices else STATIC_FIELDS
+        return {field: product_info[field] for field in fields if field in product_info}
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self._entries.pop(product_id, None)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            metrics.METADATA_CACHE.inc(result='eviction')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.expired
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'static_ttl': self.static_ttl,
+                'price_ttl': self.price_ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,297 @@
+"""
+Counters and histograms in the Prometheus text format, aggregated across processes
+
+Each process (Gunicorn workers, the checker service, the CLI) keeps its own
+values in memory and periodically writes them to METRICS_DIR/<pid>-<start>.json.
+render() sums every process's file, so /metrics reports the same totals
+whichever worker serves it. Files left by processes that have exited are
+folded into METRICS_DIR/retired.json, so the totals keep counting up
+without one file per process ever started.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.getenv('METRICS_DIR', "metrics")
+FLUSH_INTERVAL = 5.0  # Seconds between writes of this process's values
+RETIRED_FILE = "retired.json"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_dirty = False
+_flusher = None
+_process_file = None
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _changed()
+
+    def _dump(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def _merge(self, merged, dumped):
+        for key, value in dumped:
+            key = tuple(key)
+            merged[key] = merged.get(key, 0) + value
+
+    def _render(self, merged):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(merged.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [count per bucket..., +Inf count, sum]
+        _registry[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            else:
+                entry[len(self.buckets)] += 1
+            entry[-1] += value
+        _changed()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _dump(self):
+        return [[list(key), list(entry)] for key, entry in self.values.items()]
+
+    def _merge(self, merged, dumped):
+        for key, entry in dumped:
+            key = tuple(key)
+            if len(entry) != len(self.buckets) + 2:
+                continue  # Written with different buckets
+            total = merged.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, value in enumerate(entry):
+                total[index] += value
+
+    def _render(self, merged):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, entry in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {entry[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+_ID_SEGMENT = re.compile(r'\d')
+
+
+def endpoint_of(path):
+    """Collapse a URL path into a low-cardinality endpoint label.
+
+    Numeric segments, longer segments containing digits (product and store
+    IDs) and everything after 'webhooks' (which would leak the webhook
+    token) become {id}.
+    """
+    parts = [part for part in path.split('/') if part]
+    normalized = []
+    after_webhooks = False
+    for part in parts[:5]:
+        if after_webhooks or part.isdigit() or (len(part) > 4 and _ID_SEGMENT.search(part)) or len(part) > 32:
+            normalized.append('{id}')
+        else:
+            normalized.append(part)
+        after_webhooks = after_webhooks or part == 'webhooks'
+    return '/' + '/'.join(normalized)
+
+
+def _changed():
+    global _dirty, _flusher
+    _dirty = True
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_periodically, daemon=True, name="MetricsFlusher")
+                _flusher.start()
+                atexit.register(flush)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def flush():
+    """Write this process's values to its file in METRICS_DIR if anything changed"""
+    global _dirty, _process_file
+    if not _dirty:
+        return
+    with _flush_lock:
+        with _lock:
+            _dirty = False
+            dumped = {name: metric._dump() for name, metric in _registry.items() if metric.values}
+            if _process_file is None:
+                _process_file = os.path.join(METRICS_DIR, f"{os.getpid()}-{int(time.time())}.json")
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            tmp_file = f"{_process_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(dumped, f)
+            os.replace(tmp_file, _process_file)
+        except OSError as e:
+            print(f"Warning: Could not write metrics: {e}")
+
+
+def _list_files():
+    try:
+        return [name for name in os.listdir(METRICS_DIR) if name.endswith('.json')]
+    except FileNotFoundError:
+        return []
+
+
+def _merge_file(merged, file_name):
+    """Add one file's values into merged; False if it could not be read"""
+    try:
+        with open(os.path.join(METRICS_DIR, file_name), 'r') as f:
+            dumped = json.load(f)
+    except (OSError, ValueError):
+        return False
+    for name, values in dumped.items():
+        metric = _registry.get(name)
+        if metric is not None:
+            metric._merge(merged[name], values)
+    return True
+
+
+def _exited(file_name):
+    """Whether a <pid>-<start>.json file belongs to a process that is no longer running"""
+    pid, _, start = file_name[:-len('.json')].partition('-')
+    if not (pid.isdigit() and start.isdigit()) or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # Running, under another user
+    return False
+
+
+def _fold_exited_processes():
+    """Add the files of exited processes into RETIRED_FILE and delete them"""
+    exited = [file_name for file_name in _list_files() if _exited(file_name)]
+    merged = {name: {} for name in _registry}
+    _merge_file(merged, RETIRED_FILE)
+    exited = [file_name for file_name in exited if _merge_file(merged, file_name)]
+    if not exited:
+        return
+    dumped = {name: [[list(key), value] for key, value in values.items()]
+              for name, values in merged.items() if values}
+    try:
+        retired_file = os.path.join(METRICS_DIR, RETIRED_FILE)
+        tmp_file = f"{retired_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(dumped, f)
+        os.replace(tmp_file, retired_file)
+        for file_name in exited:
+            os.remove(os.path.join(METRICS_DIR, file_name))
+    except OSError as e:
+        print(f"Warning: Could not fold metrics of exited processes: {e}")
+
+
+@contextmanager
+def _directory_lock():
+    """Held while reading or folding the files, so no render sees a file counted twice or not at all"""
+    try:
+        lock_file = open(os.path.join(METRICS_DIR, '.lock'), 'w')
+    except OSError:
+        yield  # Nothing written yet
+        return
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def render():
+    """Return every process's metrics, summed, in the Prometheus text exposition format"""
+    flush()
+    merged = {name: {} for name in _registry}
+    with _directory_lock():
+        _fold_exited_processes()
+        for file_name in _list_files():
+            _merge_file(merged, file_name)
+
+    lines = []
+    for name, metric in _registry.items():
+        lines.extend(metric._render(merged[name]))
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path metrics shared by every module
+HTTP_REQUEST_SECONDS = Histogram('cex_http_request_duration_seconds',
+                                 'Outbound HTTP request latency', ('host', 'endpoint'))
+HTTP_REQUESTS = Counter('cex_http_requests_total',
+                        'Outbound HTTP requests by response status (or error)', ('host', 'endpoint', 'status'))
+HTML_PARSE_SECONDS = Histogram('cex_html_parse_seconds', 'Time spent parsing product pages',
+                               buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+HISTORY_IO_SECONDS = Histogram('cex_history_io_seconds', 'Stock history database time by operation',
+                               ('operation',),
+                               buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+CYCLE_SECONDS = Histogram('cex_cycle_duration_seconds', 'Duration of a check cycle',
+                          buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+CYCLE_ITEMS = Histogram('cex_cycle_items', 'Items checked per cycle',
+                        buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+CHECKS = Counter('cex_checks_total', 'Product checks by outcome', ('result',))
+NOTIFICATION_SECONDS = Histogram('cex_notification_latency_seconds',
+                                 'Time from queueing a notification to its final outcome, retries included',
+                                 ('type',), buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+METADATA_CACHE = Counter('cex_metadata_cache_total', 'Product metadata cache lookups and evictions', ('result',))
+NOTIFICATIONS = Counter('cex_notifications_total', 'Notifications by final outcome', ('type', 'status'))
@@ -0,0 +1,230 @@
+"""
+Background webhook delivery with retries, Discord rate-limit handling and a dead-letter log
+"""
+
+import atexit
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import requests
+import http_client
+import rate_limit
+import metrics
+from jsonl_log import AppendLog
+
+DEAD_LETTER_FILE = "notifications_dead_letter.jsonl"
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_MAX = 300.0
+DEFAULT_TIMEOUT = 10
+EXIT_FLUSH_TIMEOUT = 10  # Seconds to keep delivering queued notifications at interpreter exit
+
+
+class Notification:
+    __slots__ = ('url', 'payload', 'message_type', 'coalesce_key', 'attempts', 'not_before', 'queued_at')
+
+    def __init__(self, url, payload, message_type, coalesce_key=None):
+        self.url = url
+        self.payload = payload
+        self.message_type = message_type
+        self.coalesce_key = coalesce_key
+        self.attempts = 0
+        self.not_before = 0.0
+        self.queued_at = time.monotonic()
+
+
+def _discord_retry_after(response):
+    """Seconds to wait after a 429, from the Retry-After header or Discord's JSON body"""
+    retry_after = rate_limit.parse_retry_after(response.headers.get('Retry-After'))
+    if retry_after is None:
+        try:
+            retry_after = float(response.json().get('retry_after'))
+        except (ValueError, TypeError, AttributeError):
+            retry_after = None
+    return retry_after
+
+
+class NotificationDispatcher:
+    """Queue webhook payloads and deliver them from one background thread.
+
+    submit() never blocks on the network. Notifications with the same
+    coalesce_key collapse to the newest one while they wait, so a burst of
+    check results (or a backlog behind a rate limit) sends only the latest.
+    Failed deliveries are retried with backoff; ones that still fail, or
+    that the webhook rejects outright, go to the dead-letter log.
+    """
+
+    def __init__(self, log=None, dead_letter_file=DEAD_LETTER_FILE):
+        self.log = log
+        self.dead_letters = AppendLog(dead_letter_file)
+        self.max_attempts = DEFAULT_MAX_ATTEMPTS
+        self.backoff_base = DEFAULT_BACKOFF_BASE
+        self.backoff_max = DEFAULT_BACKOFF_MAX
+        self.timeout = DEFAULT_TIMEOUT
+        self.coalesced = 0
+        self._queue = deque()
+        self._busy = False
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def configure(self, config):
+        """Apply the optional 'notifications' config section"""
+        notify_config = (config or {}).get('notifications', {}) or {}
+        self.max_attempts = int(notify_config.get('max_attempts', DEFAULT_MAX_ATTEMPTS))
+        self.backoff_base = float(notify_config.get('backoff_base', DEFAULT_BACKOFF_BASE))
+        self.backoff_max = float(notify_config.get('backoff_max', DEFAULT_BACKOFF_MAX))
+
+    def submit(self, url, payload, message_type, coalesce_key=None):
+        """Queue a payload for delivery and return immediately"""
+        with self._cond:
+            self._queue.append(Notification(url, payload, message_type, coalesce_key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="NotificationDispatcher")
+                self._thread.start()
+                atexit.register(self.flush, EXIT_FLUSH_TIMEOUT)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue) + (1 if self._busy else 0)
+
+    def flush(self, timeout=None):
+        """Wait until every queued notification is delivered or dead-lettered; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _next(self):
+        """Pop the next notification that is ready to send, or return how long to wait (call with the lock held)"""
+        while self._queue:
+            notification = self._queue[0]
+            key = notification.coalesce_key
+            if key is not None and any(other.coalesce_key == key for other in list(self._queue)[1:]):
+                self._queue.popleft()
+                self.coalesced += 1
+                metrics.NOTIFICATIONS.inc(type=notification.message_type, status='coalesced')
+                print(f"Coalesced a queued {notification.message_type} notification into a newer one")
+                continue
+            wait = max(notification.not_before, self._paused_until) - time.monotonic()
+            if wait > 0:
+                return None, wait
+            return self._queue.popleft(), 0
+        return None, None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                notification, wait = self._next()
+                while notification is None:
+                    self._cond.wait(wait)
+                    notification, wait = self._next()
+                self._busy = True
+            try:
+                self._deliver(notification)
+            except Exception as e:
+                print(f"Notification dispatcher error: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _observe_rate_limit(self, response):
+        """Pause sending once Discord reports the bucket is empty"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset_after = response.headers.get('X-RateLimit-Reset-After')
+        if remaining is not None and reset_after is not None:
+            try:
+                if int(remaining) == 0:
+                    with self._cond:
+                        self._paused_until = max(self._paused_until, time.monotonic() + float(reset_after))
+            except ValueError:
+                pass
+
+    def _record(self, notification, status, response=None, error=None):
+        metrics.NOTIFICATION_SECONDS.observe(time.monotonic() - notification.queued_at,
+                                             type=notification.message_type)
+        metrics.NOTIFICATIONS.inc(type=notification.message_type, status=status)
+        log_entry = {
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "message_type": notification.message_type,
+            "status": status,
+            "attempts": notification.attempts,
+        }
+        if response is not None:
+            log_entry.update({
+                "status_code": response.status_code,
+                "payload": notification.payload,
+                "response": response.text if status != "success" else None,
+            })
+        else:
+            log_entry["error"] = error
+        if self.log:
+            self.log(log_entry)
+        return log_entry
+
+    def _dead_letter(self, notification, reason):
+        print(f"Giving up on {notification.message_type} notification after "
+              f"{notification.attempts} attempt(s): {reason}")
+        try:
+            self.dead_letters.append({
+                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "message_type": notification.message_type,
+                "url": notification.url,
+                "attempts": notification.attempts,
+                "reason": reason,
+                "payload": notification.payload,
+            })
+        except OSError as e:
+            print(f"Warning: Could not write dead-letter notification: {e}")
+
+    def _deliver(self, notification):
+        notification.attempts += 1
+        response = None
+        error = None
+        try:
+            # Retries are handled here so Discord's own limits are honoured
+            response = http_client.post(notification.url, json=notification.payload,
+                                        timeout=self.timeout, retries=0)
+        except requests.RequestException as e:
+            error = str(e)
+
+        retry_after = None
+        if response is not None:
+            self._observe_rate_limit(response)
+            if response.ok:
+                print(f"Discord {notification.message_type} notification sent successfully")
+                self._record(notification, "success", response)
+                return
+            if response.status_code == 429:
+                retry_after = _discord_retry_after(response)
+            elif response.status_code < 500:
+                # Bad payload or a deleted webhook; retrying will not help
+                self._record(notification, "failed", response)
+                self._dead_letter(notification, f"HTTP {response.status_code}: {response.text[:200]}")
+                return
+            error = f"HTTP {response.status_code}"
+
+        if notification.attempts >= self.max_attempts:
+            self._record(notification, "failed" if response is not None else "error", response, error)
+            self._dead_letter(notification, error)
+            return
+
+        if retry_after is not None:
+            delay = min(self.backoff_max, retry_after)
+            with self._cond:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** notification.attempts)))
+        print(f"Discord {notification.message_type} notification failed ({error}), retrying in {delay:.1f}s")
+        notification.not_before = time.monotonic() + delay
+        with self._cond:
+            self._queue.appendleft(notification)
@@ -0,0 +1,174 @@
+"""
+Per-host token buckets with exponential backoff on 429/503 responses
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 120.0
+
+RETRY_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket; reserve() hands out future tokens so waiters queue fairly"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(max(1, burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, burst):
+        """Change the rate and burst, keeping the tokens already earned (up to the new burst)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = float(rate)
+            self.burst = float(max(1, burst))
+            self._tokens = min(self._tokens, self.burst)
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Shared per-host limiter used by every outbound request, from any thread"""
+
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX, hosts=None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hosts = hosts or {}
+        self._buckets = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _settings_from_config(config):
+        limit_config = (config or {}).get('rate_limit', {}) or {}
+        requests_per_second = limit_config.get('requests_per_second')
+        if requests_per_second is None:
+            # The old top-level 'host_delay' (seconds between requests to a host) still sets the pace
+            host_delay = (config or {}).get('host_delay')
+            if host_delay is None:
+                requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+            else:
+                requests_per_second = 1.0 / host_delay if host_delay > 0 else 0
+        return {
+            'requests_per_second': requests_per_second,
+            'burst': limit_config.get('burst', DEFAULT_BURST),
+            'max_retries': limit_config.get('max_retries', DEFAULT_MAX_RETRIES),
+            'backoff_base': limit_config.get('backoff_base', DEFAULT_BACKOFF_BASE),
+            'backoff_max': limit_config.get('backoff_max', DEFAULT_BACKOFF_MAX),
+            'hosts': limit_config.get('hosts'),
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a limiter from the optional 'rate_limit' config section"""
+        return cls(**cls._settings_from_config(config))
+
+    def reconfigure(self, config):
+        """Apply a changed 'rate_limit' section in place.
+
+        Existing buckets keep their tokens and hosts stay blocked until
+        their backoff runs out, so a config save during a 429 backoff does
+        not start hammering the host again.
+        """
+        settings = self._settings_from_config(config)
+        with self._lock:
+            self.requests_per_second = settings['requests_per_second']
+            self.burst = settings['burst']
+            self.max_retries = settings['max_retries']
+            self.backoff_base = settings['backoff_base']
+            self.backoff_max = settings['backoff_max']
+            self.hosts = settings['hosts'] or {}
+            for host, bucket in self._buckets.items():
+                bucket.set_rate(*self._host_rate(host))
+
+    def _host_rate(self, host):
+        host_config = self.hosts.get(host) or {}
+        return (host_config.get('requests_per_second', self.requests_per_second),
+                host_config.get('burst', self.burst))
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(*self._host_rate(host))
+            return bucket
+
+    def acquire(self, host):
+        """Block until a request to host is allowed"""
+        wait = self._bucket(host).reserve()
+        with self._lock:
+            blocked = self._blocked_until.get(host, 0.0) - time.monotonic()
+        wait = max(wait, blocked)
+        if wait > 0:
+            time.sleep(wait)
+
+    def backoff(self, host, attempt, retry_after=None):
+        """Pause all requests to host after a throttling response and return the delay.
+
+        Retry-After wins when the server sends it; otherwise the delay is
+        exponential in the attempt number with full jitter.
+        """
+        if retry_after is not None:
+            delay = min(self.backoff_max, retry_after)
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        with self._lock:
+            until = time.monotonic() + delay
+            self._blocked_until[host] = max(self._blocked_until.get(host, 0.0), until)
+        return delay
+
+
+_limiter = RateLimiter()
+_limiter_lock = threading.Lock()
+
+
+def configure(config):
+    """Apply the config to the shared limiter, keeping its token and backoff state"""
+    with _limiter_lock:
+        _limiter.reconfigure(config)
+
+
+def get_limiter():
+    return _limiter
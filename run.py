@@ -1,20 +1,63 @@
 #!/usr/bin/env python3
 """
 Production runner for CEX Stock Checker web application using Gunicorn
+
+Starts one supervised checker service (checker_service.py) next to the
+Gunicorn workers, so the check loop runs once however many workers serve
+the web UI.
 """
 
 import os
+import sys
+import signal
+import subprocess
+import threading
 import multiprocessing
 
+RESTART_DELAY = 5  # Seconds before restarting a checker service that exited
+THREADS_PER_WORKER = 8  # Each open dashboard holds one thread for its /api/events stream
+
 def number_of_workers():
     return (multiprocessing.cpu_count() * 2) + 1
 
+def supervise_checker(stop_event):
+    """Keep one checker service running until stop_event is set"""
+    while not stop_event.is_set():
+        process = subprocess.Popen([sys.executable, 'checker_service.py'])
+        print(f"Checker service started with pid {process.pid}")
+        while process.poll() is None:
+            if stop_event.wait(1):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                return
+        print(f"Checker service exited with code {process.returncode}, restarting in {RESTART_DELAY} seconds")
+        stop_event.wait(RESTART_DELAY)
+
 if __name__ == '__main__':
     # Set up Gunicorn configuration
     workers = number_of_workers()
     port = os.environ.get('PORT', '5000')
-    
+
+    # Workers control the checker service instead of running their own loop
+    os.environ['CHECKER_SERVICE'] = '1'
+    stop_event = threading.Event()
+    supervisor = threading.Thread(target=supervise_checker, args=(stop_event,), name="CheckerSupervisor")
+    supervisor.start()
+
     # Run with Gunicorn for production
-    cmd = f"gunicorn --workers {workers} --bind 0.0.0.0:{port} --timeout 120 app:app"
+    cmd = (f"gunicorn --workers {workers} --worker-class gthread --threads {THREADS_PER_WORKER} "
+           f"--bind 0.0.0.0:{port} --timeout 120 app:app")
     print(f"Starting CEX Stock Checker with command: {cmd}")
-    os.system(cmd)
\ No newline at end of file
+    gunicorn = subprocess.Popen(cmd.split())
+    signal.signal(signal.SIGTERM, lambda signum, frame: gunicorn.terminate())
+    try:
+        gunicorn.wait()
+    except KeyboardInterrupt:
+        gunicorn.terminate()
+        gunicorn.wait()
+    finally:
+        stop_event.set()
+        supervisor.join()
@@ -0,0 +1,202 @@
+"""
+Priority-queue scheduler giving every item its own adaptive next-due time
+"""
+
+import heapq
+import random
+import threading
+import time
+from collections import deque
+from check_result import StockStatus
+
+DEFAULT_MIN_INTERVAL = 300          # 5 minutes
+DEFAULT_MAX_INTERVAL = 6 * 3600     # 6 hours
+DEFAULT_JITTER = 0.1                # +/- 10% of the interval
+DEFAULT_BATCH_WINDOW = 60           # Check items due within this many seconds together
+RATE_WINDOW = 60                    # max_checks_per_minute is enforced over this window
+
+SPEED_UP = 0.5      # Interval multiplier after a status change
+SLOW_DOWN = 1.5     # Interval multiplier after an unchanged result
+
+
+class ItemSchedule:
+    """Scheduling state for one item"""
+
+    __slots__ = ('item_id', 'interval', 'min_interval', 'max_interval', 'fixed', 'next_due',
+                 'last_status', 'changes')
+
+    def __init__(self, item_id, interval, min_interval, max_interval, fixed):
+        self.item_id = item_id
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fixed = fixed
+        self.next_due = 0.0
+        self.last_status = None
+        self.changes = 0
+
+
+class AdaptiveScheduler:
+    """Heap of (next_due, item_id) entries with per-item intervals that adapt to status changes.
+
+    Items whose status keeps changing are checked more often (down to
+    min_interval); items that stay the same back off towards max_interval.
+    A global max_checks_per_minute ceiling still holds on top of that.
+    """
+
+    def __init__(self, base_interval, adaptive=False, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, jitter=None, max_checks_per_minute=None,
+                 batch_window=DEFAULT_BATCH_WINDOW, overrides=None):
+        self.base_interval = base_interval
+        self.adaptive = adaptive
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        # Without adaptation every item keeps the same due time, like a fixed cycle
+        self.jitter = (DEFAULT_JITTER if adaptive else 0.0) if jitter is None else jitter
+        self.max_checks_per_minute = max_checks_per_minute
+        self.batch_window = batch_window if adaptive else 0
+        self.overrides = overrides or {}
+        self._items = {}
+        self._heap = []
+        self._dispatched = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a scheduler from request_delay and the optional 'schedule' config section"""
+        schedule_config = config.get('schedule', {}) or {}
+        return cls(
+            base_interval=config.get('request_delay', 1800),
+            adaptive=schedule_config.get('adaptive', False),
+            min_interval=schedule_config.get('min_interval', DEFAULT_MIN_INTERVAL),
+            max_interval=schedule_config.get('max_interval', DEFAULT_MAX_INTERVAL),
+            jitter=schedule_config.get('jitter'),
+            max_checks_per_minute=schedule_config.get('max_checks_per_minute'),
+            batch_window=schedule_config.get('batch_window', DEFAULT_BATCH_WINDOW),
+            overrides=schedule_config.get('overrides'),
+        )
+
+    def _new_item(self, item_id):
+        override = self.overrides.get(item_id) or {}
+        if 'interval' in override:
+            interval = override['interval']
+            return ItemSchedule(item_id, interval, interval, interval, fixed=True)
+        return ItemSchedule(item_id, self.base_interval,
+                            override.get('min_interval', self.min_interval),
+                            override.get('max_interval', self.max_interval),
+                            fixed=not self.adaptive)
+
+    def sync_items(self, items, now=None):
+        """Track newly added items (due immediately) and forget removed ones"""
+        now = time.time() if now is None else now
+        with self._lock:
+            wanted = set(items)
+            for item_id in list(self._items):
+                if item_id not in wanted:
+                    del self._items[item_id]  # Its heap entry is dropped lazily
+            for item_id in items:
+                if item_id not in self._items:
+                    schedule = self._items[item_id] = self._new_item(item_id)
+                    schedule.next_due = now
+                    heapq.heappush(self._heap, (now, item_id))
+
+    def state(self):
+        """JSON-able {item_id: [next_due, interval, last_status, changes]} for restore()"""
+        with self._lock:
+            return {item_id: [schedule.next_due, schedule.interval,
+                              schedule.last_status.value if schedule.last_status is not None else None,
+                              schedule.changes]
+                    for item_id, schedule in self._items.items()}
+
+    def restore(self, state, now=None):
+        """Take saved due times and adapted intervals back for the items being tracked.
+
+        Due times are epoch seconds, so the schedule carries on from where it
+        was rather than from the restart. Items with a fixed interval keep the
+        configured one, and no item is left due later than one interval from now.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for item_id, (next_due, interval, last_status, changes) in state.items():
+                schedule = self._items.get(item_id)
+                if schedule is None:
+                    continue
+                if not schedule.fixed:
+                    schedule.interval = min(schedule.max_interval, max(schedule.min_interval, interval))
+                schedule.last_status = StockStatus(last_status) if last_status is not None else None
+                schedule.changes = changes
+                schedule.next_due = min(next_due, now + schedule.interval)
+                heapq.heappush(self._heap, (schedule.next_due, item_id))
+
+    def _rate_budget(self, now):
+        if not self.max_checks_per_minute:
+            return None
+        while self._dispatched and self._dispatched[0] <= now - RATE_WINDOW:
+            self._dispatched.popleft()
+        return max(0, int(self.max_checks_per_minute) - len(self._dispatched))
+
+    def pop_due(self, now=None):
+        """Remove and return the items that are due, within the rate ceiling"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            budget = self._rate_budget(now)
+            while self._heap and self._heap[0][0] <= now + self.batch_window:
+                if budget is not None and len(due) >= budget:
+                    break
+                next_due, item_id = heapq.heappop(self._heap)
+                schedule = self._items.get(item_id)
+                if schedule is None or schedule.next_due != next_due:
+                    continue  # Removed or rescheduled since this entry was pushed
+                due.append(item_id)
+            if self.max_checks_per_minute:
+                self._dispatched.extend([now] * len(due))
+        return due
+
+    def record_result(self, item_id, status, now=None):
+        """Reschedule an item after its check, adapting the interval to whether its status changed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            schedule = self._items.get(item_id)
+            if schedule is None:
+                return None
+            if status is not None:
+                if schedule.last_status is not None and status != schedule.last_status:
+                    schedule.changes += 1
+                    if not schedule.fixed:
+                        schedule.interval = max(schedule.min_interval, schedule.interval * SPEED_UP)
+                elif schedule.last_status is not None and not schedule.fixed:
+                    schedule.interval = min(schedule.max_interval, schedule.interval * SLOW_DOWN)
+                schedule.last_status = status
+
+            jitter = random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+            schedule.next_due = now + schedule.interval * (1 + jitter)
+            heapq.heappush(self._heap, (schedule.next_due, item_id))
+            return schedule.next_due
+
+    def next_due_time(self):
+        """Epoch time of the earliest scheduled check, or None"""
+        with self._lock:
+            while self._heap:
+                next_due, item_id = self._heap[0]
+                schedule = self._items.get(item_id)
+                if schedule is not None and schedule.next_due == next_due:
+                    return next_due
+                heapq.heappop(self._heap)
+            return None
+
+    def seconds_until_next(self, now=None):
+        """Seconds to sleep before pop_due() can return something"""
+        now = time.time() if now is None else now
+        next_due = self.next_due_time()
+        if next_due is None:
+            return self.base_interval
+        wait = next_due - self.batch_window - now
+        with self._lock:
+            if self._rate_budget(now) == 0:
+                wait = max(wait, self._dispatched[0] + RATE_WINDOW - now)
+        return max(0.0, wait)
+
+    def interval_of(self, item_id):
+        schedule = self._items.get(item_id)
+        return schedule.interval if schedule else None
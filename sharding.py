@@ -0,0 +1,262 @@
+"""
+Split the watchlist across several checker processes that share one working directory
+
+Each node registers in a small SQLite database (SHARDS_DB) and renews its
+lease from a background thread. Items are assigned with a consistent hash
+ring over the live nodes, so when a node joins or its lease runs out only
+the items on its share of the ring move. Results already merge through the
+shared history database, time series and status snapshot; notifications
+merge through an outbox in the same database that the leader (the longest
+running node) drains into one message per cycle.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from check_result import CheckResult
+from transitions import Transition
+
+SHARDS_DB = os.getenv('SHARDS_DB', "shards.db")
+DEFAULT_LEASE_SECONDS = 60
+VIRTUAL_NODES = 64  # Points per node on the ring; more points spread items more evenly
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    joined_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    pid INTEGER,
+    host TEXT
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    results TEXT NOT NULL,
+    transitions TEXT NOT NULL
+);
+"""
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping item IDs to node IDs"""
+
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((_hash(f"{node}#{index}"), node) for node in nodes for index in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        """The node that owns key, or None for an empty ring"""
+        if not self._nodes:
+            return None
+        index = bisect_right(self._hashes, _hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class NodeIdInUse(RuntimeError):
+    """Another running checker holds a current lease under this node ID"""
+
+
+def _process_alive(pid):
+    """Whether pid is a running process on this host (a crashed node's pid is not)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):
+        return True  # Exists but not ours, or no pid recorded
+    return True
+
+
+def _transition_to_dict(transition):
+    return {'kind': transition.kind, 'result': transition.result.to_dict(),
+            'previous_price': transition.previous_price}
+
+
+def _transition_from_dict(record):
+    return Transition(record['kind'], CheckResult.from_dict(record['result']), record['previous_price'])
+
+
+class ShardCoordinator:
+    """This process's membership in the shared node table"""
+
+    def __init__(self, path=SHARDS_DB, node_id=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        # Stable across restarts, so a restarted node takes back its items and its checkpoint
+        self.node_id = node_id or os.getenv('CHECKER_NODE_ID') or socket.gethostname()
+        self.host = socket.gethostname()
+        self.lease_seconds = float(lease_seconds)
+        self.members = []
+        self.owned = 0
+        self._ring = HashRing([])
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(nodes)")]
+            for column, column_type in (('pid', 'INTEGER'), ('host', 'TEXT')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE nodes ADD COLUMN {column} {column_type}")
+
+    @classmethod
+    def from_config(cls, config):
+        """A coordinator for the optional 'sharding' config section, or None when sharding is off"""
+        shard_config = (config or {}).get('sharding', {}) or {}
+        if not shard_config.get('enabled'):
+            return None
+        return cls(path=shard_config.get('db') or SHARDS_DB,
+                   node_id=shard_config.get('node_id') or None,
+                   lease_seconds=shard_config.get('lease_seconds', DEFAULT_LEASE_SECONDS))
+
+    def join(self):
+        """Register this node and keep its lease renewed until leave().
+
+        Raises NodeIdInUse if another running checker holds a current lease
+        under the same node ID; sharing one would make both check every
+        item and write the same checkpoint. The lease of a checker that
+        crashed on this host is taken over straight away.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # Check and claim in one transaction, so two checkers starting together cannot both win
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT pid, host, heartbeat_at FROM nodes WHERE node_id = ?",
+                                     (self.node_id,)).fetchone()
+            if row and row[2] >= now - self.lease_seconds and not self._is_own_lease(row[0], row[1]):
+                where = f"process {row[0]}" if row[1] == self.host else f"host {row[1] or 'unknown'}"
+                raise NodeIdInUse(f"Node ID {self.node_id} is in use by {where}; give each checker "
+                                  f"its own CHECKER_NODE_ID (or sharding.node_id)")
+            self._upsert(now)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._renew, daemon=True, name="ShardLease")
+        self._thread.start()
+        # A node that exits without leaving would hold its items until the lease runs out
+        atexit.register(self.leave)
+        print(f"[SHARD] Node {self.node_id} joined ({self.lease_seconds:g}s lease, {self.path})")
+
+    def leave(self):
+        """Drop this node's row so the others take over its items on their next pass"""
+        self._stopped.set()
+        atexit.unregister(self.leave)
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+        except sqlite3.Error as e:
+            print(f"[SHARD] Warning: Could not leave cleanly, the lease will run out instead: {e}")
+            return
+        print(f"[SHARD] Node {self.node_id} left")
+
+    def _renew(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                print(f"[SHARD] Warning: Could not renew lease: {e}")
+
+    def _is_own_lease(self, pid, host):
+        """A lease this process may take: its own, or one left by a checker on this host that is gone"""
+        return host in (None, self.host) and (pid == os.getpid() or not _process_alive(pid))
+
+    def _upsert(self, now):
+        self._conn.execute(
+            "INSERT INTO nodes (node_id, joined_at, heartbeat_at, pid, host) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(node_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at, pid = excluded.pid, "
+            "host = excluded.host",
+            (self.node_id, now, now, os.getpid(), self.host))
+        self._conn.execute("DELETE FROM nodes WHERE heartbeat_at < ?", (now - self.lease_seconds,))
+
+    def heartbeat(self, now=None):
+        """Renew this node's lease and forget nodes whose lease ran out"""
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._upsert(now)
+
+    def live_members(self, now=None):
+        """Node IDs with a current lease, longest running first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT node_id FROM nodes WHERE heartbeat_at >= ? ORDER BY joined_at, node_id",
+                (now - self.lease_seconds,)).fetchall()
+        return [node_id for node_id, in rows]
+
+    def assign(self, items):
+        """Return the items this node should check, rebuilding the ring if membership changed"""
+        members = self.live_members()
+        if self.node_id not in members:
+            # Our lease lapsed (the process was paused or the database was locked); take it back
+            self.heartbeat()
+            members = self.live_members()
+        if members != self.members:
+            print(f"[SHARD] Members changed: {', '.join(self.members) or 'none'} -> {', '.join(members)}")
+            self.members = members
+            self._ring = HashRing(members)
+        owned = [item_id for item_id in items if self._ring.owner(item_id) == self.node_id]
+        if len(owned) != self.owned:
+            print(f"[SHARD] Node {self.node_id} now checks {len(owned)} of {len(items)} item(s)")
+        self.owned = len(owned)
+        return owned
+
+    def is_leader(self):
+        """The longest running live node sends the merged notifications"""
+        return bool(self.members) and self.members[0] == self.node_id
+
+    def push_results(self, check_summary, transitions):
+        """Hand a cycle's results to the leader for its next notification"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO outbox (node_id, created_at, results, transitions) VALUES (?, ?, ?, ?)",
+                (self.node_id, time.time(), json.dumps([result.to_dict() for result in check_summary]),
+                 json.dumps([_transition_to_dict(transition) for transition in transitions])))
+
+    def drain_results(self):
+        """Take every result the other nodes pushed, oldest first, as (check_summary, transitions)"""
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, results, transitions FROM outbox ORDER BY id").fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+        check_summary = []
+        transitions = []
+        for _, results, pushed_transitions in rows:
+            check_summary.extend(CheckResult.from_dict(record) for record in json.loads(results))
+            transitions.extend(_transition_from_dict(record) for record in json.loads(pushed_transitions))
+        return check_summary, transitions
+
+    def merge_results(self, check_summary, transitions):
+        """Combine this node's cycle with what the others pushed since the last one.
+
+        Returns (check_summary, transitions) to notify about on the leader,
+        or None on other nodes, which push their results instead.
+        """
+        if not self.is_leader():
+            if check_summary or transitions:
+                self.push_results(check_summary, transitions)
+            return None
+        other_summary, other_transitions = self.drain_results()
+        # A node that cycled more than once since the last drain reports only its newest result per check
+        latest = {}
+        for result in other_summary + list(check_summary):
+            latest[(result.product_id, result.store_id)] = result
+        return list(latest.values()), other_transitions + list(transitions)
+
+    def status(self):
+        return {
+            'node_id': self.node_id,
+            'members': list(self.members),
+            'leader': self.is_leader(),
+            'owned_items': self.owned,
+        }
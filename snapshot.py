@@ -0,0 +1,152 @@
+"""
+Status snapshot published by the checker after each cycle and served by the dashboard
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import events
+
+STATUS_SNAPSHOT_FILE = "status_snapshot.json"
+
+_snapshot = None
+_snapshot_mtime = None
+_lock = threading.Lock()
+
+
+def _empty_snapshot():
+    return {'updated_at': None, 'check_count': 0, 'next_check_time': None, 'products': {}}
+
+
+@contextmanager
+def _exclusive():
+    """Serialize read-merge-write updates across processes (sharded checker nodes, web workers)"""
+    with open(f"{STATUS_SNAPSHOT_FILE}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _write_snapshot(snapshot):
+    tmp_file = f"{STATUS_SNAPSHOT_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_file, STATUS_SNAPSHOT_FILE)
+    return os.stat(STATUS_SNAPSHOT_FILE).st_mtime
+
+
+def _publish_status_changes(previous_products, entries):
+    """Push an item_status event for each product whose stock status differs from the last snapshot"""
+    for entry in entries:
+        previous = previous_products.get(entry['id'])
+        if previous and previous.get('in_stock') == entry['in_stock']:
+            continue
+        events.publish('item_status', {
+            'id': entry['id'],
+            'name': entry['name'],
+            'in_stock': entry['in_stock'],
+            'was_in_stock': previous.get('in_stock') if previous else None,
+            'checked_at': entry['checked_at'],
+        })
+
+
+def product_entry(result):
+    """Build the per-product record the dashboard renders from a CheckResult"""
+    return {
+        'id': result.product_id,
+        'name': result.name,
+        'in_stock': result.in_stock,
+        'price': result.sell_price,
+        'stock_history': result.stock_history,
+        'checked_at': result.checked_at,
+        'stores': result.stores,
+    }
+
+
+def load_snapshot():
+    """Return the latest snapshot, re-reading the file only if another process replaced it"""
+    global _snapshot, _snapshot_mtime
+    with _lock:
+        try:
+            mtime = os.stat(STATUS_SNAPSHOT_FILE).st_mtime
+        except FileNotFoundError:
+            return _snapshot or _empty_snapshot()
+        if _snapshot is None or mtime != _snapshot_mtime:
+            try:
+                with open(STATUS_SNAPSHOT_FILE, 'r') as f:
+                    _snapshot = json.load(f)
+                _snapshot_mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read status snapshot: {e}")
+                return _snapshot or _empty_snapshot()
+        return _snapshot
+
+
+def publish_snapshot(check_summary, check_count=None, next_check_time=None, store_matrix=None,
+                     cycle_stats=None):
+    """Merge the results of a finished check cycle into the snapshot"""
+    global _snapshot, _snapshot_mtime
+    with _exclusive():
+        previous_snapshot = load_snapshot()
+        products = {}
+        for result in check_summary:
+            entry = product_entry(result)
+            previous = products.get(entry['id'])
+            # With store_ids a product appears once per store; it is in stock if any store has it
+            if previous:
+                entry['in_stock'] = entry['in_stock'] or previous['in_stock']
+            products[entry['id']] = entry
+
+        # A cycle may only cover the items that were due, so keep the others' last results
+        merged_products = dict(previous_snapshot.get('products', {}))
+        _publish_status_changes(merged_products, products.values())
+        merged_products.update(products)
+
+        merged_matrix = previous_snapshot.get('store_matrix')
+        if store_matrix:
+            merged_matrix = {
+                'stores': dict((merged_matrix or {}).get('stores', {}), **store_matrix['stores']),
+                'items': dict((merged_matrix or {}).get('items', {}), **store_matrix['items']),
+            }
+
+        snapshot = {
+            'updated_at': time.time(),
+            'check_count': check_count,
+            'next_check_time': next_check_time,
+            'products': merged_products,
+            'store_matrix': merged_matrix,
+            'cycle_stats': cycle_stats,
+        }
+        with _lock:
+            _snapshot = snapshot
+            try:
+                _snapshot_mtime = _write_snapshot(snapshot)
+            except OSError as e:
+                print(f"Warning: Could not save status snapshot: {e}")
+        return snapshot
+
+
+def update_product(entry):
+    """Merge a single live-refreshed product into the snapshot"""
+    global _snapshot, _snapshot_mtime
+    with _exclusive():
+        snapshot = dict(load_snapshot())
+        _publish_status_changes(snapshot.get('products', {}), [entry])
+        with _lock:
+            snapshot['products'] = dict(snapshot.get('products', {}))
+            snapshot['products'][entry['id']] = entry
+            _snapshot = snapshot
+            try:
+                _snapshot_mtime = _write_snapshot(snapshot)
+            except OSError as e:
+                print(f"Warning: Could not save status snapshot: {e}")
+        return snapshot
+
+
+def snapshot_age(snapshot):
+    """Seconds since the snapshot was last updated, or None if it never was"""
+    if not snapshot.get('updated_at'):
+        return None
+    return max(0, int(time.time() - snapshot['updated_at']))
@@ -1,47 +1,70 @@
 import yaml
-import requests
+import http_client
+import debug_capture
+import events
+import metrics
 import os.path
 import sys
 from time import sleep
 from urllib.parse import quote_plus
 import re
 import json
-from bs4 import BeautifulSoup
 import time
+import threading
+import math
 from datetime import datetime
+from check_engine import CheckEngine
+from cycle_cache import CycleCache
+from change_tracker import get_change_tracker
+from scheduler import AdaptiveScheduler
+from load_stores import CEX_API_URL
+from store_availability import AvailabilityMatrix, fetch_store_availability, DEFAULT_LATITUDE, DEFAULT_LONGITUDE
+from snapshot import publish_snapshot, load_snapshot
+from history_store import get_history_store
+from timeseries import get_timeseries_store
+from jsonl_log import AppendLog
+from notifier import NotificationDispatcher, EXIT_FLUSH_TIMEOUT
+from transitions import diff_cycle, cycle_baseline, collapse_by_product, BACK_IN_STOCK, SOLD_OUT, PRICE_CHANGED
+from html_extract import extract_page_markers
+from metadata_cache import MetadataCache, STATIC_FIELDS, PRICE_FIELDS
+from check_result import CheckResult, StockStatus
+from sharding import ShardCoordinator, NodeIdInUse
+from checkpoint import CycleCheckpoint
 
 CONFIG_YAML = os.getenv('CUSTOM_CONFIG', "config/checker.yaml")
-STORES_YAML = "config/stores.yaml"
-STOCK_HISTORY_FILE = "stock_history.json"
-WEBHOOK_LOGS_FILE = "webhook_logs.json"
+WEBHOOK_LOGS_FILE = "webhook_logs.jsonl"
+LEGACY_WEBHOOK_LOGS_FILE = "webhook_logs.json"
 
-CEX_WEB_URL = "https://uk.webuy.com"
+webhook_log = AppendLog(WEBHOOK_LOGS_FILE)
+product_metadata = MetadataCache()
+
+# Rendered Discord fields keyed by everything they show, so unchanged items aren't re-rendered
+FIELD_CACHE_SIZE = 1000
+_field_cache = {}
+
+CEX_WEB_URL = os.getenv('CEX_WEB_URL', "https://uk.webuy.com")
 PRODUCT_URL = f"{CEX_WEB_URL}/product-detail"
 
+# 'api' fetches only the product detail JSON, 'full' also downloads and parses the HTML page
+CHECK_MODE_API = "api"
+CHECK_MODE_FULL = "full"
+
 def get_request(product_id, store_id=None):
     # Construct URL based on whether store_id is provided
     if store_id:
-        url = f"https://uk.webuy.com/product-detail?id={product_id}&storeId={store_id}"
+        url = f"{PRODUCT_URL}?id={product_id}&storeId={store_id}"
     else:
-        url = f"https://uk.webuy.com/product-detail?id={product_id}"
-
-    # Headers to simulate a browser request
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-    }
+        url = f"{PRODUCT_URL}?id={product_id}"
 
-    # Make the request
-    response = requests.get(url, headers=headers, allow_redirects=True)
+    # Make the request (browser-like headers come from the shared session)
+    response = http_client.get(url, allow_redirects=True)
     print(f"Making request to: {url}")
     print(f"Response status: {response.status_code}")
 
     # Check if we were redirected to the error page
     if response.url != url:
         print(f"Redirected to: {response.url}")
-        if "error" in response.url or response.url == "https://uk.webuy.com/error":
+        if "error" in response.url or response.url == f"{CEX_WEB_URL}/error":
             print("Product does not exist (redirected to error page)")
             return None
         elif "product-detail" not in response.url:
@@ -55,28 +78,20 @@ def get_request(product_id, store_id=None):
         print(f"Warning: Error decoding response: {e}")
         decoded_text = response.content.decode('utf-8', errors='ignore')
 
-    # Save response to debug file
-    debug_file = f"debug_{product_id}.html"
-    try:
-        with open(debug_file, 'w', encoding='utf-8') as f:
-            f.write(decoded_text)
-        print(f"Full response saved to {debug_file}\n")
-    except Exception as e:
-        print(f"Warning: Could not save debug file: {e}\n")
+    # Keep the raw response only when debug capture asks for it
+    capture = debug_capture.should_capture(product_id)
+    if capture:
+        debug_capture.save_artifact(product_id, "page", decoded_text, "html")
 
     # Try to get the product data from the API
-    api_url = f"https://wss2.cex.uk.webuy.io/v3/boxes/{product_id}/detail"
+    api_url = f"{CEX_API_URL}/v3/boxes/{product_id}/detail"
     try:
-        api_response = requests.get(api_url, headers=headers)
+        api_response = http_client.get(api_url)
         if api_response.status_code == 404:
             print("Product does not exist (API returned 404)")
             return None
-        elif api_response.status_code == 200:
-            # Save API response for debugging
-            api_file = f"debug_{product_id}_api.json"
-            with open(api_file, 'w', encoding='utf-8') as f:
-                f.write(api_response.text)
-            print(f"API response saved to {api_file}\n")
+        elif api_response.status_code == 200 and capture:
+            debug_capture.save_artifact(product_id, "api", api_response.text, "json")
     except Exception as e:
         print(f"Warning: Failed to check API: {e}\n")
 
@@ -93,54 +108,40 @@ def format_price(price_info):
     except:
         return "Price not available"
 
-def load_stock_history():
-    if os.path.exists(STOCK_HISTORY_FILE):
-        try:
-            with open(STOCK_HISTORY_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def load_stock_history(product_id=None):
+    """Return stock history from the SQLite store as {product_id: record}"""
+    return get_history_store().load_all(product_id)
 
 def save_stock_history(history):
-    with open(STOCK_HISTORY_FILE, 'w') as f:
-        json.dump(history, f, indent=2)
+    get_history_store().import_records(history)
 
 def update_stock_history(product_id, in_stock):
-    history = load_stock_history()
-    current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-    
-    if product_id not in history:
-        history[product_id] = {
-            'last_in_stock': None,
-            'last_check': current_time,
-            'times_in_stock': 0
-        }
-    
-    if in_stock:
-        history[product_id]['last_in_stock'] = current_time
-        history[product_id]['times_in_stock'] += 1
-    
-    history[product_id]['last_check'] = current_time
-    save_stock_history(history)
-    return history[product_id]
+    return get_history_store().record_check(product_id, in_stock)
 
-def load_webhook_logs():
-    if os.path.exists(WEBHOOK_LOGS_FILE):
-        try:
-            with open(WEBHOOK_LOGS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    return []
+def _migrate_legacy_webhook_logs():
+    """Move entries from the old webhook_logs.json array into the append-only log"""
+    if webhook_log.exists() or not os.path.exists(LEGACY_WEBHOOK_LOGS_FILE):
+        return
+    try:
+        with open(LEGACY_WEBHOOK_LOGS_FILE, 'r') as f:
+            legacy_logs = json.load(f)
+    except (OSError, ValueError):
+        legacy_logs = []
+    for log_entry in reversed(legacy_logs):  # Stored newest first
+        webhook_log.append(log_entry)
+    os.replace(LEGACY_WEBHOOK_LOGS_FILE, f"{LEGACY_WEBHOOK_LOGS_FILE}.migrated")
+
+def load_webhook_logs(limit=100):
+    """Return the most recent webhook log entries, newest first"""
+    _migrate_legacy_webhook_logs()
+    return webhook_log.tail(limit)
 
 def save_webhook_log(log_entry):
-    logs = load_webhook_logs()
-    logs.insert(0, log_entry)  # Add to beginning
-    # Keep only last 100 logs
-    logs = logs[:100]
-    with open(WEBHOOK_LOGS_FILE, 'w') as f:
-        json.dump(logs, f, indent=2)
+    _migrate_legacy_webhook_logs()
+    webhook_log.append(log_entry)
+    events.publish('webhook_log', log_entry)
+
+notifications = NotificationDispatcher(log=save_webhook_log)
 
 def get_embed_color(message_type, in_stock_count=0, total_items=0):
     """Get appropriate color for Discord embed based on context"""
@@ -155,17 +156,19 @@ def get_embed_color(message_type, in_stock_count=0, total_items=0):
             return 0x00ff00  # Green for all items in stock
         else:
             return 0xffa500  # Orange for some items in stock
+    elif message_type == "stock_changes":
+        return 0x00ff00 if in_stock_count else 0xffa500  # Green when something came back in stock
     return 0x7289da  # Discord default blue
 
-def format_price_info(product_info):
+def format_price_info(result):
     """Format price information for Discord display"""
-    if not product_info:
+    if not result:
         return "Price information unavailable"
     
     try:
-        sell_price = product_info.get('sellPrice')
-        buy_price = product_info.get('cashPrice') 
-        exchange_price = product_info.get('exchangePrice')
+        sell_price = result.sell_price
+        buy_price = result.cash_price
+        exchange_price = result.exchange_price
         
         price_parts = []
         if sell_price and sell_price > 0:
@@ -179,134 +182,211 @@ def format_price_info(product_info):
     except:
         return "Price information unavailable"
 
-def send_discord_webhook(config, message_type="check_result", product_summaries=None, custom_message=None):
-    """Send enhanced notification via Discord webhook with images and styling"""
-    if not config.get('discord_enabled'):
-        return False
-        
-    discord_config = config.get('discord', {})
-    webhook_url = discord_config.get('webhook_url')
+def _field_cache_key(result):
+    """Everything a product's embed field is rendered from"""
+    stores = tuple((store['storeId'], store['quantity']) for store in result.stores or [])
+    history = result.stock_history or {}
+    return (result.product_id, result.name, result.status,
+            result.sell_price, result.cash_price, result.exchange_price,
+            history.get('last_in_stock'), history.get('times_in_stock'), stores)
+
+def build_product_field(result):
+    """Render one product's embed field, reusing the last rendering if nothing it shows has changed"""
+    cache_key = _field_cache_key(result)
+    cached = _field_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
     
-    if not webhook_url:
-        print("Warning: Discord webhook URL not configured")
-        return False
+    product_name = result.name or 'Unknown Product'
+    product_id = result.product_id or 'Unknown ID'
+    stock_history = result.stock_history
+    product_url = f"https://uk.webuy.com/product-detail?id={product_id}"
     
-    try:
-        # Count in-stock items for color determination
-        in_stock_count = 0
-        total_items = 0
-        if product_summaries:
-            in_stock_count = sum(1 for _, status, _, _ in product_summaries if status == "IN STOCK")
-            total_items = len(product_summaries)
+    # Enhanced status indicators
+    if result.in_stock:
+        status_emoji = "✅"
+        status_indicator = "**🔥 AVAILABLE NOW**"
+    else:
+        status_emoji = "❌"
+        status_indicator = "*Out of Stock*"
+    
+    # Build field value with enhanced formatting
+    field_value = f"{status_emoji} {status_indicator}\n"
+    
+    # Add price information if available
+    price_info = format_price_info(result)
+    if price_info != "Price information unavailable":
+        field_value += f"{price_info}\n"
+    
+    field_value += f"🏷️ `{product_id}`\n"
+    
+    # Stores holding the product (store availability mode)
+    store_availability = result.stores
+    if store_availability:
+        stores_text = ", ".join(f"{store['storeName']} ({store['quantity']})"
+                                for store in store_availability[:3])
+        if len(store_availability) > 3:
+            stores_text += f" +{len(store_availability) - 3} more"
+        field_value += f"📍 In store: {stores_text}\n"
+    
+    # Stock history with better formatting
+    if stock_history:
+        last_in_stock = stock_history.get('last_in_stock', 'Never')
+        times_in_stock = stock_history.get('times_in_stock', 0)
+        
+        if last_in_stock != 'Never':
+            field_value += f"🕰️ Last seen: {last_in_stock}\n"
         
-        embed = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "footer": {
-                "text": "CEX Stock Checker - Powered by uk.webuy.com",
-                "icon_url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png"
-            },
-            "color": get_embed_color(message_type, in_stock_count, total_items),
-            "thumbnail": {
-                "url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png"
-            }
+        if times_in_stock > 0:
+            field_value += f"📊 Times available: {times_in_stock}\n"
+    
+    field_value += f"\n[🔗 **View on CEX**]({product_url})"
+    
+    # Truncate product name if too long
+    display_name = product_name[:40] + "..." if len(product_name) > 40 else product_name
+    
+    field = {
+        "name": f"{status_emoji} {display_name}",
+        "value": field_value,
+        "inline": True
+    }
+    if len(_field_cache) >= FIELD_CACHE_SIZE:
+        _field_cache.clear()
+    _field_cache[cache_key] = field
+    return field
+
+TRANSITION_LABELS = {
+    BACK_IN_STOCK: "📈 **Back in stock**",
+    SOLD_OUT: "📉 **Sold out**",
+    PRICE_CHANGED: "💷 **Price changed**",
+}
+TRANSITION_ORDER = {BACK_IN_STOCK: 0, PRICE_CHANGED: 1, SOLD_OUT: 2}
+
+def build_transition_field(transition):
+    """Render a changed product's embed field, headed by what changed"""
+    field = build_product_field(transition.result)
+    label = TRANSITION_LABELS[transition.kind]
+    if transition.previous_price is not None and transition.price is not None \
+            and transition.previous_price != transition.price:
+        label += f" £{transition.previous_price} → £{transition.price}"
+    return dict(field, value=f"{label}\n{field['value']}")
+
+def build_discord_payload(message_type="check_result", product_summaries=None, custom_message=None,
+                          transitions=None):
+    """Build the Discord webhook payload with images and styling"""
+    # Count in-stock items for color determination
+    in_stock_count = 0
+    total_items = 0
+    if product_summaries:
+        in_stock_count = sum(1 for result in product_summaries if result.in_stock)
+        total_items = len(product_summaries)
+    if transitions:
+        in_stock_count = sum(1 for transition in transitions if transition.kind == BACK_IN_STOCK)
+        total_items = len(transitions)
+    
+    embed = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "footer": {
+            "text": "CEX Stock Checker - Powered by uk.webuy.com",
+            "icon_url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png"
+        },
+        "color": get_embed_color(message_type, in_stock_count, total_items),
+        "thumbnail": {
+            "url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png"
         }
+    }
+    
+    if message_type == "start":
+        embed["title"] = "🟢 CEX Stock Checker Started"
+        embed["description"] = f"✨ **Stock monitoring is now active!**\n\n{custom_message or 'Ready to monitor your favorite CEX products'}"
+    elif message_type == "stop":
+        embed["title"] = "🔴 CEX Stock Checker Stopped"
+        embed["description"] = f"⏹️ **Stock monitoring has been paused**\n\n{custom_message or 'Stock checker has been stopped'}"
+    elif message_type == "check_result":
+        # Create title with emojis based on stock status
+        if in_stock_count == 0:
+            title_emoji = "🚫"
+            status_text = "No Items in Stock"
+        elif in_stock_count == total_items:
+            title_emoji = "🎉"
+            status_text = "All Items in Stock!"
+        else:
+            title_emoji = "🟡"
+            status_text = "Some Items Available"
         
-        if message_type == "start":
-            embed["title"] = "🟢 CEX Stock Checker Started"
-            embed["description"] = f"✨ **Stock monitoring is now active!**\n\n{custom_message or 'Ready to monitor your favorite CEX products'}"
-        elif message_type == "stop":
-            embed["title"] = "🔴 CEX Stock Checker Stopped"
-            embed["description"] = f"⏹️ **Stock monitoring has been paused**\n\n{custom_message or 'Stock checker has been stopped'}"
-        elif message_type == "check_result":
-            # Create title with emojis based on stock status
-            if in_stock_count == 0:
-                title_emoji = "🚫"
-                status_text = "No Items in Stock"
-            elif in_stock_count == total_items:
-                title_emoji = "🎉"
-                status_text = "All Items in Stock!"
-            else:
-                title_emoji = "🟡"
-                status_text = "Some Items Available"
-            
-            embed["title"] = f"{title_emoji} Stock Check Complete - {in_stock_count}/{total_items} {status_text}"
-            
-            if custom_message:
-                embed["description"] = f"📅 {custom_message}"
+        embed["title"] = f"{title_emoji} Stock Check Complete - {in_stock_count}/{total_items} {status_text}"
         
-        # Add product information if available
-        if product_summaries and message_type == "check_result":
-            fields = []
-            
-            # Sort products: in-stock items first
-            sorted_products = sorted(product_summaries, 
-                                   key=lambda x: (x[1] != "IN STOCK", x[0].get('boxName', '')))
-            
-            for i, (product_info, status, check_time, stock_history) in enumerate(sorted_products[:8]):  # Limit to 8 for better display
-                product_name = product_info.get('boxName', 'Unknown Product')
-                product_id = product_info.get('boxId', 'Unknown ID')
-                product_url = f"https://uk.webuy.com/product-detail?id={product_id}"
-                
-                # Enhanced status indicators
-                if status == "IN STOCK":
-                    status_emoji = "✅"
-                    status_indicator = "**🔥 AVAILABLE NOW**"
-                else:
-                    status_emoji = "❌"
-                    status_indicator = "*Out of Stock*"
-                
-                # Build field value with enhanced formatting
-                field_value = f"{status_emoji} {status_indicator}\n"
-                
-                # Add price information if available
-                price_info = format_price_info(product_info)
-                if price_info != "Price information unavailable":
-                    field_value += f"{price_info}\n"
-                
-                field_value += f"🏷️ `{product_id}`\n"
-                
-                # Stock history with better formatting
-                if stock_history:
-                    last_in_stock = stock_history.get('last_in_stock', 'Never')
-                    times_in_stock = stock_history.get('times_in_stock', 0)
-                    
-                    if last_in_stock != 'Never':
-                        field_value += f"🕰️ Last seen: {last_in_stock}\n"
-                    
-                    if times_in_stock > 0:
-                        field_value += f"📊 Times available: {times_in_stock}\n"
-                
-                field_value += f"\n[🔗 **View on CEX**]({product_url})"
-                
-                # Truncate product name if too long
-                display_name = product_name[:40] + "..." if len(product_name) > 40 else product_name
-                
-                fields.append({
-                    "name": f"{status_emoji} {display_name}",
-                    "value": field_value,
-                    "inline": True
-                })
-            
-            embed["fields"] = fields
-            
-            # Add summary field if there are more items than displayed
-            if len(product_summaries) > 8:
-                remaining = len(product_summaries) - 8
-                embed["fields"].append({
-                    "name": "📝 Summary",
-                    "value": f"Showing 8 of {len(product_summaries)} products\n{remaining} additional item(s) monitored\n\n🔄 Refresh for latest status",
-                    "inline": False
-                })
+        if custom_message:
+            embed["description"] = f"📅 {custom_message}"
+    elif message_type == "stock_changes":
+        embed["title"] = f"🔔 {total_items} Stock Change(s)"
+        if in_stock_count:
+            embed["title"] += f" - {in_stock_count} Back in Stock!"
         
-        payload = {
-            "embeds": [embed],
-            "username": "CEX Stock Monitor",
-            "avatar_url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png",
-            "content": None  # We use embeds exclusively for rich formatting
-        }
+        if custom_message:
+            embed["description"] = f"📅 {custom_message}"
+    
+    # Add product information if available
+    if product_summaries and message_type == "check_result":
+        fields = []
+        
+        # Sort products: in-stock items first
+        sorted_products = sorted(product_summaries, key=lambda result: (not result.in_stock, result.name or ''))
+        
+        for result in sorted_products[:8]:  # Limit to 8 for better display
+            fields.append(build_product_field(result))
+        
+        embed["fields"] = fields
+        
+        # Add summary field if there are more items than displayed
+        if len(product_summaries) > 8:
+            remaining = len(product_summaries) - 8
+            embed["fields"].append({
+                "name": "📝 Summary",
+                "value": f"Showing 8 of {len(product_summaries)} products\n{remaining} additional item(s) monitored\n\n🔄 Refresh for latest status",
+                "inline": False
+            })
+    
+    # Only the products that changed are rendered
+    if transitions and message_type == "stock_changes":
+        ordered = sorted(transitions, key=lambda t: (TRANSITION_ORDER[t.kind], t.result.name or ''))
+        embed["fields"] = [build_transition_field(transition) for transition in ordered[:8]]
+        if len(transitions) > 8:
+            embed["fields"].append({
+                "name": "📝 Summary",
+                "value": f"{len(transitions) - 8} more change(s) not shown",
+                "inline": False
+            })
+    
+    payload = {
+        "embeds": [embed],
+        "username": "CEX Stock Monitor",
+        "avatar_url": "https://uk.webuy.com/site-media/images/misc/webuy-logo.png",
+        "content": None  # We use embeds exclusively for rich formatting
+    }
+    return payload
+
+def _discord_webhook_url(config):
+    if not config.get('discord_enabled'):
+        return None
+    
+    webhook_url = config.get('discord', {}).get('webhook_url')
+    if not webhook_url:
+        print("Warning: Discord webhook URL not configured")
+    return webhook_url
+
+def send_discord_webhook(config, message_type="check_result", product_summaries=None, custom_message=None,
+                         transitions=None):
+    """Send enhanced notification via Discord webhook and wait for the response"""
+    webhook_url = _discord_webhook_url(config)
+    if not webhook_url:
+        return False
+    
+    try:
+        payload = build_discord_payload(message_type, product_summaries, custom_message, transitions)
         
         print(f"Sending Discord notification to webhook...")
-        response = requests.post(webhook_url, json=payload, timeout=10)
+        response = http_client.post(webhook_url, json=payload, timeout=10)
         
         # Log the webhook attempt
         log_entry = {
@@ -338,7 +418,21 @@ def send_discord_webhook(config, message_type="check_result", product_summaries=
         save_webhook_log(log_entry)
         return False
 
-def should_send_notification(config, message_type, in_stock_items=None):
+def queue_discord_webhook(config, message_type="check_result", product_summaries=None, custom_message=None,
+                          transitions=None):
+    """Queue a Discord notification for background delivery; returns False if Discord is not configured"""
+    webhook_url = _discord_webhook_url(config)
+    if not webhook_url:
+        return False
+    
+    notifications.configure(config)
+    payload = build_discord_payload(message_type, product_summaries, custom_message, transitions)
+    # A newer check result supersedes one still waiting to be sent
+    coalesce_key = (webhook_url, message_type) if message_type == "check_result" else None
+    notifications.submit(webhook_url, payload, message_type, coalesce_key)
+    return True
+
+def should_send_notification(config, message_type, in_stock_items=None, transitions=None):
     """Determine if notification should be sent based on config"""
     if not config.get('discord_enabled'):
         return False
@@ -350,114 +444,204 @@ def should_send_notification(config, message_type, in_stock_items=None):
     
     if notification_mode == 'all_checks':
         return True
-    elif notification_mode == 'stock_changes' and in_stock_items and len(in_stock_items) > 0:
+    elif notification_mode == 'stock_changes' and transitions:
         return True
     
     return False
 
+def notify_cycle(config, check_summary, transitions, summary_message, shard=None):
+    """Queue the notification for a finished cycle: the full summary, or only the transitions
+    in 'stock_changes' mode. Returns True if one was queued.
+
+    With a shard coordinator only the leader notifies, about its own cycle
+    merged with the results the other nodes pushed since its last one."""
+    if shard is not None:
+        merged = shard.merge_results(check_summary, transitions)
+        if merged is None:
+            return False
+        check_summary, transitions = merged
+        if not check_summary and not transitions:
+            return False
+    in_stock_items = [result for result in check_summary if result.in_stock]
+    if not should_send_notification(config, "check_result", in_stock_items, transitions):
+        return False
+    if config.get('notification_mode', 'all_checks') == 'stock_changes':
+        return queue_discord_webhook(config, "stock_changes", transitions=transitions, custom_message=summary_message)
+    return queue_discord_webhook(config, "check_result", product_summaries=check_summary, custom_message=summary_message)
+
 # Email functionality removed - Discord only
 
-def check_stock(product_id, store_id=None):
-    url = f"https://uk.webuy.com/product-detail?id={product_id}"
+def parse_product_page(html):
+    """Parse the HTML product page, returning the page markers we look for"""
+    return extract_page_markers(html)
+
+EMPTY_PAGE = parse_product_page("")
+
+def _timed_parse_product_page(response):
+    with metrics.HTML_PARSE_SECONDS.time():
+        return parse_product_page(response.text)
+
+def fetch_product_page(product_id, store_id=None, capture=False):
+    """Download the HTML product page, returning (page_markers, unchanged).
+    
+    The page is only parsed when its content changed since the last fetch.
+    """
+    url = f"{PRODUCT_URL}?id={product_id}"
     if store_id:
         url += f"&storeId={store_id}"
     
     print(f"Making request to: {url}")
-    response = requests.get(url)
-    print(f"Response status: {response.status_code}")
-    print(f"Redirected to: {response.url}")
+    # A capture needs the body, so it asks for the full page even if it has not changed
+    result = get_change_tracker().fetch(url, _timed_parse_product_page, conditional=not capture)
+    print(f"Response status: {result.status_code}")
+    print(f"Redirected to: {result.response.url}")
     
-    # Save full response for debugging
-    debug_file = f"debug_{product_id}.html"
-    with open(debug_file, "w", encoding="utf-8") as f:
-        f.write(response.text)
-    print(f"Full response saved to {debug_file}")
+    if capture:
+        debug_capture.save_artifact(product_id, "page", result.response.text, "html")
     
-    # Extract product information from API
-    api_url = f"https://wss2.cex.uk.webuy.io/v3/boxes/{product_id}/detail"
-    api_response = requests.get(api_url)
-    api_data = api_response.json() if api_response.ok else {}
+    page = result.parsed or EMPTY_PAGE
+    if result.unchanged:
+        print("Product page unchanged since last check")
+    print(f"Buy button found: {page['buy_button']}")
+    print(f"Out of stock message found: {page['out_of_stock_message']}")
+    print(f"Price indicator found: {page['price']}")
+    print(f"Quantity selector found: {page['quantity_selector']}")
     
-    # Save API response for debugging
-    debug_api_file = f"debug_{product_id}_api.json"
-    with open(debug_api_file, "w") as f:
-        json.dump(api_data, f, indent=2)
-    print(f"API response saved to {debug_api_file}")
+    return page, result.unchanged
+
+# The parts of a product detail record the checker and metadata cache read; the rest is not kept
+API_DETAIL_FIELDS = STATIC_FIELDS + PRICE_FIELDS + ('ecomQuantityOnHand', 'outOfStock', 'webSellAllowed',
+                                                   'storeAvailability')
+
+def parse_product_api(response):
+    """Parse a product detail response down to API_DETAIL_FIELDS, keeping the response's shape"""
+    details = box_details(response.json())
+    if details is None:
+        return {}
+    return {'response': {'data': {'boxDetails': [
+        {field: details[field] for field in API_DETAIL_FIELDS if field in details}]}}}
+
+def fetch_product_api(product_id, capture=False):
+    """Fetch the product detail JSON, returning (api_data, api_failed, unchanged).
     
-    # Extract product name and stock info
-    product_info = None
-    if 'response' in api_data and 'data' in api_data['response']:
-        box_details = api_data['response']['data'].get('boxDetails', [])
-        if box_details and len(box_details) > 0:
-            product_info = box_details[0]
-            product_name = product_info.get('boxName')
-            print(f"Product Name: {product_name}")
-            
-            # Check API stock info
-            quantity = product_info.get('ecomQuantityOnHand', 0)
-            out_of_stock = product_info.get('outOfStock', True)
-            web_sell_allowed = product_info.get('webSellAllowed', False)
-            
-            print("API Stock Info:")
-            print(f"  - Quantity Available: {quantity}")
-            print(f"  - Out of Stock Flag: {1 if out_of_stock else 0}")
-            print(f"  - Web Sell Allowed: {1 if web_sell_allowed else 0}")
-            
-            if quantity > 0 and not out_of_stock and web_sell_allowed:
-                print("API indicates product is in stock")
-                in_stock = True
-            else:
-                print("API indicates product is out of stock")
-                in_stock = False
+    api_failed is True when the API could not give an answer (network error
+    or server error), as opposed to a clean 404 for an unknown product.
+    unchanged is True when the response matched the previous one (304 or
+    same content hash) and the stored data was reused without parsing.
+    """
+    api_url = f"{CEX_API_URL}/v3/boxes/{product_id}/detail"
+    try:
+        result = get_change_tracker().fetch(api_url, parse_product_api, conditional=not capture)
+    except Exception as e:
+        print(f"Warning: Failed to check API: {e}")
+        return {}, True, False
     
-    if not product_info:
-        print("Failed to get product info from API")
-        return False, {"boxName": "Unknown Product", "boxId": product_id}, None
+    if result.parsed is None:
+        return {}, result.status_code != 404, False
     
-    # Parse HTML response
-    soup = BeautifulSoup(response.text, 'html.parser')
+    if capture:
+        debug_capture.save_artifact(product_id, "api", result.response.text, "json")
     
-    # Check for key elements
-    buy_button = soup.find('button', {'data-testid': 'add-to-basket-button'})
-    out_of_stock_msg = soup.find('div', {'data-testid': 'out-of-stock-message'})
-    price_indicator = soup.find('div', {'data-testid': 'price'})
-    quantity_selector = soup.find('div', {'data-testid': 'quantity-selector'})
+    return result.parsed, False, result.unchanged
+
+def box_details(api_data):
+    """The product record from a product detail response, or None"""
+    data = (api_data.get('response') or {}).get('data') or {}
+    details = data.get('boxDetails') or []
+    return details[0] if details else None
+
+def lookup_product(product_id, need_prices=True):
+    """Return (metadata, api_failed) for a product from the metadata cache, fetching its details on a miss.
     
-    print(f"Buy button found: {bool(buy_button)}")
-    print(f"Out of stock message found: {bool(out_of_stock_msg)}")
-    print(f"Price indicator found: {bool(price_indicator)}")
-    print(f"Quantity selector found: {bool(quantity_selector)}")
+    metadata is None for a product the API does not know, or when the API
+    failed (api_failed is then True). Never says anything about stock.
+    """
+    failed = []
+    def fetch():
+        api_data, api_failed, _ = fetch_product_api(product_id)
+        if api_failed:
+            failed.append(True)
+        return box_details(api_data)
+    metadata = product_metadata.get_or_fetch(product_id, fetch, need_prices)
+    return metadata, bool(failed)
+
+def check_stock(product_id, store_id=None, check_mode=CHECK_MODE_API, cycle_cache=None):
+    """Check one product, returning (in_stock, product_info, stock_history).
+
+    In 'api' mode only the product detail JSON is fetched; the HTML page is
+    downloaded and parsed only as a fallback when the API is unavailable.
+    'full' mode always fetches the page as well, which enables the reviews
+    heuristic for stock history.
     
-    # Check for reviews to determine if product has been in stock before
-    reviews_section = soup.find('div', {'data-testid': 'reviews'})
-    has_reviews = bool(reviews_section and reviews_section.find_all('div', {'data-testid': 'review'}))
+    The API response does not depend on the store, so when a cycle_cache is
+    given it is fetched once per product per cycle and shared across stores.
     
-    # Load or initialize stock history
-    history_file = f"stock_history_{product_id}.json"
-    try:
-        with open(history_file, 'r') as f:
-            stock_history = json.load(f)
-    except FileNotFoundError:
-        stock_history = {
-            'last_in_stock': None,
-            'times_in_stock': 0,
-            'first_seen': time.strftime('%Y-%m-%d %H:%M:%S')
-        }
+    When the responses are unchanged since the last check (304 or same
+    content hash) parsing is skipped, and so is the history update for
+    products that are still out of stock.
+    """
+    # Extract product information from API
+    capture = debug_capture.should_capture(product_id)
+    if cycle_cache is not None:
+        api_data, api_failed, unchanged = cycle_cache.get_or_fetch(('api', product_id),
+                                                                   lambda: fetch_product_api(product_id, capture))
+    else:
+        api_data, api_failed, unchanged = fetch_product_api(product_id, capture)
     
-    # Update stock history based on current check and reviews
-    current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-    if in_stock:
-        stock_history['last_in_stock'] = current_time
-        stock_history['times_in_stock'] += 1
+    # Extract product name and stock info
+    product_info = box_details(api_data)
+    in_stock = False
+    if product_info:
+        product_name = product_info.get('boxName')
+        print(f"Product Name: {product_name}")
+        # Every live check refreshes the metadata cache for free
+        product_metadata.put(product_info)
+        
+        # Check API stock info
+        quantity = product_info.get('ecomQuantityOnHand', 0)
+        out_of_stock = product_info.get('outOfStock', True)
+        web_sell_allowed = product_info.get('webSellAllowed', False)
+        
+        print("API Stock Info:")
+        print(f"  - Quantity Available: {quantity}")
+        print(f"  - Out of Stock Flag: {1 if out_of_stock else 0}")
+        print(f"  - Web Sell Allowed: {1 if web_sell_allowed else 0}")
+        
+        if quantity > 0 and not out_of_stock and web_sell_allowed:
+            print("API indicates product is in stock")
+            in_stock = True
+        else:
+            print("API indicates product is out of stock")
+            in_stock = False
+    
+    page = None
+    if check_mode == CHECK_MODE_FULL or (api_failed and not product_info):
+        page, page_unchanged = fetch_product_page(product_id, store_id, capture)
+        unchanged = unchanged and page_unchanged
     
-    # If product has reviews but no last_in_stock date, set it to "Previously in stock"
-    if has_reviews and not stock_history['last_in_stock']:
-        stock_history['last_in_stock'] = "Previously in stock"
-        stock_history['times_in_stock'] = max(1, stock_history['times_in_stock'])
+    if not product_info and page and (page['buy_button'] or page['out_of_stock_message'] or page['price']):
+        # API unavailable: fall back to the markers on the product page
+        print("API unavailable, using product page markers")
+        in_stock = page['buy_button'] and not page['out_of_stock_message']
+        product_info = {"boxName": page['title'] or "Unknown Product", "boxId": product_id}
     
-    # Save updated stock history
-    with open(history_file, 'w') as f:
-        json.dump(stock_history, f, indent=2)
+    if cycle_cache is not None:
+        cycle_cache.count('checked')
+        if unchanged:
+            cycle_cache.count('unchanged')
+    
+    if not product_info:
+        print("Failed to get product info from API")
+        return False, {"boxName": "Unknown Product", "boxId": product_id}, None
+    
+    has_reviews = bool(page and page['has_reviews'])
+    
+    # Update stock history based on current check and reviews
+    history = get_history_store()
+    stock_history = history.get(product_id, store_id) if unchanged and not in_stock else None
+    if stock_history is None:
+        stock_history = history.record_check(product_id, in_stock, store_id=store_id,
+                                             has_reviews=has_reviews)
     
     # Determine final stock status
     if in_stock:
@@ -467,7 +651,346 @@ def check_stock(product_id, store_id=None):
     
     return in_stock, product_info, stock_history
 
-def check(web_mode=False, running_flag=None):
+def check_stock_at_stores(product_id, check_mode=CHECK_MODE_API, cycle_cache=None, matrix=None, location=None):
+    """Check a product online, then fill its row of the store availability matrix with one lookup"""
+    in_stock, product_info, stock_history = check_stock(product_id, None, check_mode, cycle_cache)
+    if stock_history is None:
+        return in_stock, product_info, stock_history
+    
+    try:
+        availability = fetch_store_availability(product_id, *location)
+    except Exception as e:
+        print(f"Warning: Store availability lookup failed for {product_id}: {e}")
+        return in_stock, product_info, stock_history
+    matrix.set_row(product_id, availability)
+    
+    # Per-store history rows, all part of the cycle's batch
+    history = get_history_store()
+    for store_id, quantity in matrix.row(product_id).items():
+        history.record_check(product_id, quantity > 0, store_id=store_id)
+    
+    in_store = matrix.in_stock_stores(product_id)
+    product_info = dict(product_info, storeAvailability=[
+        {'storeId': store_id, 'storeName': store_name, 'quantity': quantity}
+        for store_id, store_name, quantity in in_store
+    ])
+    # Explicitly watched stores count towards the product being in stock
+    if matrix.store_ids and in_store:
+        in_stock = True
+    print(f"Product {product_id} is on the shelf at {len(in_store)} store(s)")
+    
+    return in_stock, product_info, stock_history
+
+def run_check_cycle(items, config, engine, check_time, should_continue=None, matrix=None, stats=None,
+                    checkpoint=None, carried=None):
+    """Check every item (at every configured store) through the engine and build the cycle summary.
+    
+    With a store availability matrix each product is checked once and its
+    per-store stock comes from a single lookup; otherwise every
+    (item, store_id) pair is checked separately.
+    
+    If a stats dict is given it is filled with the cycle's counters
+    (checks made, unchanged results, reused API responses).
+    
+    With a checkpoint, each item is saved there as soon as all its checks
+    have succeeded, so a restarted checker does not check it again.
+    carried takes results finished before a restart that never reached
+    the time series; they are written to it with this cycle's results.
+    """
+    check_mode = config.get('check_mode', CHECK_MODE_API)
+    store_ids = config.get('store_ids')
+    cycle_cache = CycleCache()
+    cycle_start = time.perf_counter()
+    events.publish('cycle_started', {'check_time': check_time, 'items': len(items)})
+    
+    if matrix is not None:
+        availability_config = config.get('store_availability', {}) or {}
+        location = (availability_config.get('latitude', DEFAULT_LATITUDE),
+                    availability_config.get('longitude', DEFAULT_LONGITUDE))
+        task = check_stock_at_stores
+        jobs = [(item_id, check_mode, cycle_cache, matrix, location) for item_id in items]
+        job_stores = [None] * len(jobs)
+    else:
+        task = check_stock
+        jobs = [(item_id, store_id, check_mode, cycle_cache)
+                for item_id in items for store_id in (store_ids or [None])]
+        job_stores = [job[1] for job in jobs]
+    
+    on_done = None
+    if checkpoint is not None:
+        jobs_left = {}
+        item_results = {}
+        progress_lock = threading.Lock()
+        for job in jobs:
+            jobs_left[job[0]] = jobs_left.get(job[0], 0) + 1
+        
+        def on_done(index, outcome):
+            item_id = jobs[index][0]
+            with progress_lock:
+                if not isinstance(outcome, tuple):
+                    jobs_left[item_id] = None  # Failed or skipped: check the whole item again after a restart
+                    return
+                if jobs_left[item_id] is None:
+                    return
+                in_stock, product_info, stock_history = outcome
+                results = item_results.setdefault(item_id, [])
+                results.append(CheckResult.from_product_info(product_info, in_stock, check_time, stock_history,
+                                                             job_stores[index]))
+                jobs_left[item_id] -= 1
+                if jobs_left[item_id]:
+                    return
+            checkpoint.record(item_id, results)
+    
+    # All history updates from this cycle are committed in a single transaction
+    with get_history_store().batch():
+        outcomes = engine.run(task, jobs, should_continue=should_continue, on_done=on_done)
+    
+    check_summary = []
+    if cycle_cache.hits:
+        print(f"Reused {cycle_cache.hits} product API response(s) across stores this cycle")
+    if cycle_cache.stats['unchanged']:
+        print(f"{cycle_cache.stats['unchanged']} of {cycle_cache.stats['checked']} check(s) unchanged since last cycle")
+    if stats is not None:
+        stats.update(cycle_cache.stats, api_reused=cycle_cache.hits)
+    
+    for job, store_id, outcome in zip(jobs, job_stores, outcomes):
+        item_id = job[0]
+        if outcome is None:
+            continue  # Skipped because the checker was stopped
+        if isinstance(outcome, Exception):
+            print(f"Error checking {item_id}: {outcome}")
+            metrics.CHECKS.inc(result='error')
+            continue
+        
+        in_stock, product_info, stock_history = outcome
+        metrics.CHECKS.inc(result='in_stock' if in_stock else 'out_of_stock' if stock_history is not None else 'not_found')
+        at_store = f" at store {store_id}" if store_id else ""
+        if in_stock:
+            print(f"Product {item_id} is in stock{at_store}!")
+        # check_stock returns no stock history for products the API doesn't know
+        elif stock_history is None:
+            print(f"Product {item_id} does not exist")
+        else:
+            print(f"Product {item_id} is currently out of stock{at_store}")
+        check_summary.append(CheckResult.from_product_info(product_info, in_stock, check_time, stock_history,
+                                                           store_id))
+    
+    try:
+        get_timeseries_store().append_results(list(carried or []) + check_summary, matrix)
+        if checkpoint is not None:
+            checkpoint.series_recorded()
+    except OSError as e:
+        print(f"Warning: Could not record price history: {e}")
+    
+    metrics.CYCLE_SECONDS.observe(time.perf_counter() - cycle_start)
+    metrics.CYCLE_ITEMS.observe(len(items))
+    events.publish('cycle_finished', {
+        'check_time': check_time,
+        'checked': len(check_summary),
+        'in_stock': sum(1 for result in check_summary if result.in_stock),
+    })
+    return check_summary
+
+def record_cycle_results(scheduler, due_items, check_summary, now=None):
+    """Feed each checked item's status back to the scheduler so its next due time adapts.
+    
+    Every item is rescheduled from the same now, so with a fixed interval
+    the whole watchlist stays due at one time and is checked as one cycle.
+    """
+    now = time.time() if now is None else now
+    checked = set()
+    in_stock = set()
+    for result in check_summary:
+        checked.add(result.product_id)
+        if result.in_stock:
+            in_stock.add(result.product_id)
+    
+    for item_id in due_items:
+        if item_id in checked:
+            scheduler.record_result(item_id, StockStatus.IN_STOCK if item_id in in_stock else StockStatus.OUT_OF_STOCK,
+                                    now=now)
+        else:
+            scheduler.record_result(item_id, None, now=now)  # Failed or skipped; try again after its interval
+
+def resume_checkpoint(scheduler, checkpoint, config):
+    """Pick up where the last run stopped.
+    
+    Returns (check_count, results, unrecorded): the last cycle number, the
+    results an unfinished cycle already had (None if it finished), so the
+    caller completes that cycle before counting a new one, and those of
+    them that never reached the time series. The finished items are
+    re-scheduled from when they were checked, and their history rows are
+    written again since the cycle's batch may never have been committed.
+    """
+    progress = checkpoint.load()
+    if progress is None:
+        return 0, None, []
+    scheduler.restore(progress.schedule)
+    if progress.finished:
+        print(f"Continuing after check #{progress.check_count}")
+        return progress.check_count, None, []
+    
+    # Results older than an interval are stale; those items are simply checked again
+    cutoff = time.time() - config.get('request_delay', 1800)
+    results = []
+    unrecorded = []
+    history = get_history_store()
+    for checked_at, item_id, item_results in progress.items:
+        if checked_at < cutoff or scheduler.interval_of(item_id) is None:
+            continue
+        for result in item_results:
+            if result.stock_history is not None:
+                history.import_records({result.product_id: result.stock_history}, result.store_id)
+        status = StockStatus.IN_STOCK if any(result.in_stock for result in item_results) else StockStatus.OUT_OF_STOCK
+        scheduler.record_result(item_id, status, now=checked_at)
+        results.extend(item_results)
+        if item_id in progress.unrecorded:
+            unrecorded.extend(item_results)
+    print(f"Resuming check #{progress.check_count}: {len(results)} result(s) saved before the restart")
+    return progress.check_count, results, unrecorded
+
+def new_availability_matrix(config):
+    """Return an empty store availability matrix when store_availability is enabled, else None"""
+    if (config.get('store_availability') or {}).get('enabled'):
+        return AvailabilityMatrix.from_config(config)
+    return None
+
+def configure_services(config):
+    """Apply the config to the process-wide HTTP session, debug capture and metadata cache"""
+    http_client.configure(config)
+    debug_capture.configure(config)
+    product_metadata.configure(config)
+
+class CheckLoop:
+    """The state a check loop carries between cycles, shared by check() and the checker service.
+    
+    Each run_once() checks the items that are due (after finishing a cycle
+    resumed from the checkpoint), and seconds_until_next() says how long to
+    sleep before calling it again. The caller owns the sleeping, stopping
+    and config reloading.
+    """
+    
+    def __init__(self, config, should_continue=None, label=""):
+        self.should_continue = should_continue
+        self.label = label  # Prefix for log lines
+        self.config = config
+        self.items = config.get('items', [])
+        self.engine = CheckEngine.from_config(config)
+        self.scheduler = AdaptiveScheduler.from_config(config)
+        self.scheduler.sync_items(self.items)
+        self.cycles = 0
+        self.next_check_time = None
+        # Sharding is set up once per loop; toggling it takes a restart
+        self.shard = ShardCoordinator.from_config(config)
+        if self.shard:
+            # Before touching the checkpoint, which belongs to whoever holds the node ID
+            self.shard.join()
+        self.checkpoint = CycleCheckpoint.for_node(self.shard.node_id if self.shard else None)
+        self.check_count, self._resumed, self._unrecorded = resume_checkpoint(self.scheduler, self.checkpoint,
+                                                                             config)
+    
+    def reconfigure(self, config):
+        """Take a reloaded config: new items and engine, and a new scheduler if the timing changed"""
+        previous, self.config = self.config, config
+        self.items = config.get('items', [])
+        self.engine = CheckEngine.from_config(config)
+        if (previous.get('request_delay'), previous.get('schedule')) != \
+                (config.get('request_delay'), config.get('schedule')):
+            self.scheduler = AdaptiveScheduler.from_config(config)
+        self.scheduler.sync_items(self.items)
+    
+    def close(self):
+        if self.shard:
+            self.shard.leave()
+    
+    def run_once(self):
+        """Run a cycle if anything is due; returns True if one ran"""
+        # Follow the other nodes joining and leaving
+        if self.shard:
+            self.scheduler.sync_items(self.shard.assign(self.items))
+        
+        due_items = self.scheduler.pop_due()
+        if not due_items and self._resumed is None:
+            if self.shard and self.shard.is_leader():
+                current_time = time.strftime('%Y-%m-%d %H:%M:%S')
+                if notify_cycle(self.config, [], [], f"Results from other checker nodes at {current_time}",
+                                self.shard):
+                    print(f"{self.label}Discord notification queued for the other nodes' results")
+            return False
+        
+        try:
+            self._run_cycle(due_items)
+        except Exception:
+            # Put the items of the failed cycle back on the schedule
+            record_cycle_results(self.scheduler, due_items, [])
+            raise
+        return True
+    
+    def _run_cycle(self, due_items):
+        # An unfinished cycle from before a restart is completed under its own number
+        if self._resumed is None:
+            self.check_count += 1
+        carried, self._resumed = self._resumed or [], None
+        unrecorded, self._unrecorded = self._unrecorded, []
+        self.cycles += 1
+        check_count = self.check_count
+        current_time = time.strftime('%Y-%m-%d %H:%M:%S')
+        print(f"\n{self.label}Starting check #{check_count} at {current_time} "
+              f"({len(due_items)} of {len(self.items)} item(s) due)")
+        
+        matrix = new_availability_matrix(self.config)
+        cycle_stats = {}
+        self.checkpoint.begin(check_count, self.scheduler)
+        check_summary = carried + run_check_cycle(due_items, self.config, self.engine, current_time,
+                                                  should_continue=self.should_continue, matrix=matrix,
+                                                  stats=cycle_stats, checkpoint=self.checkpoint,
+                                                  carried=unrecorded)
+        cycle_end = time.time()
+        record_cycle_results(self.scheduler, due_items, check_summary, now=cycle_end)
+        if carried and not self.scheduler.adaptive:
+            # Items finished before the restart rejoin the others' due time, keeping one cycle per interval
+            for item_id in {result.product_id for result in carried} - set(due_items):
+                self.scheduler.record_result(item_id, None, now=cycle_end)
+        
+        self.next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.scheduler.next_due_time()))
+        # Diff against what the checker itself last saw; the snapshot also takes live dashboard refreshes
+        history = get_history_store()
+        transitions = diff_cycle(cycle_baseline(history, load_snapshot().get('products', {}), check_summary),
+                                 check_summary)
+        publish_snapshot(check_summary, check_count, self.next_check_time,
+                         store_matrix=matrix.to_dict() if matrix else None,
+                         cycle_stats=cycle_stats)
+        
+        # Send Discord notification based on configuration
+        summary_message = f"Check #{check_count} completed at {current_time}\nNext check: {self.next_check_time}"
+        if transitions:
+            print(f"{self.label}{len(transitions)} stock change(s) since the last check")
+        if notify_cycle(self.config, check_summary, transitions, summary_message, self.shard):
+            print(f"{self.label}Discord notification queued ({len(transitions)} change(s), "
+                  f"{len(check_summary)} result(s))")
+        else:
+            print(f"{self.label}Notification skipped based on configuration")
+        
+        history.record_notified({product_id: result
+                                 for product_id, result in collapse_by_product(check_summary).items()
+                                 if result.stock_history is not None})
+        
+        if self.should_continue is None or self.should_continue():
+            self.checkpoint.finish(check_count, self.scheduler)
+        else:
+            # Stopped part way: leave the checkpoint so the next start resumes this cycle
+            print(f"{self.label}Check #{check_count} was stopped part way, the next start resumes it")
+        print(f"{self.label}Check completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    
+    def seconds_until_next(self):
+        wait = self.scheduler.seconds_until_next()
+        if self.shard:
+            # Wake up often enough to notice membership changes and drain the other nodes' results
+            wait = min(wait, self.shard.lease_seconds / 2)
+        return wait
+
+def check(web_mode=False, running_flag=None, max_cycles=None):
+    """Run check cycles forever, or until max_cycles cycles have completed"""
     print(f"Using config file: {CONFIG_YAML}")
     
     try:
@@ -479,8 +1002,8 @@ def check(web_mode=False, running_flag=None):
         sys.exit(f"Error reading configuration: {e}")
     
     items = config.get('items', [])
-    store_ids = config.get('store_ids')
     delay = config.get('request_delay', 1800)  # Default to 30 minutes
+    configure_services(config)
     
     print(f"Found {len(items)} item(s) in check list")
     print(f"Will check every {delay} seconds")
@@ -493,96 +1016,53 @@ def check(web_mode=False, running_flag=None):
         )
         for item_id in items:
             startup_message += f"- {item_id}\n"
-        send_discord_webhook(config, "start", custom_message=startup_message)
-    
-    check_count = 0
-    while True:
-        # Check running flag for web mode
-        if web_mode and running_flag and not running_flag():
-            print("Stopping stock checker (web mode)")
-            break
+        queue_discord_webhook(config, "start", custom_message=startup_message)
+    
+    loop = CheckLoop(config, should_continue=running_flag if web_mode else None)
+    print(f"Running up to {loop.engine.concurrency} check(s) in parallel")
+    try:
+        while True:
+            # Check running flag for web mode
+            if web_mode and running_flag and not running_flag():
+                print("Stopping stock checker (web mode)")
+                break
             
-        check_count += 1
-        current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-        print(f"\nStarting check #{check_count} at {current_time}")
-        
-        # Initialize check summary
-        check_summary = []
-        in_stock_count = 0
-        
-        for item_id in items:
-            if store_ids:
-                for store_id in store_ids:
-                    in_stock, product_info, stock_history = check_stock(item_id, store_id)
-                    if in_stock:
-                        in_stock_count += 1
-                        message = f"Product {item_id} is in stock at store {store_id}!"
-                        print(message)
-                        check_summary.append((product_info, "IN STOCK", current_time, stock_history))
-                    else:
-                        # Check if the debug file exists to determine if product exists
-                        debug_file = f"debug_{item_id}.html"
-                        if not os.path.exists(debug_file):
-                            status = f"Product {item_id} does not exist"
-                        else:
-                            status = f"Product {item_id} is currently out of stock at store {store_id}"
-                        print(status)
-                        check_summary.append((product_info, "OUT OF STOCK", current_time, stock_history))
-                    sleep(2)  # Small delay between store checks
+            if loop.run_once() and max_cycles and loop.cycles >= max_cycles:
+                return
+            
+            wait = loop.seconds_until_next()
+            next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + wait))
+            print(f"Next check in {int(wait)} seconds ({next_check_time})")
+            sys.stdout.flush()  # Ensure output is written immediately
+            
+            # Sleep with interruption checking for web mode
+            if web_mode and running_flag:
+                for _ in range(math.ceil(wait)):
+                    if not running_flag():
+                        print("Stopping stock checker during sleep (web mode)")
+                        return
+                    sleep(1)
             else:
-                in_stock, product_info, stock_history = check_stock(item_id)
-                if in_stock:
-                    in_stock_count += 1
-                    message = f"Product {item_id} is in stock!"
-                    print(message)
-                    check_summary.append((product_info, "IN STOCK", current_time, stock_history))
-                else:
-                    # Check if the debug file exists to determine if product exists
-                    debug_file = f"debug_{item_id}.html"
-                    if not os.path.exists(debug_file):
-                        status = f"Product {item_id} does not exist"
-                    else:
-                        status = f"Product {item_id} is currently out of stock"
-                    print(status)
-                    check_summary.append((product_info, "OUT OF STOCK", current_time, stock_history))
-                sleep(2)  # Small delay between item checks
-        
-        current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-        next_check_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() + delay))
-        
-        # Prepare notification message
-        summary_message = f"Check #{check_count} completed at {current_time}\nNext check: {next_check_time}"
-        
-        print(f"Check completed at {current_time}")
-        print(f"Next check in {delay} seconds ({next_check_time})")
-        
-        # Send Discord notification based on configuration
-        in_stock_items = [item for item in check_summary if item[1] == "IN STOCK"]
-        if should_send_notification(config, "check_result", in_stock_items):
-            send_discord_webhook(config, "check_result", product_summaries=check_summary, custom_message=summary_message)
-        
-        sys.stdout.flush()  # Ensure output is written immediately
-        
-        # Sleep with interruption checking for web mode
-        if web_mode and running_flag:
-            for _ in range(delay):
-                if not running_flag():
-                    print("Stopping stock checker during sleep (web mode)")
-                    return
-                sleep(1)
-        else:
-            sleep(delay)
+                sleep(wait)
+    finally:
+        loop.close()
 
 if __name__ == "__main__":
     try:
         check()
+    except NodeIdInUse as e:
+        print(f"[SHARD] {e}")
+        sys.exit(1)
     except KeyboardInterrupt:
         print("\nStopping stock checker...")
         # Send stop notification
         try:
             with open(CONFIG_YAML, "r") as f:
                 config = yaml.safe_load(f)
-            send_discord_webhook(config, "stop", custom_message="Stock checker stopped manually")
+            queue_discord_webhook(config, "stop", custom_message="Stock checker stopped manually")
         except:
             pass
+        # Deliver anything still queued before exiting
+        if not notifications.flush(EXIT_FLUSH_TIMEOUT):
+            print(f"{notifications.pending()} notification(s) were not delivered")
         sys.exit(0)
@@ -0,0 +1,94 @@
+"""
+Per-store availability for a product from a single nearest-stores lookup
+"""
+
+import threading
+import http_client
+from load_stores import CEX_API_URL, load_store_names
+
+NEAREST_STORES_URL = f"{CEX_API_URL}/v3/boxes/{{product_id}}/neareststores"
+
+# Central London; override with store_availability.latitude/longitude
+DEFAULT_LATITUDE = 51.5074
+DEFAULT_LONGITUDE = -0.1278
+
+
+def fetch_store_availability(product_id, latitude=DEFAULT_LATITUDE, longitude=DEFAULT_LONGITUDE):
+    """Return {store_id: {'store_name', 'quantity'}} for every store the lookup reports"""
+    url = NEAREST_STORES_URL.format(product_id=product_id)
+    response = http_client.get(url, params={'latitude': latitude, 'longitude': longitude})
+    if response.status_code == 404:
+        return {}
+    response.raise_for_status()
+
+    data = response.json().get('response', {}).get('data') or {}
+    availability = {}
+    for store in data.get('nearestStores') or []:
+        store_id = store.get('storeId')
+        if store_id is None:
+            continue
+        quantity = store.get('quantityOnHand', store.get('stockQuantity', 0)) or 0
+        availability[str(store_id)] = {'store_name': store.get('storeName'), 'quantity': int(quantity)}
+    return availability
+
+
+class AvailabilityMatrix:
+    """Items x stores grid of on-hand quantities filled in during a check cycle"""
+
+    def __init__(self, store_ids=None, store_names=None):
+        # Only these stores are kept when given, otherwise every store the lookup returns
+        self.store_ids = [str(store_id) for store_id in store_ids] if store_ids else None
+        self.store_names = {str(k): v for k, v in (store_names or {}).items()}
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('store_ids'), load_store_names())
+
+    def set_row(self, product_id, availability):
+        """Record one product's lookup result, restricted to the watched stores"""
+        row = {}
+        for store_id, info in availability.items():
+            if self.store_ids is not None and store_id not in self.store_ids:
+                continue
+            if info.get('store_name'):
+                self.store_names.setdefault(store_id, info['store_name'])
+            row[store_id] = info['quantity']
+        if self.store_ids is not None:
+            for store_id in self.store_ids:
+                row.setdefault(store_id, 0)
+        with self._lock:
+            self._rows[product_id] = row
+
+    def row(self, product_id):
+        """{store_id: quantity} for one product"""
+        with self._lock:
+            return dict(self._rows.get(product_id, {}))
+
+    def store_name(self, store_id):
+        return self.store_names.get(str(store_id)) or f"Store {store_id}"
+
+    def in_stock_stores(self, product_id):
+        """[(store_id, store_name, quantity)] for stores holding the product, most stock first"""
+        row = self._rows.get(product_id, {})
+        stores = [(store_id, self.store_name(store_id), quantity)
+                  for store_id, quantity in row.items() if quantity > 0]
+        return sorted(stores, key=lambda s: -s[2])
+
+    def stores(self):
+        """Every store column seen so far"""
+        if self.store_ids is not None:
+            return list(self.store_ids)
+        columns = set()
+        for row in self._rows.values():
+            columns.update(row)
+        return sorted(columns)
+
+    def to_dict(self):
+        """JSON-friendly form for the snapshot and API"""
+        return {
+            'stores': {store_id: self.store_name(store_id) for store_id in self.stores()},
+            'items': {product_id: dict(row) for product_id, row in self._rows.items()},
+        }
+
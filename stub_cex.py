@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local stub of the CEX website and API that serves recorded JSON fixtures
+
+Point the checker at it with:
+    CEX_WEB_URL=http://127.0.0.1:8099 CEX_API_URL=http://127.0.0.1:8099 python3 stock_check.py
+
+Product IDs starting with SYNTHETIC_PREFIX (e.g. BENCH00042) are generated
+from the recorded fixture, so any number of products can be served. POSTs
+to /webhooks/... act as a Discord webhook receiver. --latency and
+--error-rate slow down or fail (503) a share of requests.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cex")
+TEMPLATE_PRODUCT = "SHDDSEAST16000NM001G"
+SYNTHETIC_PREFIX = "BENCH"
+
+NOT_FOUND = {
+    "response": {
+        "ack": "Failure",
+        "data": None,
+        "error": {"code": "404", "internal_message": "Box not found", "moreInfo": []}
+    }
+}
+
+
+def load_fixture(*parts):
+    """Return the raw bytes of a fixture file, or None if it is not recorded"""
+    path = os.path.join(FIXTURES_DIR, *parts)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def synthetic_product_ids(count):
+    return [f"{SYNTHETIC_PREFIX}{n:05d}" for n in range(count)]
+
+
+def _synthetic_fixture(product_id, kind):
+    """Build detail/neareststores JSON for a synthetic product from the recorded template"""
+    try:
+        number = int(product_id[len(SYNTHETIC_PREFIX):])
+    except ValueError:
+        return None
+    template = json.loads(load_fixture('boxes', TEMPLATE_PRODUCT, f"{kind}.json"))
+    data = template['response']['data']
+    in_stock = number % 5 == 0  # A fifth of the synthetic products are in stock
+    if kind == 'detail':
+        box = data['boxDetails'][0]
+        box.update({
+            'boxId': product_id,
+            'boxName': f"Benchmark product {number}",
+            'sellPrice': 50 + number % 200,
+            'ecomQuantityOnHand': 3 if in_stock else 0,
+            'outOfStock': not in_stock,
+        })
+    else:
+        for index, store in enumerate(data['nearestStores']):
+            store['quantityOnHand'] = 1 if in_stock and index % 2 == 0 else 0
+    return json.dumps(template).encode('utf-8')
+
+
+class StubCexHandler(BaseHTTPRequestHandler):
+    """Serves /v3/boxes/{id}/detail, /v3/boxes/{id}/neareststores, /v3/stores and /product-detail,
+    and accepts webhook POSTs under /webhooks/. GET /__stats returns the request counters."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real servers
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type="application/json"):
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self, kind):
+        """Count the request, apply the configured latency and maybe fail it; returns True if it failed"""
+        server = self.server
+        with server.lock:
+            server.stats[kind] += 1
+            fail = server.error_rate and server.random.random() < server.error_rate
+            if fail:
+                server.stats['errors'] += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if fail:
+            body = b'{"error": "Service Unavailable"}'
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        return fail
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/webhooks/'):
+            self.send_body(404, json.dumps(NOT_FOUND).encode('utf-8'))
+            return
+        if self._simulate('webhook'):
+            return
+        self.send_response(204)
+        self.send_header("X-RateLimit-Limit", "5")
+        self.send_header("X-RateLimit-Remaining", "4")
+        self.send_header("X-RateLimit-Reset-After", "1")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['__stats']:
+            with self.server.lock:
+                self.send_body(200, json.dumps(self.server.stats).encode('utf-8'))
+            return
+
+        if self._simulate(parts[0] if parts else 'root'):
+            return
+
+        if parts == ['v3', 'stores']:
+            body = load_fixture('stores.json')
+        elif len(parts) == 4 and parts[:2] == ['v3', 'boxes'] and parts[3] in ('detail', 'neareststores'):
+            body = load_fixture('boxes', parts[2], f"{parts[3]}.json")
+            if body is None and parts[2].startswith(SYNTHETIC_PREFIX):
+                body = _synthetic_fixture(parts[2], parts[3])
+        elif parts == ['product-detail']:
+            product_id = parse_qs(url.query).get('id', [''])[0]
+            known = load_fixture('boxes', product_id, 'detail.json') or (
+                product_id.startswith(SYNTHETIC_PREFIX) and _synthetic_fixture(product_id, 'detail'))
+            body = load_fixture('boxes', product_id, 'product-detail.html') or (
+                load_fixture('product-detail.html') if known else None)
+            if body is None:
+                self.send_response(302)
+                self.send_header("Location", "/error")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_body(200, body, "text/html; charset=utf-8")
+            return
+        else:
+            body = None
+
+        if body is None:
+            self.send_body(404, json.dumps(NOT_FOUND).encode('utf-8'))
+        else:
+            self.send_body(200, body)
+
+
+def make_server(host="127.0.0.1", port=8099, verbose=False, latency=0.0, error_rate=0.0, seed=None):
+    server = ThreadingHTTPServer((host, port), StubCexHandler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.latency = latency
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.stats = Counter()
+    server.lock = threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded CEX fixtures locally")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.verbose, args.latency, args.error_rate, args.seed)
+    print(f"Stub CEX serving {FIXTURES_DIR} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
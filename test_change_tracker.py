@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for conditional fetches: validators, unchanged detection, the bounded cache and batched writes
+
+Run with:
+    python3 -m pytest test_change_tracker.py
+    python3 test_change_tracker.py
+"""
+
+import sys
+import os
+import sqlite3
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import change_tracker
+from change_tracker import ChangeTracker
+from history_store import HistoryStore
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = body
+        self.text = body.decode('utf-8')
+        self.headers = headers or {}
+
+
+class FakeServer:
+    """Replaces http_client.get, answering from a {url: (body, etag)} dict"""
+
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, dict(headers or {})))
+        body, etag = self.pages[url]
+        if etag and (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, body, {'ETag': etag} if etag else {})
+
+
+def run_with_tracker(test):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            store = HistoryStore(os.path.join(directory, "history.db"))
+            server = FakeServer()
+            real_client, change_tracker.http_client = change_tracker.http_client, server
+            try:
+                test(store, server)
+            finally:
+                change_tracker.http_client = real_client
+                store.close()
+    run.__name__ = test.__name__
+    return run
+
+
+def parse_counting(parsed):
+    def parse(response):
+        parsed.append(response.text)
+        return {'length': len(response.text)}
+    return parse
+
+
+@run_with_tracker
+def test_etag_and_304(store, server):
+    tracker = ChangeTracker(store)
+    parsed = []
+    server.pages['http://x/a'] = (b'first', '"v1"')
+    result = tracker.fetch('http://x/a', parse_counting(parsed))
+    assert (result.parsed, result.unchanged, result.status_code) == ({'length': 5}, False, 200)
+
+    result = tracker.fetch('http://x/a', parse_counting(parsed))
+    assert server.requests[-1][1]['If-None-Match'] == '"v1"'
+    assert (result.parsed, result.unchanged, result.status_code) == ({'length': 5}, True, 304)
+    assert parsed == ['first']
+
+    server.pages['http://x/a'] = (b'second!', '"v2"')
+    result = tracker.fetch('http://x/a', parse_counting(parsed))
+    assert (result.parsed, result.unchanged) == ({'length': 7}, False)
+
+
+@run_with_tracker
+def test_same_content_hash_is_unchanged(store, server):
+    tracker = ChangeTracker(store)
+    parsed = []
+    server.pages['http://x/a'] = (b'body', None)
+    tracker.fetch('http://x/a', parse_counting(parsed))
+    result = tracker.fetch('http://x/a', parse_counting(parsed))
+    assert result.unchanged and result.parsed == {'length': 4}
+    assert 'If-None-Match' not in server.requests[-1][1]
+    assert parsed == ['body']
+
+
+@run_with_tracker
+def test_cache_is_bounded_and_falls_back_to_the_store(store, server):
+    tracker = ChangeTracker(store, max_entries=2)
+    parsed = []
+    for name in 'abc':
+        server.pages[f'http://x/{name}'] = (name.encode('utf-8'), f'"{name}"')
+        tracker.fetch(f'http://x/{name}', parse_counting(parsed))
+    assert list(tracker._state) == ['http://x/b', 'http://x/c']
+
+    # Evicted from memory, but its validators are still in the database
+    result = tracker.fetch('http://x/a', parse_counting(parsed))
+    assert result.unchanged and result.status_code == 304
+    assert list(tracker._state) == ['http://x/c', 'http://x/a']
+    assert ChangeTracker(store).fetch('http://x/b', parse_counting(parsed)).unchanged
+    assert parsed == ['a', 'b', 'c']
+
+
+@run_with_tracker
+def test_writes_join_the_history_batch(store, server):
+    tracker = ChangeTracker(store)
+    server.pages['http://x/a'] = (b'body', '"v1"')
+    reader = sqlite3.connect(store.path)
+    with store.batch():
+        tracker.fetch('http://x/a', parse_counting([]))
+        store.record_check('p1', True)
+        assert reader.execute("SELECT COUNT(*) FROM fetch_state").fetchone() == (0,)
+        assert store.get_fetch_state('http://x/a')['etag'] == '"v1"'
+    assert reader.execute("SELECT etag FROM fetch_state").fetchall() == [('"v1"',)]
+    assert reader.execute("SELECT COUNT(*) FROM stock_history").fetchone() == (1,)
+    reader.close()
+
+
+@run_with_tracker
+def test_unconditional_fetch_returns_the_body(store, server):
+    tracker = ChangeTracker(store)
+    parsed = []
+    server.pages['http://x/a'] = (b'body', '"v1"')
+    tracker.fetch('http://x/a', parse_counting(parsed))
+    result = tracker.fetch('http://x/a', parse_counting(parsed), conditional=False)
+    assert 'If-None-Match' not in server.requests[-1][1]
+    assert result.status_code == 200 and result.response.text == 'body'
+    assert result.unchanged and parsed == ['body']
+
+
+@run_with_tracker
+def test_failed_fetch_is_not_stored(store, server):
+    tracker = ChangeTracker(store)
+    server.get = lambda url, headers=None, **kwargs: FakeResponse(500)
+    result = tracker.fetch('http://x/a', parse_counting([]))
+    assert (result.parsed, result.unchanged, result.status_code) == (None, False, 500)
+    assert store.get_fetch_state('http://x/a') is None
+
+
+if __name__ == "__main__":
+    test_etag_and_304()
+    test_same_content_hash_is_unchanged()
+    test_cache_is_bounded_and_falls_back_to_the_store()
+    test_writes_join_the_history_batch()
+    test_unconditional_fetch_returns_the_body()
+    test_failed_fetch_is_not_stored()
+    print("All change tracker tests passed")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for crash-resumable check cycles: what the checkpoint saves and how a restart resumes from it
+
+Run with:
+    python3 -m pytest test_checkpoint.py
+    python3 test_checkpoint.py
+"""
+
+import sys
+import os
+import json
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import stock_check
+from check_result import CheckResult, StockStatus
+from checkpoint import CycleCheckpoint
+from history_store import HistoryStore
+from scheduler import AdaptiveScheduler
+
+CONFIG = {'items': ['a', 'b', 'c'], 'request_delay': 600}
+
+
+def result(product_id, in_stock=False):
+    return CheckResult(product_id, product_id, StockStatus.IN_STOCK if in_stock else StockStatus.OUT_OF_STOCK,
+                       "2026-01-01 12:00:00", {'last_in_stock': None, 'last_check': "2026-01-01 12:00:00",
+                                               'times_in_stock': 0, 'first_seen': "2026-01-01 12:00:00"})
+
+
+def new_scheduler():
+    scheduler = AdaptiveScheduler.from_config(CONFIG)
+    scheduler.sync_items(CONFIG['items'])
+    return scheduler
+
+
+def run_with_history(test):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            history = HistoryStore(os.path.join(directory, "history.db"))
+            real_store, stock_check.get_history_store = stock_check.get_history_store, lambda: history
+            try:
+                test(os.path.join(directory, "checkpoint.jsonl"), history)
+            finally:
+                stock_check.get_history_store = real_store
+                history.close()
+    run.__name__ = test.__name__
+    return run
+
+
+@run_with_history
+def test_no_checkpoint(path, history):
+    assert CycleCheckpoint(path).load() is None
+    assert stock_check.resume_checkpoint(new_scheduler(), CycleCheckpoint(path), CONFIG) == (0, None, [])
+
+
+@run_with_history
+def test_resume_after_a_partial_cycle(path, history):
+    scheduler = new_scheduler()
+    assert scheduler.pop_due() == ['a', 'b', 'c']
+    checkpoint = CycleCheckpoint(path)
+    checkpoint.begin(7, scheduler)
+    checkpoint.record('a', [result('a', in_stock=True)])
+    checkpoint.record('b', [result('b')])
+    # The process dies here, before 'c' is checked and before the history batch commits
+
+    scheduler = new_scheduler()
+    checkpoint = CycleCheckpoint(path)
+    check_count, results, unrecorded = stock_check.resume_checkpoint(scheduler, checkpoint, CONFIG)
+    assert check_count == 7
+    assert sorted((r.product_id, r.in_stock) for r in results) == [('a', True), ('b', False)]
+    assert sorted(r.product_id for r in unrecorded) == ['a', 'b']
+    assert scheduler.pop_due() == ['c']
+    assert history.get('b')['last_check'] == "2026-01-01 12:00:00"
+
+    # The resumed cycle keeps appending to the same checkpoint
+    checkpoint.begin(check_count, scheduler)
+    checkpoint.record('c', [result('c')])
+    progress = CycleCheckpoint(path).load()
+    assert not progress.finished and progress.check_count == 7
+    assert [item_id for _, item_id, _ in progress.items] == ['a', 'b', 'c']
+
+    checkpoint.finish(check_count, scheduler)
+    progress = CycleCheckpoint(path).load()
+    assert progress.finished and progress.check_count == 7 and progress.items == []
+
+
+@run_with_history
+def test_finished_cycle_restores_the_schedule(path, history):
+    scheduler = new_scheduler()
+    scheduler.pop_due()
+    for item_id in CONFIG['items']:
+        scheduler.record_result(item_id, StockStatus.OUT_OF_STOCK)
+    CycleCheckpoint(path).finish(3, scheduler)
+
+    scheduler = new_scheduler()
+    assert stock_check.resume_checkpoint(scheduler, CycleCheckpoint(path), CONFIG) == (3, None, [])
+    assert scheduler.pop_due() == []
+
+
+@run_with_history
+def test_cut_off_and_stale_lines_are_skipped(path, history):
+    scheduler = new_scheduler()
+    scheduler.pop_due()
+    checkpoint = CycleCheckpoint(path)
+    checkpoint.begin(2, scheduler)
+    checkpoint.record('a', [result('a')])
+    with open(path, 'a') as f:
+        f.write(json.dumps({'t': time.time() - 3600, 'item': 'b', 'results': [result('b').to_dict()]}) + '\n')
+        f.write('{"t": 1, "item": "c", "res')
+
+    scheduler = new_scheduler()
+    check_count, results, _ = stock_check.resume_checkpoint(scheduler, CycleCheckpoint(path), CONFIG)
+    assert check_count == 2
+    assert [r.product_id for r in results] == ['a']
+    assert scheduler.pop_due() == ['b', 'c']
+
+
+@run_with_history
+def test_only_unrecorded_results_go_to_the_time_series(path, history):
+    scheduler = new_scheduler()
+    scheduler.pop_due()
+    checkpoint = CycleCheckpoint(path)
+    checkpoint.begin(4, scheduler)
+    checkpoint.record('a', [result('a')])
+    # A cycle stopped part way still writes its results to the time series
+    checkpoint.series_recorded()
+    checkpoint.record('b', [result('b')])
+
+    _, results, unrecorded = stock_check.resume_checkpoint(new_scheduler(), CycleCheckpoint(path), CONFIG)
+    assert sorted(r.product_id for r in results) == ['a', 'b']
+    assert [r.product_id for r in unrecorded] == ['b']
+
+
+if __name__ == "__main__":
+    test_no_checkpoint()
+    test_resume_after_a_partial_cycle()
+    test_finished_cycle_restores_the_schedule()
+    test_cut_off_and_stale_lines_are_skipped()
+    test_only_unrecorded_results_go_to_the_time_series()
+    print("All checkpoint tests passed")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared config: the stat-keyed cache, atomic saves and save listeners
+
+Run with:
+    python3 -m pytest test_config_service.py
+    python3 test_config_service.py
+"""
+
+import sys
+import os
+import tempfile
+import yaml
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import config_service
+
+
+class CountingYaml:
+    """Replaces the yaml module in config_service, counting parses"""
+
+    def __init__(self):
+        self.loads = 0
+
+    def safe_load(self, stream):
+        self.loads += 1
+        return yaml.safe_load(stream)
+
+    def dump(self, *args, **kwargs):
+        return yaml.dump(*args, **kwargs)
+
+
+def run_with_config_file(test):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            counting = CountingYaml()
+            saved = (config_service.CONFIG_FILE, config_service.yaml, config_service._save_listeners)
+            config_service.CONFIG_FILE = os.path.join(directory, 'config', 'checker.yaml')
+            config_service.yaml = counting
+            config_service._save_listeners = []
+            config_service._cached_key = config_service._cached_config = None
+            try:
+                test(config_service.CONFIG_FILE, counting)
+            finally:
+                config_service.CONFIG_FILE, config_service.yaml, config_service._save_listeners = saved
+                config_service._cached_key = config_service._cached_config = None
+    run.__name__ = test.__name__
+    return run
+
+
+@run_with_config_file
+def test_missing_file_gives_the_defaults(path, counting):
+    assert config_service.config_key() is None
+    assert config_service.load_config() == config_service.default_config()
+    assert config_service.load_config()['check_mode'] == 'api'
+
+
+@run_with_config_file
+def test_file_is_parsed_once_until_an_external_edit(path, counting):
+    config_service.save_config({'items': ['a']})
+    config_service._cached_key = None  # As if another process had saved it
+    assert config_service.load_config() == {'items': ['a']}
+    assert config_service.load_config() == {'items': ['a']}
+    assert counting.loads == 1
+
+    with open(path, 'w') as f:
+        f.write("items:\n- a\n- b\n")
+    assert config_service.load_config() == {'items': ['a', 'b']}
+    assert counting.loads == 2
+
+
+@run_with_config_file
+def test_save_invalidates_the_cache(path, counting):
+    config_service.save_config({'items': ['a']})
+    config_service.save_config({'items': ['b'], 'request_delay': 60})
+    assert config_service.load_config() == {'items': ['b'], 'request_delay': 60}
+    # The saved config is cached as written, without parsing the file again
+    assert counting.loads == 0
+    with open(path) as f:
+        assert yaml.safe_load(f) == {'items': ['b'], 'request_delay': 60}
+    assert os.listdir(os.path.dirname(path)) == ['checker.yaml']
+
+
+@run_with_config_file
+def test_callers_get_independent_copies(path, counting):
+    config = {'items': ['a'], 'discord': {'webhook_url': ''}}
+    config_service.save_config(config)
+    config['items'].append('changed after saving')
+
+    first = config_service.load_config()
+    first['items'].append('b')
+    first['discord']['webhook_url'] = 'http://changed'
+    assert config_service.load_config() == {'items': ['a'], 'discord': {'webhook_url': ''}}
+
+
+@run_with_config_file
+def test_save_falls_back_to_writing_in_place(path, counting):
+    def refuse(src, dst):
+        raise OSError("Device or resource busy")
+
+    real_replace, config_service.os.replace = config_service.os.replace, refuse
+    try:
+        config_service.save_config({'items': ['a']})
+    finally:
+        config_service.os.replace = real_replace
+    with open(path) as f:
+        assert yaml.safe_load(f) == {'items': ['a']}
+    assert os.listdir(os.path.dirname(path)) == ['checker.yaml']
+    assert config_service.load_config() == {'items': ['a']}
+
+
+@run_with_config_file
+def test_listeners_run_after_each_save(path, counting):
+    calls = []
+
+    @config_service.on_save
+    def failing():
+        calls.append('failing')
+        raise RuntimeError("listener error")
+
+    config_service.on_save(lambda: calls.append(config_service.load_config()['items']))
+    config_service.save_config({'items': ['a']})
+    config_service.save_config({'items': ['a', 'b']})
+    assert calls == ['failing', ['a'], 'failing', ['a', 'b']]
+
+
+if __name__ == "__main__":
+    test_missing_file_gives_the_defaults()
+    test_file_is_parsed_once_until_an_external_edit()
+    test_save_invalidates_the_cache()
+    test_callers_get_independent_copies()
+    test_save_falls_back_to_writing_in_place()
+    test_listeners_run_after_each_save()
+    print("All config service tests passed")
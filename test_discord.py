@@ -8,6 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from stock_check import send_discord_webhook
+from check_result import CheckResult, StockStatus
 
 def test_discord_webhook():
     """Test Discord webhook with sample data"""
@@ -29,16 +30,12 @@ def test_discord_webhook():
     
     # Sample product data
     product_summaries = [
-        (
-            {'boxName': 'Test Gaming Laptop', 'boxId': 'SLAPGAMINGLAP123'},
-            'IN STOCK',
-            '2024-01-01 12:00:00',
+        CheckResult(
+            'SLAPGAMINGLAP123', 'Test Gaming Laptop', StockStatus.IN_STOCK, '2024-01-01 12:00:00',
             {'last_in_stock': '2024-01-01 12:00:00', 'times_in_stock': 3}
         ),
-        (
-            {'boxName': 'Test Graphics Card', 'boxId': 'SGCNVIDIA4090RTX'},
-            'OUT OF STOCK',
-            '2024-01-01 12:00:00',
+        CheckResult(
+            'SGCNVIDIA4090RTX', 'Test Graphics Card', StockStatus.OUT_OF_STOCK, '2024-01-01 12:00:00',
             {'last_in_stock': '2023-12-15 08:30:00', 'times_in_stock': 1}
         )
     ]
@@ -47,10 +44,9 @@ def test_discord_webhook():
         # Test with product summaries
         send_discord_webhook(
             config, 
-            "Test message from CEX Stock Checker", 
-            True, 
-            "1/2 IN STOCK", 
-            product_summaries
+            "check_result", 
+            product_summaries=product_summaries,
+            custom_message="Test message from CEX Stock Checker - 1/2 IN STOCK"
         )
         print("✅ Discord webhook test completed successfully!")
         print("Check your Discord channel for the test notification.")
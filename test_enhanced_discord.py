@@ -7,6 +7,7 @@ Tests the new rich Discord notifications with images and styling
 import yaml
 import time
 from stock_check import send_discord_webhook
+from check_result import CheckResult, StockStatus
 
 def load_test_config():
     """Load configuration or create a test one"""
@@ -31,66 +32,57 @@ def load_test_config():
 def create_test_product_summaries():
     """Create sample product data for testing"""
     return [
-        (
-            {
-                'boxName': 'iPhone 14 Pro 128GB Space Black Unlocked',
-                'boxId': 'SPHAPP14P128GBSBL',
-                'sellPrice': 899.00,
-                'cashPrice': 650.00,
-                'exchangePrice': 720.00,
-                'imageUrls': ['/site-media/images/products/iphone14pro.jpg']
-            },
-            "IN STOCK",
-            "2025-01-11 20:30:00",
-            {
+        CheckResult(
+            product_id='SPHAPP14P128GBSBL',
+            name='iPhone 14 Pro 128GB Space Black Unlocked',
+            status=StockStatus.IN_STOCK,
+            checked_at="2025-01-11 20:30:00",
+            stock_history={
                 'last_in_stock': '2025-01-11 20:30:00',
                 'times_in_stock': 5
-            }
-        ),
-        (
-            {
-                'boxName': 'Sony PlayStation 5 Console',
-                'boxId': 'SCOSONPS5C825GB',
-                'sellPrice': 479.99,
-                'cashPrice': 320.00,
-                'exchangePrice': 380.00
             },
-            "OUT OF STOCK",
-            "2025-01-11 20:30:00",
-            {
+            sell_price=899.00,
+            cash_price=650.00,
+            exchange_price=720.00
+        ),
+        CheckResult(
+            product_id='SCOSONPS5C825GB',
+            name='Sony PlayStation 5 Console',
+            status=StockStatus.OUT_OF_STOCK,
+            checked_at="2025-01-11 20:30:00",
+            stock_history={
                 'last_in_stock': '2025-01-10 14:22:15',
                 'times_in_stock': 12
-            }
-        ),
-        (
-            {
-                'boxName': 'MacBook Air M2 13" 256GB Space Grey',
-                'boxId': 'SCOAPPMBA13256GBSG',
-                'sellPrice': 1299.00,
-                'cashPrice': 890.00,
-                'exchangePrice': 1050.00
             },
-            "IN STOCK",
-            "2025-01-11 20:30:00",
-            {
+            sell_price=479.99,
+            cash_price=320.00,
+            exchange_price=380.00
+        ),
+        CheckResult(
+            product_id='SCOAPPMBA13256GBSG',
+            name='MacBook Air M2 13" 256GB Space Grey',
+            status=StockStatus.IN_STOCK,
+            checked_at="2025-01-11 20:30:00",
+            stock_history={
                 'last_in_stock': '2025-01-11 20:30:00',
                 'times_in_stock': 3
-            }
-        ),
-        (
-            {
-                'boxName': 'Nintendo Switch OLED Console White',
-                'boxId': 'SCONINSWOLEDW',
-                'sellPrice': 309.99,
-                'cashPrice': 185.00,
-                'exchangePrice': 220.00
             },
-            "OUT OF STOCK",
-            "2025-01-11 20:30:00",
-            {
+            sell_price=1299.00,
+            cash_price=890.00,
+            exchange_price=1050.00
+        ),
+        CheckResult(
+            product_id='SCONINSWOLEDW',
+            name='Nintendo Switch OLED Console White',
+            status=StockStatus.OUT_OF_STOCK,
+            checked_at="2025-01-11 20:30:00",
+            stock_history={
                 'last_in_stock': 'Never',
                 'times_in_stock': 0
-            }
+            },
+            sell_price=309.99,
+            cash_price=185.00,
+            exchange_price=220.00
         )
     ]
 
@@ -127,7 +119,9 @@ def test_enhanced_notifications():
     
     # Test 3: All items in stock (best case scenario)
     print("\n3. Testing ALL ITEMS IN STOCK scenario...")
-    all_in_stock = [(item[0], "IN STOCK", item[2], item[3]) for item in product_summaries[:2]]
+    all_in_stock = [CheckResult(item.product_id, item.name, StockStatus.IN_STOCK, item.checked_at, item.stock_history,
+                                item.sell_price, item.cash_price, item.exchange_price)
+                    for item in product_summaries[:2]]
     success = send_discord_webhook(
         config,
         "check_result", 
@@ -139,7 +133,9 @@ def test_enhanced_notifications():
     
     # Test 4: No items in stock
     print("\n4. Testing NO ITEMS IN STOCK scenario...")
-    all_out_of_stock = [(item[0], "OUT OF STOCK", item[2], item[3]) for item in product_summaries[:2]]
+    all_out_of_stock = [CheckResult(item.product_id, item.name, StockStatus.OUT_OF_STOCK, item.checked_at,
+                                    item.stock_history, item.sell_price, item.cash_price, item.exchange_price)
+                        for item in product_summaries[:2]]
     success = send_discord_webhook(
         config,
         "check_result",
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite stock history: legacy JSON migration and batched commits
+
+Run with:
+    python3 -m pytest test_history_store.py
+    python3 test_history_store.py
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from history_store import HistoryStore
+
+
+def record(last_check, times_in_stock, last_in_stock=None, first_seen="2025-01-01 00:00:00"):
+    return {'last_in_stock': last_in_stock, 'last_check': last_check,
+            'times_in_stock': times_in_stock, 'first_seen': first_seen}
+
+
+def write_json(directory, name, data):
+    with open(os.path.join(directory, name), 'w') as f:
+        if isinstance(data, str):
+            f.write(data)
+        else:
+            json.dump(data, f)
+
+
+def run_with_store(test):
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            store = HistoryStore(os.path.join(directory, "history.db"))
+            try:
+                test(directory, store)
+            finally:
+                store.close()
+    run.__name__ = test.__name__
+    return run
+
+
+@run_with_store
+def test_migration_merges_the_shared_and_per_product_files(directory, store):
+    write_json(directory, "stock_history.json", {
+        'a': record("2026-01-01 10:00:00", 5, last_in_stock="2026-01-01 09:00:00"),
+        'b': record("2026-01-01 10:00:00", 1),
+    })
+    write_json(directory, "stock_history_a.json", record("2026-01-02 10:00:00", 2))
+    store.migrate_json_files(directory)
+
+    a = store.get('a')
+    assert a['last_check'] == "2026-01-02 10:00:00"
+    assert a['last_in_stock'] == "2026-01-01 09:00:00"
+    assert a['times_in_stock'] == 5
+    assert store.get('b')['times_in_stock'] == 1
+    assert sorted(name for name in os.listdir(directory) if name.startswith("stock_history")) == [
+        "stock_history.json.migrated", "stock_history_a.json.migrated"]
+
+
+@run_with_store
+def test_migration_keeps_the_higher_count_already_stored(directory, store):
+    for _ in range(4):
+        store.record_check('a', True)
+    write_json(directory, "stock_history_a.json", record("2026-01-02 10:00:00", 2))
+    store.migrate_json_files(directory)
+    assert store.get('a')['times_in_stock'] == 4
+
+
+@run_with_store
+def test_unreadable_and_malformed_files_are_left_in_place(directory, store):
+    write_json(directory, "stock_history.json", ["not", "a", "mapping"])
+    write_json(directory, "stock_history_cut.json", '{"last_check": "2026-01')
+    write_json(directory, "stock_history_other.json", {'x': 1})
+    write_json(directory, "stock_history_good.json", record("2026-01-02 10:00:00", 3))
+    store.migrate_json_files(directory)
+
+    assert list(store.load_all()) == ['good']
+    for name in ("stock_history.json", "stock_history_cut.json", "stock_history_other.json",
+                 "stock_history_good.json.migrated"):
+        assert os.path.exists(os.path.join(directory, name)), name
+
+
+@run_with_store
+def test_batch_commits_once_at_the_outermost_block(directory, store):
+    reader = sqlite3.connect(store.path)
+    try:
+        with store.batch():
+            store.record_check('a', True)
+            with store.batch():
+                store.record_check('b', False)
+            assert reader.execute("SELECT COUNT(*) FROM stock_history").fetchone() == (0,)
+            # Reads inside the batch see its own pending updates
+            assert store.record_check('a', True)['times_in_stock'] == 2
+        assert reader.execute("SELECT product_id, times_in_stock FROM stock_history "
+                              "ORDER BY product_id").fetchall() == [('a', 2), ('b', 0)]
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    test_migration_merges_the_shared_and_per_product_files()
+    test_migration_keeps_the_higher_count_already_stored()
+    test_unreadable_and_malformed_files_are_left_in_place()
+    test_batch_commits_once_at_the_outermost_block()
+    print("All history store tests passed")
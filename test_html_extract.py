@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Parity tests: extract_page_markers() must agree with the full BeautifulSoup parse
+
+Run with:
+    python3 -m pytest test_html_extract.py
+    python3 test_html_extract.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from html_extract import extract_page_markers, parse_with_soup
+
+FIXTURE_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cex", "product-detail.html")
+
+IN_STOCK_PAGE = """<!DOCTYPE html>
+<html><head><title>  Grand Theft Auto V &amp; Map  </title><meta charset="utf-8"></head>
+<body><div id="__nuxt"><div class="product-detail">
+  <div data-testid="price">&pound;12.00</div>
+  <div data-testid="quantity-selector"><select><option>1</option></select></div>
+  <button data-testid="add-to-basket-button" type="button">Add to basket</button>
+  <div data-testid="reviews"><div class="list"><div data-testid="review">Good</div></div></div>
+</div></div></body></html>"""
+
+PAGES = {
+    'empty': "",
+    'no markers': "<html><body><p>Nothing here</p></body></html>",
+    'in stock': IN_STOCK_PAGE,
+    'wrong tags': """<span data-testid="price">1</span><div data-testid="add-to-basket-button"></div>
+        <a data-testid="out-of-stock-message"></a><button data-testid="quantity-selector"></button>""",
+    'markers only in script': """<title>Scripted</title><script>
+        document.write('<div data-testid="price"></div><button data-testid="add-to-basket-button">');
+        </script><style>div[data-testid="reviews"] { color: red }</style>""",
+    'markers in a comment': """<!-- <div data-testid="out-of-stock-message"></div> --><title>x</title>""",
+    'review outside reviews': """<div data-testid="reviews"></div><div data-testid="review">Stray</div>""",
+    'reviews without review': """<div data-testid="reviews"><div class="review">No testid</div></div>""",
+    'review in second reviews section': """<div data-testid="reviews"><p>none</p></div>
+        <div data-testid="reviews"><div data-testid="review">Later</div></div>""",
+    'nested review': """<div data-testid="reviews"><section><ul><li><div data-testid="review">Deep</div></li></ul>
+        </section></div>""",
+    'unclosed div in reviews': """<div data-testid="reviews"><div class="wrap"><div data-testid="review">x</div>""",
+    'reviews closed by parent': """<section><div data-testid="reviews"><p>none</section>
+        <div data-testid="review">After</div>""",
+    'stray end tags': """<div data-testid="reviews"></span></p></b><div data-testid="review">x</div></div>""",
+    'void elements': """<div data-testid="reviews"><br><img src="a.png"><input type="hidden"></br>
+        <div data-testid="review">x</div></div>""",
+    'self-closing div': """<div data-testid="reviews"/><div data-testid="review">x</div>""",
+    'uppercase tags': """<TITLE>Upper</TITLE><DIV DATA-TESTID="price"></DIV>
+        <BUTTON data-testid="add-to-basket-button"></BUTTON>""",
+    'duplicate attributes': """<div data-testid="price" data-testid="other"></div>
+        <div data-testid="other" data-testid="out-of-stock-message"></div>""",
+    'unquoted attributes': """<div data-testid=price></div><div data-testid=quantity-selector></div>""",
+    'attribute without value': """<div data-testid></div><div data-testid="price" hidden></div>""",
+    'title with markup': """<title> Part one <b>bold</b> <!-- hidden --> part &lt;two&gt; </title>""",
+    'empty title': """<title></title><div data-testid="price"></div>""",
+    'two titles': """<title>First</title><svg><title>Second</title></svg>""",
+    'unclosed title': """<head><title>Never closed</head><body><div data-testid="price">12</div>""",
+    'title inside reviews': """<div data-testid="reviews"><title>Odd</title></div>""",
+    'entities in testid': """<div data-testid="&#112;rice"></div><div data-testid="revi&#101;ws">
+        <div data-testid="review"></div></div>""",
+}
+
+
+def assert_parity(name, html):
+    expected = parse_with_soup(html)
+    actual = extract_page_markers(html)
+    assert actual == expected, f"{name}: expected {expected}, got {actual}"
+
+
+def test_fixture_page():
+    with open(FIXTURE_PAGE, 'r', encoding='utf-8') as f:
+        html = f.read()
+    assert_parity('fixture', html)
+    markers = extract_page_markers(html)
+    assert markers['out_of_stock_message'] and markers['price'] and markers['has_reviews']
+    assert not markers['buy_button']
+
+
+def test_in_stock_page():
+    markers = extract_page_markers(IN_STOCK_PAGE)
+    assert markers == {
+        'buy_button': True,
+        'out_of_stock_message': False,
+        'price': True,
+        'quantity_selector': True,
+        'has_reviews': True,
+        'title': "Grand Theft Auto V & Map",
+    }
+
+
+def test_parity_cases():
+    for name, html in PAGES.items():
+        assert_parity(name, html)
+
+
+def test_parity_truncated_pages():
+    # Pages cut off mid-download must still parse the same way. A character
+    # reference cut off at the very end is left out: BeautifulSoup mangles it.
+    for name, html in PAGES.items():
+        for end in range(len(html) + 1):
+            truncated = html[:end]
+            if '&' in truncated and ';' not in truncated[truncated.rfind('&'):]:
+                continue
+            assert_parity(f"{name}[:{end}]", truncated)
+
+
+if __name__ == "__main__":
+    test_fixture_page()
+    test_in_stock_page()
+    test_parity_cases()
+    test_parity_truncated_pages()
+    print("All parity checks passed")
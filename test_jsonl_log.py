@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for the rotated JSON Lines log: tail order, rotation and incremental reads
+
+Run with:
+    python3 -m pytest test_jsonl_log.py
+    python3 test_jsonl_log.py
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import jsonl_log
+from jsonl_log import AppendLog
+
+
+def test_tail_is_newest_first():
+    with tempfile.TemporaryDirectory() as directory:
+        log = AppendLog(os.path.join(directory, "log.jsonl"))
+        assert log.tail(5) == []
+        assert not log.exists()
+        for n in range(10):
+            log.append({'n': n})
+        assert [entry['n'] for entry in log.tail(3)] == [9, 8, 7]
+        assert [entry['n'] for entry in log.tail(50)] == list(range(9, -1, -1))
+
+
+def test_tail_reads_lines_longer_than_a_block():
+    with tempfile.TemporaryDirectory() as directory:
+        log = AppendLog(os.path.join(directory, "log.jsonl"))
+        for n in range(5):
+            log.append({'n': n, 'text': 'x' * (jsonl_log.READ_BLOCK_SIZE + n * 1000)})
+        assert [entry['n'] for entry in log.tail(5)] == [4, 3, 2, 1, 0]
+
+
+def test_tail_skips_a_partly_written_line():
+    with tempfile.TemporaryDirectory() as directory:
+        log = AppendLog(os.path.join(directory, "log.jsonl"))
+        log.append({'n': 1})
+        with open(log.path, 'ab') as f:
+            f.write(b'{"n": 2')
+        assert log.tail(5) == [{'n': 1}]
+
+
+def test_rotation_keeps_max_segments():
+    with tempfile.TemporaryDirectory() as directory:
+        log = AppendLog(os.path.join(directory, "log.jsonl"), max_segment_bytes=100, max_segments=3)
+        for n in range(100):
+            log.append({'n': n})
+        assert not os.path.exists(f"{log.path}.3")
+        for path in log.segment_paths():
+            assert os.path.getsize(path) <= 100
+        entries = [entry['n'] for entry in log.tail(1000)]
+        assert entries[0] == 99
+        assert entries == list(range(99, 99 - len(entries), -1))
+        assert len(entries) < 100
+
+
+def test_read_since_follows_rotation():
+    with tempfile.TemporaryDirectory() as directory:
+        log = AppendLog(os.path.join(directory, "log.jsonl"), max_segment_bytes=60, max_segments=4)
+        assert log.read_since(log.end_position()) == ([], (None, 0))
+        log.append({'n': 0})
+        position = log.end_position()
+        for n in range(1, 8):
+            log.append({'n': n})
+        entries, position = log.read_since(position)
+        # A reader that fell behind one rotation still sees every entry once
+        assert [entry['n'] for entry in entries] == list(range(1, 8))
+        assert log.read_since(position)[0] == []
+        log.append({'n': 8})
+        assert [entry['n'] for entry in log.read_since(position)[0]] == [8]
+
+
+if __name__ == "__main__":
+    test_tail_is_newest_first()
+    test_tail_reads_lines_longer_than_a_block()
+    test_tail_skips_a_partly_written_line()
+    test_rotation_keeps_max_segments()
+    test_read_since_follows_rotation()
+    print("All JSON Lines log tests passed")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the product metadata cache: LRU eviction, the two TTLs and fetch on miss
+
+Run with:
+    python3 -m pytest test_metadata_cache.py
+    python3 test_metadata_cache.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from metadata_cache import MetadataCache
+
+
+def product(product_id, price=10.0):
+    return {'boxId': product_id, 'boxName': f"Game {product_id}", 'sellPrice': price,
+            'ecomQuantityOnHand': 3, 'outOfStock': False}
+
+
+def test_lru_eviction():
+    cache = MetadataCache(max_entries=2)
+    cache.put(product('a'), now=0)
+    cache.put(product('b'), now=0)
+    assert cache.get('a', now=1) is not None  # 'a' is now the most recently used
+    cache.put(product('c'), now=2)
+    assert cache.get('b', now=3) is None
+    assert cache.get('a', now=3)['boxName'] == "Game a"
+    assert cache.get('c', now=3) is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['entries'] == 2
+
+
+def test_configure_shrinks_the_cache():
+    cache = MetadataCache(max_entries=5)
+    for product_id in 'abcde':
+        cache.put(product(product_id), now=0)
+    cache.configure({'metadata_cache': {'max_entries': 2}})
+    assert [product_id for product_id in 'abcde' if cache.get(product_id, now=1)] == ['d', 'e']
+
+
+def test_price_ttl_is_shorter_than_static_ttl():
+    cache = MetadataCache(static_ttl=100, price_ttl=10)
+    cache.put(product('a', price=12.5), now=0)
+    assert cache.get('a', now=5) == {'boxId': 'a', 'boxName': "Game a", 'sellPrice': 12.5}
+    assert cache.get('a', now=50) is None
+    assert cache.get('a', need_prices=False, now=50) == {'boxId': 'a', 'boxName': "Game a"}
+    assert cache.get('a', need_prices=False, now=150) is None
+    assert cache.stats()['expired'] == 2
+
+
+def test_never_caches_stock():
+    cache = MetadataCache()
+    cache.put(product('a'))
+    metadata = cache.get('a')
+    assert 'ecomQuantityOnHand' not in metadata and 'outOfStock' not in metadata
+
+
+def test_get_or_fetch():
+    cache = MetadataCache()
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return {'boxName': "Fetched", 'sellPrice': 3.0}
+
+    assert cache.get_or_fetch('a', fetch) == {'boxId': 'a', 'boxName': "Fetched", 'sellPrice': 3.0}
+    assert cache.get_or_fetch('a', fetch)['boxName'] == "Fetched"
+    assert len(fetched) == 1
+    assert cache.get_or_fetch('unknown', lambda: None) is None
+    assert cache.get('unknown') is None
+    cache.invalidate('a')
+    cache.get_or_fetch('a', fetch)
+    assert len(fetched) == 2
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_configure_shrinks_the_cache()
+    test_price_ttl_is_shorter_than_static_ttl()
+    test_never_caches_stock()
+    test_get_or_fetch()
+    print("All metadata cache tests passed")
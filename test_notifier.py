@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for background notification delivery: retries, 429 handling, coalescing and dead letters
+
+Run with:
+    python3 -m pytest test_notifier.py
+    python3 test_notifier.py
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import notifier
+from notifier import Notification, NotificationDispatcher
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.text = "" if body is None else str(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeWebhook:
+    """Replaces http_client, answering posts with the queued responses (then 204s)"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, json=None, **kwargs):
+        self.posts.append(json)
+        return self.responses.pop(0) if self.responses else FakeResponse(204)
+
+
+def run_with_dispatcher(*responses):
+    def decorate(test):
+        def run():
+            webhook = FakeWebhook(*responses)
+            real_client, notifier.http_client = notifier.http_client, webhook
+            with tempfile.TemporaryDirectory() as directory:
+                logged = []
+                dispatcher = NotificationDispatcher(logged.append, os.path.join(directory, "dead.jsonl"))
+                dispatcher.configure({'notifications': {'backoff_base': 0.001, 'backoff_max': 0.05,
+                                                        'max_attempts': 3}})
+                try:
+                    test(dispatcher, webhook, logged)
+                finally:
+                    notifier.http_client = real_client
+        run.__name__ = test.__name__
+        return run
+    return decorate
+
+
+@run_with_dispatcher()
+def test_delivers_in_the_background(dispatcher, webhook, logged):
+    dispatcher.submit("http://hook", {'content': 'a'}, "check_result")
+    dispatcher.submit("http://hook", {'content': 'b'}, "check_result")
+    assert dispatcher.flush(timeout=5)
+    assert webhook.posts == [{'content': 'a'}, {'content': 'b'}]
+    assert [entry['status'] for entry in logged] == ["success", "success"]
+    assert dispatcher.pending() == 0
+
+
+@run_with_dispatcher(FakeResponse(429, {'Retry-After': '0.02'}), FakeResponse(429, body={'retry_after': 0.01}))
+def test_retries_after_discord_429(dispatcher, webhook, logged):
+    dispatcher.submit("http://hook", {'content': 'a'}, "check_result")
+    assert dispatcher.flush(timeout=5)
+    assert len(webhook.posts) == 3
+    assert logged[-1]['status'] == "success" and logged[-1]['attempts'] == 3
+    assert not dispatcher.dead_letters.exists()
+
+
+@run_with_dispatcher(FakeResponse(500), FakeResponse(502), FakeResponse(503))
+def test_gives_up_after_max_attempts(dispatcher, webhook, logged):
+    dispatcher.submit("http://hook", {'content': 'a'}, "alert")
+    assert dispatcher.flush(timeout=5)
+    assert len(webhook.posts) == 3
+    dead = dispatcher.dead_letters.tail(5)
+    assert len(dead) == 1
+    assert dead[0]['attempts'] == 3 and dead[0]['payload'] == {'content': 'a'}
+    assert dead[0]['reason'] == "HTTP 503"
+
+
+@run_with_dispatcher(FakeResponse(404, body="Unknown Webhook"))
+def test_client_errors_are_not_retried(dispatcher, webhook, logged):
+    dispatcher.submit("http://hook", {'content': 'a'}, "alert")
+    assert dispatcher.flush(timeout=5)
+    assert len(webhook.posts) == 1
+    assert logged[0]['status'] == "failed"
+    assert dispatcher.dead_letters.tail(5)[0]['reason'].startswith("HTTP 404")
+
+
+@run_with_dispatcher()
+def test_queued_notifications_coalesce_to_the_newest(dispatcher, webhook, logged):
+    # Fill the queue directly so the delivery thread cannot take anything early
+    for content in ('a', 'b', 'c'):
+        dispatcher._queue.append(Notification("http://hook", {'content': content}, "check_result", "summary"))
+    dispatcher._queue.append(Notification("http://hook", {'content': 'other'}, "alert"))
+    with dispatcher._cond:
+        first, _ = dispatcher._next()
+        second, _ = dispatcher._next()
+    assert first.payload == {'content': 'c'}
+    assert second.payload == {'content': 'other'}
+    assert dispatcher.coalesced == 2
+
+
+@run_with_dispatcher(FakeResponse(204, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset-After': '60'}))
+def test_empty_rate_limit_bucket_pauses_sending(dispatcher, webhook, logged):
+    dispatcher.submit("http://hook", {'content': 'a'}, "check_result")
+    dispatcher.submit("http://hook", {'content': 'b'}, "check_result")
+    assert not dispatcher.flush(timeout=0.2)
+    assert webhook.posts == [{'content': 'a'}]
+    dispatcher._paused_until = 0.0
+    with dispatcher._cond:
+        dispatcher._cond.notify_all()
+    assert dispatcher.flush(timeout=5)
+    assert len(webhook.posts) == 2
+
+
+if __name__ == "__main__":
+    test_delivers_in_the_background()
+    test_retries_after_discord_429()
+    test_gives_up_after_max_attempts()
+    test_client_errors_are_not_retried()
+    test_queued_notifications_coalesce_to_the_newest()
+    test_empty_rate_limit_bucket_pauses_sending()
+    print("All notifier tests passed")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-host token buckets and the backoff after 429/503 responses
+
+Run with:
+    python3 -m pytest test_rate_limit.py
+    python3 test_rate_limit.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import rate_limit
+from rate_limit import RateLimiter, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping just moves the clock on"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def with_fake_clock(test):
+    def run():
+        real_time, rate_limit.time = rate_limit.time, FakeClock()
+        try:
+            test(rate_limit.time)
+        finally:
+            rate_limit.time = real_time
+    run.__name__ = test.__name__
+    return run
+
+
+@with_fake_clock
+def test_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == 0.5
+    assert bucket.reserve() == 1.0
+    clock.now += 10
+    assert bucket.reserve() == 0.0  # Refilled, but never past the burst
+
+
+@with_fake_clock
+def test_set_rate_keeps_earned_tokens(clock):
+    bucket = TokenBucket(rate=1, burst=4)
+    for _ in range(4):
+        bucket.reserve()
+    clock.now += 2
+    bucket.set_rate(10, 4)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.1
+
+
+@with_fake_clock
+def test_retry_after_blocks_the_host(clock):
+    limiter = RateLimiter(requests_per_second=100, burst=10)
+    assert limiter.backoff('api.example', 0, retry_after=5) == 5
+    limiter.acquire('api.example')
+    assert clock.slept == [5]
+    limiter.acquire('other.example')
+    assert clock.slept == [5]
+
+
+@with_fake_clock
+def test_exponential_backoff_is_capped(clock):
+    limiter = RateLimiter(backoff_base=1.0, backoff_max=8.0)
+    for attempt in range(6):
+        delay = limiter.backoff('api.example', attempt)
+        assert 0 <= delay <= min(8.0, 2 ** attempt)
+    assert limiter.backoff('api.example', 0, retry_after=600) == 8.0
+
+
+@with_fake_clock
+def test_reconfigure_keeps_backoff(clock):
+    limiter = RateLimiter()
+    limiter.backoff('api.example', 0, retry_after=30)
+    limiter.reconfigure({'rate_limit': {'requests_per_second': 5, 'hosts': {'api.example': {'burst': 1}}}})
+    assert limiter.requests_per_second == 5
+    limiter.acquire('api.example')
+    assert clock.slept == [30]
+    assert limiter._bucket('api.example').burst == 1
+
+
+def test_host_delay_sets_the_rate():
+    assert RateLimiter.from_config({'host_delay': 0.25}).requests_per_second == 4
+    assert RateLimiter.from_config({'host_delay': 0}).requests_per_second == 0
+    assert RateLimiter.from_config({'host_delay': 0.25, 'rate_limit': {'requests_per_second': 1}}) \
+        .requests_per_second == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+if __name__ == "__main__":
+    test_bucket_allows_burst_then_paces()
+    test_set_rate_keeps_earned_tokens()
+    test_retry_after_blocks_the_host()
+    test_exponential_backoff_is_capped()
+    test_reconfigure_keeps_backoff()
+    test_host_delay_sets_the_rate()
+    test_parse_retry_after()
+    print("All rate limit tests passed")
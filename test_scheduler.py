@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive scheduler: due ordering, the rate ceiling and state restore
+
+Run with:
+    python3 -m pytest test_scheduler.py
+    python3 test_scheduler.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from check_result import CheckResult, StockStatus
+from scheduler import AdaptiveScheduler, RATE_WINDOW
+from stock_check import record_cycle_results
+
+NOW = 1_000_000.0
+
+
+def test_pop_due_returns_items_in_due_order():
+    scheduler = AdaptiveScheduler(600)
+    scheduler.sync_items(['a', 'b', 'c'], now=NOW)
+    assert scheduler.pop_due(now=NOW) == ['a', 'b', 'c']
+    scheduler.record_result('c', StockStatus.OUT_OF_STOCK, now=NOW)
+    scheduler.record_result('a', StockStatus.OUT_OF_STOCK, now=NOW + 10)
+    scheduler.record_result('b', StockStatus.OUT_OF_STOCK, now=NOW + 20)
+    assert scheduler.pop_due(now=NOW + 100) == []
+    assert scheduler.pop_due(now=NOW + 615) == ['c', 'a']
+    assert scheduler.pop_due(now=NOW + 620) == ['b']
+    scheduler.record_result('a', StockStatus.OUT_OF_STOCK, now=NOW + 620)
+    assert scheduler.seconds_until_next(now=NOW + 620) == 600
+
+
+def test_pop_due_skips_removed_items():
+    scheduler = AdaptiveScheduler(600)
+    scheduler.sync_items(['a', 'b'], now=NOW)
+    scheduler.sync_items(['b'], now=NOW)
+    assert scheduler.pop_due(now=NOW) == ['b']
+    assert scheduler.next_due_time() is None
+
+
+def test_pop_due_respects_checks_per_minute():
+    scheduler = AdaptiveScheduler(600, max_checks_per_minute=2)
+    scheduler.sync_items(['a', 'b', 'c', 'd', 'e'], now=NOW)
+    assert scheduler.pop_due(now=NOW) == ['a', 'b']
+    assert scheduler.pop_due(now=NOW + 30) == []
+    assert scheduler.seconds_until_next(now=NOW + 30) == RATE_WINDOW - 30
+    assert scheduler.pop_due(now=NOW + RATE_WINDOW) == ['c', 'd']
+    assert scheduler.pop_due(now=NOW + 2 * RATE_WINDOW) == ['e']
+
+
+def test_fixed_schedule_keeps_one_cycle():
+    items = [f"item{n}" for n in range(200)]
+    scheduler = AdaptiveScheduler.from_config({'request_delay': 3})
+    scheduler.sync_items(items, now=NOW)
+    assert sorted(scheduler.pop_due(now=NOW)) == sorted(items)
+    summary = [CheckResult(item_id, item_id, StockStatus.OUT_OF_STOCK, None, {}) for item_id in items[:150]]
+    record_cycle_results(scheduler, items, summary, now=NOW + 2)
+    # Waking exactly when the first item is due finds every item due
+    wait = scheduler.seconds_until_next(now=NOW + 2)
+    assert wait == 3
+    assert sorted(scheduler.pop_due(now=NOW + 2 + wait)) == sorted(items)
+
+
+def test_adaptive_intervals():
+    scheduler = AdaptiveScheduler(600, adaptive=True, min_interval=100, max_interval=1000, jitter=0)
+    scheduler.sync_items(['a'], now=NOW)
+    scheduler.pop_due(now=NOW)
+    scheduler.record_result('a', StockStatus.OUT_OF_STOCK, now=NOW)
+    assert scheduler.interval_of('a') == 600
+    scheduler.record_result('a', StockStatus.OUT_OF_STOCK, now=NOW)
+    assert scheduler.interval_of('a') == 900
+    scheduler.record_result('a', StockStatus.OUT_OF_STOCK, now=NOW)
+    assert scheduler.interval_of('a') == 1000
+    scheduler.record_result('a', StockStatus.IN_STOCK, now=NOW)
+    assert scheduler.interval_of('a') == 500
+
+
+def test_state_and_restore():
+    scheduler = AdaptiveScheduler(600)
+    scheduler.sync_items(['a', 'b'], now=NOW)
+    scheduler.pop_due(now=NOW)
+    scheduler.record_result('a', StockStatus.IN_STOCK, now=NOW)
+    scheduler.record_result('b', StockStatus.OUT_OF_STOCK, now=NOW + 300)
+    state = scheduler.state()
+
+    restored = AdaptiveScheduler(600)
+    restored.sync_items(['a', 'b', 'new'], now=NOW + 400)
+    restored.restore(state, now=NOW + 400)
+    assert restored.pop_due(now=NOW + 400) == ['new']
+    assert restored.pop_due(now=NOW + 600) == ['a']
+    assert restored.pop_due(now=NOW + 900) == ['b']
+
+
+if __name__ == "__main__":
+    test_pop_due_returns_items_in_due_order()
+    test_pop_due_skips_removed_items()
+    test_pop_due_respects_checks_per_minute()
+    test_fixed_schedule_keeps_one_cycle()
+    test_adaptive_intervals()
+    test_state_and_restore()
+    print("All scheduler tests passed")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Tests for watchlist sharding: hash-ring assignment, leases, leadership and the results outbox
+
+Run with:
+    python3 -m pytest test_sharding.py
+    python3 test_sharding.py
+"""
+
+import sys
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from check_result import CheckResult, StockStatus
+from sharding import HashRing, ShardCoordinator, NodeIdInUse
+from transitions import Transition, BACK_IN_STOCK
+
+ITEMS = [f"item{n}" for n in range(1000)]
+
+
+def owners(nodes):
+    ring = HashRing(nodes)
+    return {item: ring.owner(item) for item in ITEMS}
+
+
+def test_ring_spreads_items():
+    assert HashRing([]).owner('item') is None
+    counts = {}
+    for node in owners(['a', 'b', 'c']).values():
+        counts[node] = counts.get(node, 0) + 1
+    assert sorted(counts) == ['a', 'b', 'c']
+    assert min(counts.values()) > 200
+
+
+def test_join_only_moves_items_to_the_new_node():
+    before = owners(['a', 'b', 'c'])
+    after = owners(['a', 'b', 'c', 'd'])
+    moved = [item for item in ITEMS if before[item] != after[item]]
+    assert moved and all(after[item] == 'd' for item in moved)
+    assert 150 < len(moved) < 350
+
+
+def test_leave_only_moves_the_leaving_nodes_items():
+    before = owners(['a', 'b', 'c'])
+    after = owners(['a', 'c'])
+    for item in ITEMS:
+        if before[item] != 'b':
+            assert after[item] == before[item]
+        else:
+            assert after[item] in ('a', 'c')
+
+
+def coordinators(directory, *node_ids, lease_seconds=60):
+    path = os.path.join(directory, "shards.db")
+    return [ShardCoordinator(path, node_id, lease_seconds) for node_id in node_ids]
+
+
+def test_assignment_follows_membership():
+    with tempfile.TemporaryDirectory() as directory:
+        a, b = coordinators(directory, 'a', 'b')
+        a.heartbeat()
+        assert a.assign(ITEMS) == ITEMS
+        b.heartbeat()
+        owned_a, owned_b = a.assign(ITEMS), b.assign(ITEMS)
+        assert sorted(owned_a + owned_b) == sorted(ITEMS)
+        assert not set(owned_a) & set(owned_b)
+        assert a.members == b.members == ['a', 'b']
+        assert a.is_leader() and not b.is_leader()
+
+        b.leave()
+        assert a.assign(ITEMS) == ITEMS
+        assert a.members == ['a']
+
+
+def test_expired_lease_drops_the_node():
+    with tempfile.TemporaryDirectory() as directory:
+        a, b = coordinators(directory, 'a', 'b', lease_seconds=30)
+        now = time.time()
+        b.heartbeat(now=now - 100)
+        a.heartbeat(now=now)
+        assert a.live_members(now=now) == ['a']
+        # A node whose own lease lapsed takes it back on its next assignment
+        assert len(b.assign(ITEMS)) < len(ITEMS)
+        assert b.members == ['a', 'b']
+
+
+def test_outbox_merges_results_on_the_leader():
+    with tempfile.TemporaryDirectory() as directory:
+        a, b = coordinators(directory, 'a', 'b')
+        a.heartbeat()
+        b.heartbeat()
+        a.assign(ITEMS)
+        b.assign(ITEMS)
+
+        def result(product_id, in_stock, checked_at):
+            return CheckResult(product_id, product_id, StockStatus.IN_STOCK if in_stock else StockStatus.OUT_OF_STOCK,
+                               checked_at, {'times_in_stock': 0})
+
+        back = result('p2', True, "2026-01-01 10:05:00")
+        assert b.merge_results([result('p2', False, "2026-01-01 10:00:00")], []) is None
+        assert b.merge_results([back], [Transition(BACK_IN_STOCK, back, 9.0)]) is None
+        summary, transitions = a.merge_results([result('p1', False, "2026-01-01 10:06:00")], [])
+        assert sorted((r.product_id, r.in_stock) for r in summary) == [('p1', False), ('p2', True)]
+        assert [(t.kind, t.product_id, t.previous_price) for t in transitions] == [(BACK_IN_STOCK, 'p2', 9.0)]
+        assert a.drain_results() == ([], [])
+
+
+def test_restarted_node_keeps_its_id_and_place():
+    with tempfile.TemporaryDirectory() as directory:
+        a, b = coordinators(directory, 'a', 'b')
+        a.heartbeat(now=time.time() - 10)
+        b.heartbeat()
+        restarted, = coordinators(directory, 'a')
+        restarted.heartbeat()
+        assert restarted.live_members() == ['a', 'b']
+        restarted.assign(ITEMS)
+        assert restarted.is_leader()
+
+
+def set_lease_owner(coordinator, pid, host):
+    with sqlite3.connect(coordinator.path) as conn:
+        conn.execute("UPDATE nodes SET pid = ?, host = ? WHERE node_id = ?", (pid, host, coordinator.node_id))
+
+
+def test_join_refuses_a_node_id_in_use():
+    with tempfile.TemporaryDirectory() as directory:
+        other = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        try:
+            holder, = coordinators(directory, 'node')
+            holder.heartbeat()
+            set_lease_owner(holder, other.pid, holder.host)
+            duplicate, = coordinators(directory, 'node')
+            try:
+                duplicate.join()
+                assert False, "joined under a node ID held by a running process"
+            except NodeIdInUse as e:
+                assert str(other.pid) in str(e)
+
+            set_lease_owner(holder, 12345, 'elsewhere')
+            try:
+                duplicate.join()
+                assert False, "joined under a node ID held by another host"
+            except NodeIdInUse as e:
+                assert 'elsewhere' in str(e)
+        finally:
+            other.kill()
+            other.wait()
+
+        # The same lease left by a checker that crashed on this host is taken over
+        set_lease_owner(holder, other.pid, holder.host)
+        duplicate.join()
+        try:
+            assert duplicate.live_members() == ['node']
+        finally:
+            duplicate.leave()
+
+
+if __name__ == "__main__":
+    test_ring_spreads_items()
+    test_join_only_moves_items_to_the_new_node()
+    test_leave_only_moves_the_leaving_nodes_items()
+    test_assignment_follows_membership()
+    test_expired_lease_drops_the_node()
+    test_outbox_merges_results_on_the_leader()
+    test_restarted_node_keeps_its_id_and_place()
+    test_join_refuses_a_node_id_in_use()
+    print("All sharding tests passed")
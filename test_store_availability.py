@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for per-store availability, checked against the local stub server and its recorded fixtures
+
+Run with:
+    python3 -m pytest test_store_availability.py
+    python3 test_store_availability.py
+"""
+
+import sys
+import os
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import change_tracker
+import stock_check
+import store_availability
+from change_tracker import ChangeTracker
+from history_store import HistoryStore
+from store_availability import AvailabilityMatrix, fetch_store_availability
+from stub_cex import TEMPLATE_PRODUCT, make_server
+
+# Recorded as out of stock online, with 2 at store 25 and 1 at store 90 of the four nearest stores
+PRODUCT = TEMPLATE_PRODUCT
+STORE_NAMES = {'25': "Store twenty-five"}
+
+
+def run_against_stub(test):
+    def run():
+        server = make_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        with tempfile.TemporaryDirectory() as directory:
+            history = HistoryStore(os.path.join(directory, "history.db"))
+            swaps = [
+                (stock_check, 'CEX_API_URL', base_url),
+                (stock_check, 'PRODUCT_URL', f"{base_url}/product-detail"),
+                (store_availability, 'NEAREST_STORES_URL', f"{base_url}/v3/boxes/{{product_id}}/neareststores"),
+                (stock_check, 'get_history_store', lambda: history),
+                (change_tracker, '_tracker', ChangeTracker(history)),
+            ]
+            real = [(module, name, getattr(module, name)) for module, name, _ in swaps]
+            for module, name, value in swaps:
+                setattr(module, name, value)
+            try:
+                test(history)
+            finally:
+                for module, name, value in real:
+                    setattr(module, name, value)
+                history.close()
+                server.shutdown()
+                server.server_close()
+    run.__name__ = test.__name__
+    return run
+
+
+def check(matrix, product_id=PRODUCT):
+    return stock_check.check_stock_at_stores(product_id, matrix=matrix,
+                                             location=(store_availability.DEFAULT_LATITUDE,
+                                                       store_availability.DEFAULT_LONGITUDE))
+
+
+@run_against_stub
+def test_every_store_without_a_watch_list(history):
+    matrix = AvailabilityMatrix(store_names=STORE_NAMES)
+    in_stock, product_info, _ = check(matrix)
+    assert matrix.row(PRODUCT) == {'25': 2, '4': 0, '90': 1, '112': 0}
+    # Without watched stores only the online stock decides
+    assert not in_stock
+    assert product_info['storeAvailability'] == [
+        {'storeId': '25', 'storeName': "Store twenty-five", 'quantity': 2},
+        {'storeId': '90', 'storeName': "London WC2 Charing Cross", 'quantity': 1},
+    ]
+    assert history.get(PRODUCT, '25')['times_in_stock'] == 1
+    assert history.get(PRODUCT, '4')['times_in_stock'] == 0
+
+
+@run_against_stub
+def test_watched_stores_filter_the_row(history):
+    matrix = AvailabilityMatrix(store_ids=[25, '4', '999'])
+    in_stock, product_info, _ = check(matrix)
+    # Unwatched stores are dropped; watched ones the lookup does not report are 0
+    assert matrix.row(PRODUCT) == {'25': 2, '4': 0, '999': 0}
+    assert in_stock
+    assert [store['storeId'] for store in product_info['storeAvailability']] == ['25']
+    assert history.get(PRODUCT, '90') is None
+
+
+@run_against_stub
+def test_unwatched_stock_does_not_count(history):
+    matrix = AvailabilityMatrix(store_ids=['4', '112'])
+    in_stock, product_info, _ = check(matrix)
+    assert matrix.row(PRODUCT) == {'4': 0, '112': 0}
+    assert not in_stock and product_info['storeAvailability'] == []
+
+
+@run_against_stub
+def test_unknown_product(history):
+    assert fetch_store_availability('NOSUCHBOX') == {}
+    matrix = AvailabilityMatrix()
+    assert check(matrix, 'NOSUCHBOX')[2] is None
+    assert matrix.to_dict() == {'stores': {}, 'items': {}}
+
+
+if __name__ == "__main__":
+    test_every_store_without_a_watch_list()
+    test_watched_stores_filter_the_row()
+    test_unwatched_stock_does_not_count()
+    test_unknown_product()
+    print("All store availability tests passed")
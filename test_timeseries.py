@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar time series: appends, range queries, downsampling and crash repair
+
+Run with:
+    python3 -m pytest test_timeseries.py
+    python3 test_timeseries.py
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from check_result import CheckResult, StockStatus
+from store_availability import AvailabilityMatrix
+from timeseries import TimeSeriesStore, ONLINE
+
+START = time.mktime(time.strptime("2026-01-01 00:00:00", '%Y-%m-%d %H:%M:%S'))
+
+
+def result(checked_at, in_stock=True, price=10.0, quantity=2, product_id='p', store_id=None):
+    return CheckResult(product_id, "Game", StockStatus.IN_STOCK if in_stock else StockStatus.OUT_OF_STOCK,
+                       time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(checked_at)), {'times_in_stock': 1},
+                       sell_price=price, cash_price=None, exchange_price=5.0, store_id=store_id,
+                       quantity=quantity)
+
+
+def hourly_store(directory, hours):
+    store = TimeSeriesStore(directory)
+    for hour in range(hours):
+        store.append_results([result(START + hour * 3600, in_stock=hour % 2 == 0, price=10.0 + hour)])
+    return store
+
+
+def test_range_query():
+    with tempfile.TemporaryDirectory() as directory:
+        store = hourly_store(directory, 10)
+        everything = store.query('p')
+        assert everything['rows'] == 10 and not everything['downsampled']
+        assert everything['columns']['timestamp'][0] == START
+        assert everything['columns']['cash_price'][0] is None
+
+        window = store.query('p', start=START + 2 * 3600, end=START + 5 * 3600)
+        assert window['rows'] == 4
+        assert window['columns']['sell_price'] == [12.0, 13.0, 14.0, 15.0]
+        assert window['columns']['in_stock'] == [True, False, True, False]
+        assert store.query('p', start=START + 100 * 3600)['rows'] == 0
+        assert store.query('missing')['rows'] == 0
+
+
+def test_downsampling():
+    with tempfile.TemporaryDirectory() as directory:
+        store = hourly_store(directory, 100)
+        result = store.query('p', points=10)
+        assert result['rows'] == 100 and result['downsampled']
+        columns = result['columns']
+        assert sum(columns['checks']) == 100
+        assert len(columns['timestamp']) <= 10
+        assert columns['sell_price_min'][0] == 10.0
+        assert columns['sell_price_max'][-1] == 109.0
+        assert all(0 <= share <= 1 for share in columns['in_stock'])
+        assert columns['exchange_price'] == [5.0] * len(columns['timestamp'])
+
+
+def test_rows_use_the_check_time_and_stay_ordered():
+    with tempfile.TemporaryDirectory() as directory:
+        store = TimeSeriesStore(directory)
+        assert store.append_results([result(START + 60)], timestamp=START + 999) == 1
+        assert store.append_results([result(START)]) == 0  # Older than the series' last row
+        assert store.append_results([result(START + 120)]) == 1
+        assert store.query('p')['columns']['timestamp'] == [START + 60, START + 120]
+        # Products the API does not know have no stock history and no series
+        assert store.append_results([CheckResult('q', "Unknown", StockStatus.OUT_OF_STOCK, None)]) == 0
+
+
+def test_store_availability_rows():
+    with tempfile.TemporaryDirectory() as directory:
+        store = TimeSeriesStore(directory)
+        matrix = AvailabilityMatrix()
+        matrix.set_row('p', {'10': {'quantity': 3}, '11': {'quantity': 0}})
+        assert store.append_results([result(START, quantity=7)], matrix) == 3
+        assert store.stores('p') == ['10', '11', ONLINE]
+        assert store.query('p', '10')['columns']['quantity'] == [3]
+        assert store.query('p', '11')['columns']['in_stock'] == [False]
+        assert store.query('p')['columns']['quantity'] == [7]
+
+
+def test_partial_append_is_repaired():
+    with tempfile.TemporaryDirectory() as directory:
+        store = hourly_store(directory, 3)
+        # A crash after writing only the first column leaves it one row ahead
+        with open(os.path.join(directory, 'p', ONLINE, 'timestamp.d'), 'ab') as f:
+            f.write(b'\0' * 8)
+        assert store.query('p')['rows'] == 3
+        reopened = TimeSeriesStore(directory)
+        reopened.append_results([result(START + 10 * 3600)])
+        assert reopened.query('p')['columns']['timestamp'][-1] == START + 10 * 3600
+        assert reopened.query('p')['rows'] == 4
+
+
+if __name__ == "__main__":
+    test_range_query()
+    test_downsampling()
+    test_rows_use_the_check_time_and_stay_ordered()
+    test_store_availability_rows()
+    test_partial_append_is_repaired()
+    print("All time series tests passed")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-cycle transition diff and the baseline it is diffed against
+
+Run with:
+    python3 -m pytest test_transitions.py
+    python3 test_transitions.py
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from check_result import CheckResult, StockStatus
+from history_store import HistoryStore
+from transitions import diff_cycle, cycle_baseline, collapse_by_product, BACK_IN_STOCK, SOLD_OUT, PRICE_CHANGED
+
+HISTORY = {'times_in_stock': 0}
+
+
+def result(product_id, in_stock, price=10.0, store_id=None, stock_history=HISTORY):
+    return CheckResult(product_id, product_id, StockStatus.IN_STOCK if in_stock else StockStatus.OUT_OF_STOCK,
+                       "2026-01-01 12:00:00", stock_history, sell_price=price, store_id=store_id)
+
+
+def kinds(transitions):
+    return sorted((transition.product_id, transition.kind) for transition in transitions)
+
+
+def test_diff_cycle_transitions():
+    previous = {
+        'back': {'in_stock': False, 'price': 10.0},
+        'sold': {'in_stock': True, 'price': 10.0},
+        'cheaper': {'in_stock': False, 'price': 12.0},
+        'same': {'in_stock': True, 'price': 10.0},
+    }
+    summary = [result('back', True), result('sold', False), result('cheaper', False),
+               result('same', True), result('new_in', True), result('new_out', False)]
+    transitions = diff_cycle(previous, summary)
+    assert kinds(transitions) == [('back', BACK_IN_STOCK), ('cheaper', PRICE_CHANGED),
+                                  ('new_in', BACK_IN_STOCK), ('sold', SOLD_OUT)]
+    cheaper = [transition for transition in transitions if transition.product_id == 'cheaper'][0]
+    assert (cheaper.previous_price, cheaper.price) == (12.0, 10.0)
+
+
+def test_unknown_products_and_missing_prices():
+    previous = {'gone': {'in_stock': True, 'price': 10.0}, 'noprice': {'in_stock': False, 'price': None}}
+    summary = [result('gone', False, stock_history=None), result('noprice', False, price=15.0)]
+    assert diff_cycle(previous, summary) == []
+
+
+def test_any_store_in_stock_counts():
+    summary = [result('p', False, store_id='1'), result('p', True, store_id='2'), result('p', False, store_id='3')]
+    assert collapse_by_product(summary)['p'].store_id == '2'
+    assert kinds(diff_cycle({'p': {'in_stock': False}}, summary)) == [('p', BACK_IN_STOCK)]
+    assert diff_cycle({'p': {'in_stock': True, 'price': 10.0}}, summary) == []
+
+
+def test_baseline_prefers_what_the_checker_recorded():
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryStore(os.path.join(directory, "history.db"))
+        summary = [result('a', True), result('b', True)]
+        # The dashboard refreshed the snapshot to in stock before the checker notified
+        snapshot = {'a': {'in_stock': True, 'price': 10.0}, 'b': {'in_stock': True, 'price': 10.0}}
+        history.record_notified({'a': result('a', False)})
+        baseline = cycle_baseline(history, snapshot, summary)
+        assert baseline['a'] == {'in_stock': False, 'price': 10.0}
+        assert baseline['b'] == snapshot['b']
+        assert kinds(diff_cycle(baseline, summary)) == [('a', BACK_IN_STOCK)]
+
+        history.record_notified(collapse_by_product(summary))
+        assert diff_cycle(cycle_baseline(history, {}, summary), summary) == []
+        history.close()
+
+
+if __name__ == "__main__":
+    test_diff_cycle_transitions()
+    test_unknown_products_and_missing_prices()
+    test_any_store_in_stock_counts()
+    test_baseline_prefers_what_the_checker_recorded()
+    print("All transition tests passed")
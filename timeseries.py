@@ -0,0 +1,254 @@
+"""
+Append-only columnar price and availability time series, one directory per product and store
+
+Each series is a directory of column files holding packed arrays of one
+type (see COLUMNS), one value per check, in timestamp order. Appends write
+a few bytes to the end of every column; reads memory-map the columns and
+binary-search the timestamp column, so a range query only touches the rows
+it returns, however many years of checks are stored.
+"""
+
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+import metrics
+
+TIMESERIES_DIR = os.getenv('TIMESERIES_DIR', "timeseries")
+ONLINE = "online"  # Series name for checks that were not for a specific store
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+# Column name -> array typecode; missing prices are stored as NaN, missing quantities as -1
+COLUMNS = (
+    ('timestamp', 'd'),
+    ('in_stock', 'b'),
+    ('quantity', 'i'),
+    ('sell_price', 'd'),
+    ('cash_price', 'd'),
+    ('exchange_price', 'd'),
+)
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def _name(value):
+    return _UNSAFE.sub('_', str(value))
+
+
+def _price(value):
+    try:
+        return float(value) if value is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _epoch(checked_at, default):
+    """A CheckResult's 'YYYY-mm-dd HH:MM:SS' local check time as epoch seconds"""
+    try:
+        return time.mktime(time.strptime(checked_at, '%Y-%m-%d %H:%M:%S'))
+    except (TypeError, ValueError):
+        return default
+
+
+def _json_value(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+class _MappedColumns:
+    """Read-only memory maps of one series' columns, as typed memoryviews"""
+
+    def __init__(self, directory):
+        self._maps = []
+        self.views = {}
+        self.rows = None
+        files = []
+        for name, typecode in COLUMNS:
+            path = os.path.join(directory, f"{name}.{typecode}")
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                self.rows = 0
+                break
+            files.append((name, typecode, f))
+        try:
+            if self.rows is None:
+                # A crash mid-append can leave some columns one row ahead; read the complete rows only
+                self.rows = min(os.fstat(f.fileno()).st_size // array(typecode).itemsize
+                                for name, typecode, f in files)
+            if self.rows:
+                for name, typecode, f in files:
+                    mapped = mmap.mmap(f.fileno(), self.rows * array(typecode).itemsize, access=mmap.ACCESS_READ)
+                    self._maps.append(mapped)
+                    self.views[name] = memoryview(mapped).cast(typecode)
+        finally:
+            for _, _, f in files:
+                f.close()
+
+    def close(self):
+        for view in self.views.values():
+            view.release()
+        self.views = {}
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TimeSeriesStore:
+    """Per-(product, store) column files under one directory"""
+
+    def __init__(self, directory=TIMESERIES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._repaired = set()
+
+    def _series_dir(self, product_id, store_id=None):
+        return os.path.join(self.directory, _name(product_id), _name(store_id) if store_id else ONLINE)
+
+    def _repair(self, series_dir):
+        """Cut every column back to the number of complete rows (once per series per process)"""
+        if series_dir in self._repaired:
+            return
+        sizes = {}
+        for name, typecode in COLUMNS:
+            path = os.path.join(series_dir, f"{name}.{typecode}")
+            sizes[path] = (os.path.getsize(path) if os.path.exists(path) else 0, array(typecode).itemsize)
+        rows = min(size // itemsize for size, itemsize in sizes.values())
+        for path, (size, itemsize) in sizes.items():
+            if size != rows * itemsize:
+                with open(path, 'ab') as f:
+                    f.truncate(rows * itemsize)
+        self._repaired.add(series_dir)
+
+    def _last_timestamp(self, series_dir):
+        path = os.path.join(series_dir, "timestamp.d")
+        try:
+            with open(path, 'rb') as f:
+                f.seek(-array('d').itemsize, os.SEEK_END)
+                return array('d', f.read()).pop()
+        except (FileNotFoundError, OSError):
+            return None  # No rows yet
+
+    def append_results(self, results, matrix=None, timestamp=None):
+        """Append one row per CheckResult (results for unknown products are skipped).
+
+        Rows are stamped with each result's checked_at (timestamp, or now,
+        when it has none). With the cycle's store availability matrix, each
+        product also gets a row per store with that store's quantity.
+        Rows older than the last one already in their series are dropped,
+        since queries rely on the timestamps being in order.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = {}
+        for result in results:
+            if result.stock_history is None or not result.product_id:
+                continue
+            checked_at = _epoch(result.checked_at, timestamp)
+            prices = (_price(result.sell_price), _price(result.cash_price), _price(result.exchange_price))
+            quantity = result.quantity if isinstance(result.quantity, int) else -1
+            rows.setdefault(self._series_dir(result.product_id, result.store_id), []).append(
+                (checked_at, 1 if result.in_stock else 0, quantity) + prices)
+            if matrix is not None and result.store_id is None:
+                for store_id, quantity in matrix.row(result.product_id).items():
+                    quantity = quantity if isinstance(quantity, int) else -1
+                    rows.setdefault(self._series_dir(result.product_id, store_id), []).append(
+                        (checked_at, 1 if quantity > 0 else 0, quantity) + prices)
+        if not rows:
+            return 0
+        appended = 0
+        with self._lock, metrics.HISTORY_IO_SECONDS.time(operation='series_append'):
+            for series_dir, series_rows in rows.items():
+                os.makedirs(series_dir, exist_ok=True)
+                self._repair(series_dir)
+                series_rows.sort(key=lambda row: row[0])
+                last = self._last_timestamp(series_dir)
+                if last is not None and series_rows[0][0] < last:
+                    series_rows = [row for row in series_rows if row[0] >= last]
+                    if not series_rows:
+                        continue
+                appended += len(series_rows)
+                for index, (name, typecode) in enumerate(COLUMNS):
+                    with open(os.path.join(series_dir, f"{name}.{typecode}"), 'ab') as f:
+                        f.write(array(typecode, [row[index] for row in series_rows]).tobytes())
+        return appended
+
+    def stores(self, product_id):
+        """Series names recorded for a product: ONLINE and/or store IDs"""
+        try:
+            return sorted(os.listdir(os.path.join(self.directory, _name(product_id))))
+        except FileNotFoundError:
+            return []
+
+    def query(self, product_id, store_id=None, start=None, end=None, points=DEFAULT_POINTS):
+        """Return the rows between start and end (epoch seconds, inclusive) as columns.
+
+        With more rows than points, the range is cut into points equal time
+        buckets and each bucket is reduced server-side: the mean, min and
+        max sell price, the mean cash and exchange prices, the share of
+        checks that found it in stock, and the highest quantity.
+        """
+        points = max(1, min(int(points), MAX_POINTS))
+        with metrics.HISTORY_IO_SECONDS.time(operation='series_read'), \
+                _MappedColumns(self._series_dir(product_id, store_id)) as columns:
+            if not columns.rows:
+                return {'rows': 0, 'downsampled': False, 'columns': {name: [] for name, _ in COLUMNS}}
+            timestamps = columns.views['timestamp']
+            low = 0 if start is None else bisect_left(timestamps, start)
+            high = columns.rows if end is None else bisect_right(timestamps, end)
+            count = max(0, high - low)
+            if count <= points:
+                result = {name: [_json_value(value) for value in view[low:high].tolist()]
+                          for name, view in columns.views.items()}
+                result['in_stock'] = [bool(value) for value in result['in_stock']]
+                return {'rows': count, 'downsampled': False, 'columns': result}
+            return {'rows': count, 'downsampled': True,
+                    'columns': self._downsample(columns.views, timestamps, low, high, points)}
+
+    def _downsample(self, views, timestamps, low, high, points):
+        first = timestamps[low]
+        width = (timestamps[high - 1] - first) / points or 1.0
+        buckets = {name: [] for name in ('timestamp', 'in_stock', 'quantity', 'sell_price', 'sell_price_min',
+                                         'sell_price_max', 'cash_price', 'exchange_price', 'checks')}
+        start = low
+        for bucket in range(points):
+            # The last bucket takes everything up to high, so rounding never drops rows
+            stop = high if bucket == points - 1 else bisect_left(timestamps, first + width * (bucket + 1), start, high)
+            if stop <= start:
+                continue
+            checks = stop - start
+            sell = [value for value in views['sell_price'][start:stop].tolist() if value == value]
+            buckets['timestamp'].append(timestamps[stop - 1])
+            buckets['checks'].append(checks)
+            buckets['in_stock'].append(round(sum(views['in_stock'][start:stop]) / checks, 4))
+            buckets['quantity'].append(max(views['quantity'][start:stop]))
+            buckets['sell_price'].append(round(sum(sell) / len(sell), 2) if sell else None)
+            buckets['sell_price_min'].append(min(sell) if sell else None)
+            buckets['sell_price_max'].append(max(sell) if sell else None)
+            for name in ('cash_price', 'exchange_price'):
+                values = [value for value in views[name][start:stop].tolist() if value == value]
+                buckets[name].append(round(sum(values) / len(values), 2) if values else None)
+            start = stop
+        return buckets
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_timeseries_store():
+    """Return the process-wide time series store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TimeSeriesStore()
+        return _store
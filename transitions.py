@@ -0,0 +1,76 @@
+"""
+Per-cycle diff of stock status and price against the previous status snapshot
+"""
+
+BACK_IN_STOCK = "back_in_stock"    # out -> in
+SOLD_OUT = "sold_out"              # in -> out
+PRICE_CHANGED = "price_changed"    # Sell price moved while the status stayed the same
+
+
+class Transition:
+    """One change to report for a product"""
+
+    __slots__ = ('kind', 'result', 'previous_price')
+
+    def __init__(self, kind, result, previous_price=None):
+        self.kind = kind
+        self.result = result  # The CheckResult of this cycle
+        self.previous_price = previous_price
+
+    @property
+    def product_id(self):
+        return self.result.product_id
+
+    @property
+    def price(self):
+        return self.result.sell_price
+
+    def __repr__(self):
+        return f"Transition({self.kind!r}, {self.product_id!r})"
+
+
+def cycle_baseline(history, snapshot_products, check_summary):
+    """The previous status of this cycle's products: what the checker last recorded in the
+    history store, falling back to the snapshot for products checked before it recorded any"""
+    product_ids = {result.product_id for result in check_summary}
+    baseline = {product_id: snapshot_products[product_id]
+                for product_id in product_ids if product_id in snapshot_products}
+    baseline.update(history.notified_status(product_ids))
+    return baseline
+
+
+def collapse_by_product(check_summary):
+    """One result per product; with store_ids a product is in stock if any store has it"""
+    results = {}
+    for result in check_summary:
+        previous = results.get(result.product_id)
+        if previous is None or (result.in_stock and not previous.in_stock):
+            results[result.product_id] = result
+    return results
+
+
+def diff_cycle(previous_products, check_summary):
+    """Return the transitions between the previous status of each product and this cycle's results.
+
+    previous_products maps product IDs to {'in_stock', 'price'} (the
+    checker's baseline, see cycle_baseline()). A product with no previous
+    status counts as previously out of stock, so it is reported when first
+    found in stock. Products the API does not know (no stock history)
+    never produce transitions.
+    """
+    transitions = []
+    for product_id, result in collapse_by_product(check_summary).items():
+        if result.stock_history is None:
+            continue
+        previous = previous_products.get(product_id) or {}
+        was_in_stock = bool(previous.get('in_stock'))
+        price = result.sell_price
+        previous_price = previous.get('price')
+
+        if result.in_stock and not was_in_stock:
+            transitions.append(Transition(BACK_IN_STOCK, result, previous_price))
+        elif was_in_stock and not result.in_stock:
+            transitions.append(Transition(SOLD_OUT, result, previous_price))
+        elif previous_price is not None and price is not None and price != previous_price:
+            transitions.append(Transition(PRICE_CHANGED, result, previous_price))
+    return transitions